@@ -0,0 +1,121 @@
+"""
+Escritura y copia de los ficheros de los documentos sin cargarlos en memoria.
+
+En el almacenamiento local (FileSystemStorage) la copia es un enlace duro si origen y
+destino están en el mismo sistema de ficheros; si no, se copia en el núcleo con
+copy_file_range (que en btrfs o XFS puede compartir los bloques, reflink) o, como
+último recurso, por bloques de TAMANO_BLOQUE. Con otros almacenamientos se pasa el
+fichero abierto a la API de storage, que lo lee por fragmentos. En todos los casos
+la memoria usada no depende del tamaño del fichero.
+
+volcar_con_hash escribe un fichero subido calculando a la vez su SHA-256, que usa el
+almacén de contenidos (Blob) para no guardar dos veces el mismo fichero.
+"""
+import hashlib
+import os
+import shutil
+
+TAMANO_BLOQUE = 1024 * 1024
+
+
+def ruta_local(storage, nombre):
+    """Ruta en disco de nombre si el almacenamiento es local, o None"""
+    try:
+        return storage.path(nombre)
+    except NotImplementedError:
+        return None
+
+
+def crear_directorios(storage, directorio):
+    """
+    Crea directorio y los intermedios que falten con los permisos del almacenamiento
+    (FILE_UPLOAD_DIRECTORY_PERMISSIONS), como hace FileSystemStorage al guardar.
+    os.makedirs no aplica su mode a los directorios intermedios y además le resta la
+    umask, por eso se ajustan uno a uno.
+    """
+    modo = storage.directory_permissions_mode
+    if modo is None:
+        os.makedirs(directorio, exist_ok=True)
+        return
+    padre = os.path.dirname(directorio)
+    if padre != directorio and not os.path.isdir(padre):
+        crear_directorios(storage, padre)
+    try:
+        os.mkdir(directorio)
+    except FileExistsError:
+        return
+    os.chmod(directorio, modo)
+
+
+def volcar_con_hash(fichero, destino=None):
+    """
+    Lee fichero (File o UploadedFile) por bloques y, si se indica, lo escribe en
+    destino (fichero abierto). Devuelve su SHA-256 (hexadecimal) y su tamaño.
+    """
+    resumen = hashlib.sha256()
+    tamano = 0
+    for bloque in fichero.chunks(TAMANO_BLOQUE):
+        resumen.update(bloque)
+        if destino is not None:
+            destino.write(bloque)
+        tamano += len(bloque)
+    return resumen.hexdigest(), tamano
+
+
+def copiar_en_disco(origen, destino):
+    """
+    Crea destino con el contenido de origen (rutas locales). Lanza FileExistsError si
+    destino ya existe. Devuelve True si se ha enlazado en lugar de copiar.
+    """
+    try:
+        os.link(origen, destino)
+        return True
+    except FileExistsError:
+        raise
+    except OSError:
+        # Otro sistema de ficheros o sin soporte de enlaces duros
+        pass
+
+    with open(origen, 'rb') as entrada, open(destino, 'xb') as salida:
+        if hasattr(os, 'copy_file_range'):
+            try:
+                while os.copy_file_range(entrada.fileno(), salida.fileno(), TAMANO_BLOQUE * 64):
+                    pass
+                return False
+            except OSError:
+                # Núcleo o sistema de ficheros sin soporte: empezar de nuevo por bloques
+                entrada.seek(0)
+                salida.seek(0)
+                salida.truncate()
+        shutil.copyfileobj(entrada, salida, TAMANO_BLOQUE)
+    return False
+
+
+def copiar_archivo(origen, destino, nombre):
+    """
+    Copia el fichero de origen (FieldFile) en destino (FieldFile del documento nuevo)
+    con el nombre indicado, que pasa por el upload_to del campo. No guarda la instancia
+    de destino.
+    """
+    storage = destino.storage
+    ruta_origen = ruta_local(origen.storage, origen.name)
+    if ruta_origen is None or ruta_local(storage, '') is None:
+        with origen.open('rb'):
+            destino.save(nombre, origen, save=False)
+        return
+
+    nombre = destino.field.generate_filename(destino.instance, nombre)
+    while True:
+        nombre_libre = storage.get_available_name(nombre, max_length=destino.field.max_length)
+        ruta_destino = storage.path(nombre_libre)
+        crear_directorios(storage, os.path.dirname(ruta_destino))
+        try:
+            enlazado = copiar_en_disco(ruta_origen, ruta_destino)
+            break
+        except FileExistsError:
+            # Otro proceso ha ocupado el nombre entre tanto: buscar otro
+            continue
+
+    if not enlazado and storage.file_permissions_mode is not None:
+        os.chmod(ruta_destino, storage.file_permissions_mode)
+    destino.name = nombre_libre
@@ -0,0 +1,58 @@
+"""
+Recalculo de los contadores desnormalizados de Trabajo (pasos_total,
+pasos_completados y tiempo_estimado_total) a partir de sus pasos.
+
+Se usa para rellenarlos en datos existentes y para verificar que los incrementos
+atómicos no se han desviado; calcula todo con consultas agregadas y escribe por lotes.
+"""
+from collections import defaultdict, namedtuple
+
+from django.db import transaction
+from django.db.models import Count, Q
+
+from .models import Paso, PasoTrabajo, Trabajo, dias_estimados
+
+# Tamaño de lote por defecto para las escrituras masivas
+TAMANO_LOTE = 500
+
+DiferenciaContador = namedtuple('DiferenciaContador', ['id', 'campo', 'guardado', 'calculado'])
+
+
+def recalcular_contadores(corregir=True, tamano_lote=TAMANO_LOTE):
+    """
+    Compara los contadores guardados de cada trabajo con los calculados a partir de
+    sus pasos. Con corregir escribe los valores calculados con bulk_update, dentro de
+    una transacción. Devuelve la lista de DiferenciaContador encontradas.
+    """
+    with transaction.atomic():
+        pasos = {
+            fila['trabajo']: (fila['total'], fila['completados'])
+            for fila in PasoTrabajo.objects.order_by().values('trabajo').annotate(
+                total=Count('id'), completados=Count('id', filter=Q(estado='COMPLETADO'))
+            )
+        }
+        
+        tiempos = defaultdict(float)
+        for procedimiento_id, tiempo in Paso.objects.order_by('numero').values_list('procedimiento_id', 'tiempo_estimado'):
+            tiempos[procedimiento_id] += dias_estimados(tiempo)
+        
+        diferencias = []
+        corregidos = []
+        trabajos = Trabajo.objects.values_list(
+            'id', 'procedimiento_id', 'pasos_total', 'pasos_completados', 'tiempo_estimado_total'
+        )
+        for trabajo_id, procedimiento_id, *guardados in trabajos:
+            calculados = (*pasos.get(trabajo_id, (0, 0)), tiempos.get(procedimiento_id, 0))
+            cambios = [
+                DiferenciaContador(trabajo_id, campo, guardado, calculado)
+                for campo, guardado, calculado in zip(Trabajo.CAMPOS_CONTADORES, guardados, calculados)
+                if abs(guardado - calculado) > 1e-9
+            ]
+            if cambios:
+                diferencias.extend(cambios)
+                corregidos.append(Trabajo(id=trabajo_id, **dict(zip(Trabajo.CAMPOS_CONTADORES, calculados))))
+        
+        if corregir and corregidos:
+            Trabajo.objects.bulk_update(corregidos, Trabajo.CAMPOS_CONTADORES, batch_size=tamano_lote)
+    
+    return diferencias
@@ -0,0 +1,214 @@
+"""
+Envío de los ficheros en las descargas de documentos (download_document).
+
+La vista comprueba los permisos y las cabeceras condicionales (If-None-Match,
+If-Modified-Since...) y deja el envío al servidor elegido con el ajuste
+DESCARGAS_SERVIDOR (ruta a una clase con el método servir):
+
+- ServidorXAccel: cabecera X-Accel-Redirect para que nginx envíe el fichero desde una
+  location internal que apunta a MEDIA_ROOT (DESCARGAS_X_ACCEL_PREFIJO). nginx atiende
+  también las peticiones Range.
+- ServidorXSendfile: cabecera X-Sendfile con la ruta absoluta (Apache con
+  mod_xsendfile, lighttpd).
+- ServidorDjango (por defecto): Django responde con el fichero abierto, completo (200)
+  o el rango pedido (206). El servidor WSGI lo recibe por wsgi.file_wrapper y, en
+  gunicorn o uWSGI, lo envía con os.sendfile sin pasar los datos por Python; con otros
+  servidores se lee por bloques de TAMANO_BLOQUE.
+
+Con los dos primeros el worker de Django queda libre en cuanto responde, sea cual sea
+el tamaño del fichero.
+
+Los enlaces (<a href>, window.open, vista previa) no envían la cabecera Authorization.
+Para ellos url_descarga da una URL firmada (parámetro firma) para un fichero y un
+usuario, válida DESCARGAS_FIRMA_CADUCIDAD segundos, que el frontend pide a
+firmar_descarga justo antes de abrirla. La firma no sirve para nada más que esa
+descarga, a diferencia del token de la API.
+"""
+import re
+import threading
+from collections import namedtuple
+from urllib.parse import quote, urlencode
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core import signing
+from django.http import FileResponse, HttpResponse
+from django.urls import reverse
+from django.utils.http import content_disposition_header, http_date
+from django.utils.module_loading import import_string
+from rest_framework.authentication import BaseAuthentication
+from rest_framework.exceptions import AuthenticationFailed
+
+from .archivos import TAMANO_BLOQUE
+
+SERVIDOR_POR_DEFECTO = 'procedimientos.descargas.ServidorDjango'
+
+# ruta: absoluta en disco; nombre: relativo a MEDIA_ROOT; nombre_descarga: el que ve
+# el usuario al guardarlo
+FicheroDescarga = namedtuple(
+    'FicheroDescarga', ['ruta', 'nombre', 'tamano', 'modificado', 'content_type', 'nombre_descarga']
+)
+
+_RANGO = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class RangoNoSatisfacible(Exception):
+    """El rango pedido empieza después del final del fichero (respuesta 416)"""
+
+
+def etag_fichero(tamano, modificado):
+    """ETag a partir del tamaño y la fecha de modificación, con el formato de nginx"""
+    return f'"{int(modificado):x}-{tamano:x}"'
+
+
+def rango_pedido(request, fichero, etag):
+    """
+    (inicio, fin), ambos incluidos, del rango de bytes de la cabecera Range, o None si
+    se envía el fichero completo: sin Range, con varios rangos o mal formado, o con un
+    If-Range que ya no corresponde al fichero. Lanza RangoNoSatisfacible si el rango
+    empieza después del final.
+    """
+    cabecera = request.headers.get('Range')
+    if not cabecera:
+        return None
+    if_range = request.headers.get('If-Range')
+    if if_range and if_range not in (etag, http_date(fichero.modificado)):
+        return None
+
+    coincidencia = _RANGO.match(cabecera.strip())
+    if not coincidencia:
+        return None
+    inicio, fin = coincidencia.groups()
+    if not inicio:
+        # Sufijo: los últimos N bytes
+        if not fin:
+            return None
+        if int(fin) == 0 or fichero.tamano == 0:
+            raise RangoNoSatisfacible
+        return max(0, fichero.tamano - int(fin)), fichero.tamano - 1
+
+    inicio = int(inicio)
+    if fin and int(fin) < inicio:
+        return None
+    if inicio >= fichero.tamano:
+        raise RangoNoSatisfacible
+    fin = min(int(fin), fichero.tamano - 1) if fin else fichero.tamano - 1
+    return inicio, fin
+
+
+class TramoFichero:
+    """Fichero abierto que solo deja leer longitud bytes a partir de inicio"""
+
+    def __init__(self, fichero, inicio, longitud):
+        fichero.seek(inicio)
+        self.fichero = fichero
+        self.restante = longitud
+
+    def read(self, tamano=-1):
+        if tamano < 0 or tamano > self.restante:
+            tamano = self.restante
+        datos = self.fichero.read(tamano)
+        self.restante -= len(datos)
+        return datos
+
+    def fileno(self):
+        # wsgi.file_wrapper envía con sendfile desde la posición actual y hasta el
+        # Content-Length de la respuesta
+        return self.fichero.fileno()
+
+    def close(self):
+        self.fichero.close()
+
+
+def cabecera_adjunto(response, fichero):
+    response['Content-Disposition'] = content_disposition_header(True, fichero.nombre_descarga)
+
+
+class ServidorDjango:
+    def servir(self, request, fichero, etag):
+        try:
+            rango = rango_pedido(request, fichero, etag)
+        except RangoNoSatisfacible:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{fichero.tamano}'
+            return response
+
+        abierto = open(fichero.ruta, 'rb')
+        if rango is None:
+            response = FileResponse(abierto, content_type=fichero.content_type)
+        else:
+            inicio, fin = rango
+            longitud = fin - inicio + 1
+            response = FileResponse(
+                TramoFichero(abierto, inicio, longitud), status=206, content_type=fichero.content_type
+            )
+            response['Content-Length'] = longitud
+            response['Content-Range'] = f'bytes {inicio}-{fin}/{fichero.tamano}'
+        response.block_size = TAMANO_BLOQUE
+        response['Accept-Ranges'] = 'bytes'
+        cabecera_adjunto(response, fichero)
+        return response
+
+
+class ServidorXAccel:
+    def servir(self, request, fichero, etag):
+        response = HttpResponse(content_type=fichero.content_type)
+        prefijo = getattr(settings, 'DESCARGAS_X_ACCEL_PREFIJO', '/media-protegido/')
+        response['X-Accel-Redirect'] = quote(prefijo.rstrip('/') + '/' + fichero.nombre)
+        cabecera_adjunto(response, fichero)
+        return response
+
+
+class ServidorXSendfile:
+    def servir(self, request, fichero, etag):
+        response = HttpResponse(content_type=fichero.content_type)
+        response['X-Sendfile'] = fichero.ruta
+        cabecera_adjunto(response, fichero)
+        return response
+
+
+_servidores = {}
+_lock_servidores = threading.Lock()
+
+
+def obtener_servidor():
+    """Instancia (única por proceso) del servidor configurado en DESCARGAS_SERVIDOR"""
+    ruta = getattr(settings, 'DESCARGAS_SERVIDOR', SERVIDOR_POR_DEFECTO)
+    with _lock_servidores:
+        if ruta not in _servidores:
+            _servidores[ruta] = import_string(ruta)()
+        return _servidores[ruta]
+
+
+def _firmante(nombre):
+    # La firma depende del fichero: no sirve para descargar otro
+    return signing.TimestampSigner(salt=f'procedimientos.descargas:{nombre}')
+
+
+def url_descarga(request, nombre, **parametros):
+    """
+    URL de download_document para el fichero nombre (relativo a MEDIA_ROOT), firmada
+    para request.user y absoluta. Los parámetros se añaden sin firmar.
+    """
+    parametros['firma'] = _firmante(nombre).sign(str(request.user.pk))
+    url = reverse('download_document', args=[nombre]) + '?' + urlencode(parametros)
+    return request.build_absolute_uri(url)
+
+
+class FirmaDescargaAuthentication(BaseAuthentication):
+    """Autentica las peticiones a download_document con la firma de url_descarga"""
+
+    def authenticate(self, request):
+        firma = request.query_params.get('firma')
+        if not firma:
+            return None
+        nombre = request.parser_context['kwargs']['path']
+        caducidad = getattr(settings, 'DESCARGAS_FIRMA_CADUCIDAD', 300)
+        try:
+            usuario_id = _firmante(nombre).unsign(firma, max_age=caducidad)
+        except signing.BadSignature:
+            raise AuthenticationFailed('El enlace de descarga no es válido o ha caducado')
+        usuario = get_user_model().objects.filter(pk=usuario_id, is_active=True).first()
+        if usuario is None:
+            raise AuthenticationFailed('El enlace de descarga no es válido o ha caducado')
+        return usuario, None
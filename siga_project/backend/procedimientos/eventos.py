@@ -0,0 +1,198 @@
+"""
+Difusión en tiempo real de los cambios en las alertas de plazos.
+
+AlertaPlazo.objects.refrescar publica un evento por cada alerta que aparece, cambia
+o desaparece, en los canales de su unidad y en el canal global. La vista
+alertas_plazos_stream los entrega por Server-Sent Events a los clientes suscritos.
+
+El broker se elige con el ajuste ALERTAS_BROKER (ruta a una clase con la interfaz de
+BrokerEnMemoria). Las alertas se recalculan en los workers que atienden las peticiones
+y en el comando periódico refrescar_alertas_plazos, que es el que detecta los plazos
+que vencen; como son procesos distintos del que sirve el stream, hace falta un broker
+compartido: BrokerBaseDatos (por defecto) o uno equivalente, por ejemplo sobre Redis.
+BrokerEnMemoria solo sirve si todo ocurre en un mismo proceso (pruebas).
+"""
+import asyncio
+import logging
+import threading
+import time
+from collections import deque, namedtuple
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import Max, Min
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+BROKER_POR_DEFECTO = 'procedimientos.eventos.BrokerBaseDatos'
+# Canal que reciben todas las alertas (vista global del SuperAdmin)
+CANAL_GLOBAL = 'alertas'
+# Milisegundos que espera el cliente SSE antes de reconectar
+ESPERA_RECONEXION_MS = 5000
+
+Evento = namedtuple('Evento', ['id', 'tipo', 'canales', 'datos'])
+
+
+def canal_unidad(unidad_id):
+    return f'alertas:unidad:{unidad_id}'
+
+
+class Suscripcion:
+    """Cola de eventos de un cliente, alimentada por el broker desde cualquier hilo"""
+
+    def __init__(self, broker, canales):
+        self.broker = broker
+        self.canales = frozenset(canales)
+        self.loop = asyncio.get_running_loop()
+        self.cola = asyncio.Queue()
+
+    def entregar(self, evento):
+        self.loop.call_soon_threadsafe(self.cola.put_nowait, evento)
+
+    async def siguiente(self, timeout):
+        """Siguiente evento, o None si no llega ninguno en timeout segundos"""
+        try:
+            return await asyncio.wait_for(self.cola.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def cerrar(self):
+        self.broker.cancelar(self)
+
+
+class BrokerEnMemoria:
+    """
+    Broker publicación/suscripción dentro del proceso.
+
+    Numera los eventos de forma creciente y conserva los últimos en memoria para
+    que un cliente que se reconecta con Last-Event-ID reciba los que se perdió. Solo
+    sirve con un único proceso ASGI: con varios workers cada uno tendría sus propios
+    suscriptores y eventos.
+    """
+    TAMANO_HISTORIAL = 1000
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ultimo_id = 0
+        self._historial = deque(maxlen=self.TAMANO_HISTORIAL)
+        self._suscripciones = set()
+
+    def publicar(self, tipo, canales, datos):
+        """Publica un evento en los canales indicados y lo devuelve"""
+        with self._lock:
+            self._ultimo_id += 1
+            evento = Evento(self._ultimo_id, tipo, frozenset(canales), datos)
+            self._historial.append(evento)
+        self._difundir(evento)
+        return evento
+    
+    def _difundir(self, evento):
+        """Entrega el evento a las suscripciones de este proceso a alguno de sus canales"""
+        with self._lock:
+            destinatarios = [s for s in self._suscripciones if s.canales & evento.canales]
+        for suscripcion in destinatarios:
+            suscripcion.entregar(evento)
+
+    def suscribir(self, canales):
+        """Crea una suscripción a los canales; debe llamarse desde el bucle de eventos"""
+        suscripcion = Suscripcion(self, canales)
+        with self._lock:
+            self._suscripciones.add(suscripcion)
+        return suscripcion
+
+    def cancelar(self, suscripcion):
+        with self._lock:
+            self._suscripciones.discard(suscripcion)
+
+    def pendientes(self, ultimo_id, canales):
+        """
+        Eventos de los canales posteriores a ultimo_id, o None si ya no están todos en
+        el historial o el id no es de este broker (por ejemplo, tras un reinicio). En
+        ese caso el cliente debe volver a pedir la lista completa.
+        """
+        canales = frozenset(canales)
+        with self._lock:
+            historial = list(self._historial)
+            ultimo_emitido = self._ultimo_id
+        if ultimo_id > ultimo_emitido or (historial and historial[0].id > ultimo_id + 1):
+            return None
+        return [evento for evento in historial if evento.id > ultimo_id and evento.canales & canales]
+
+
+class BrokerBaseDatos(BrokerEnMemoria):
+    """
+    Broker compartido entre procesos a través de la tabla EventoAlerta.
+    
+    publicar inserta el evento desde cualquier proceso (workers WSGI o ASGI, comando
+    refrescar_alertas_plazos). Cada proceso con suscriptores consulta la tabla cada
+    INTERVALO segundos en un hilo y entrega los eventos nuevos a sus suscripciones.
+    El id del evento es el de la fila, común a todos los procesos, de modo que
+    Last-Event-ID sirve aunque el cliente reconecte a otro worker. El comando
+    refrescar_alertas_plazos elimina los eventos antiguos.
+    """
+    INTERVALO = 1
+    
+    def __init__(self):
+        super().__init__()
+        self._hilo = None
+    
+    def publicar(self, tipo, canales, datos):
+        from .models import EventoAlerta
+        canales = frozenset(canales)
+        fila = EventoAlerta.objects.create(tipo=tipo, canales=sorted(canales), datos=datos)
+        return Evento(fila.pk, tipo, canales, datos)
+    
+    def suscribir(self, canales):
+        suscripcion = super().suscribir(canales)
+        with self._lock:
+            if self._hilo is None:
+                self._hilo = threading.Thread(target=self._sondear, name='alertas-broker', daemon=True)
+                self._hilo.start()
+        return suscripcion
+    
+    def _sondear(self):
+        from .models import EventoAlerta
+        ultimo = None
+        while True:
+            try:
+                close_old_connections()
+                if ultimo is None:
+                    ultimo = EventoAlerta.objects.aggregate(maximo=Max('pk'))['maximo'] or 0
+                for fila in EventoAlerta.objects.filter(pk__gt=ultimo).order_by('pk'):
+                    self._difundir(Evento(fila.pk, fila.tipo, frozenset(fila.canales), fila.datos))
+                    ultimo = fila.pk
+            except Exception:
+                logger.exception("Error al leer los eventos de alertas")
+            time.sleep(self.INTERVALO)
+    
+    def pendientes(self, ultimo_id, canales):
+        # Consulta la base de datos: desde código asíncrono, con sync_to_async
+        from .models import EventoAlerta
+        canales = frozenset(canales)
+        limites = EventoAlerta.objects.aggregate(primero=Min('pk'), ultimo=Max('pk'))
+        if limites['ultimo'] is None or ultimo_id > limites['ultimo'] or limites['primero'] > ultimo_id + 1:
+            return None
+        filas = EventoAlerta.objects.filter(pk__gt=ultimo_id).order_by('pk')
+        return [
+            Evento(fila.pk, fila.tipo, frozenset(fila.canales), fila.datos)
+            for fila in filas if canales & set(fila.canales)
+        ]
+
+
+_brokers = {}
+_lock_brokers = threading.Lock()
+
+
+def obtener_broker():
+    """Instancia (única por proceso) del broker configurado en ALERTAS_BROKER"""
+    ruta = getattr(settings, 'ALERTAS_BROKER', BROKER_POR_DEFECTO)
+    with _lock_brokers:
+        if ruta not in _brokers:
+            _brokers[ruta] = import_string(ruta)()
+        return _brokers[ruta]
+
+
+def publicar_alerta(tipo, unidad_id, datos):
+    """Publica un cambio de alerta para su unidad y para la vista global"""
+    return obtener_broker().publicar(tipo, [canal_unidad(unidad_id), CANAL_GLOBAL], datos)
@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand
+from procedimientos.models import Blob, Documento
+
+class Command(BaseCommand):
+    help = (
+        'Pasa al almacén de contenidos (Blob) los archivos de los documentos anteriores '
+        'a él: los documentos con el mismo contenido comparten un único fichero y se '
+        'eliminan las copias'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--simular', action='store_true',
+            help='Solo informa de los documentos que se pasarían, sin modificar nada'
+        )
+
+    def handle(self, *args, **options):
+        documentos = Documento.objects.filter(blob__isnull=True).exclude(archivo='').exclude(archivo__isnull=True)
+        total = documentos.count()
+        if options['simular']:
+            self.stdout.write(f'{total} documentos con archivo propio')
+            return
+
+        pasados = liberado = 0
+        for documento in documentos.iterator():
+            archivo = documento.archivo
+            if not archivo.storage.exists(archivo.name):
+                self.stdout.write(self.style.WARNING(f'Documento {documento.pk}: no existe {archivo.name}'))
+                continue
+
+            with archivo.open('rb'):
+                blob = Blob.objects.guardar(archivo, documento.extension)
+            if blob.referencias > 1:
+                liberado += blob.tamano
+            Documento.objects.filter(pk=documento.pk).update(blob=blob, archivo=blob.archivo.name)
+            archivo.storage.delete(archivo.name)
+            pasados += 1
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{pasados} de {total} documentos en el almacén de contenidos '
+            f'({liberado / (1024 * 1024):.1f} MB de copias eliminadas)'
+        ))
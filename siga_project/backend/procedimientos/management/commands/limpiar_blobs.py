@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from procedimientos.models import Blob
+
+class Command(BaseCommand):
+    help = (
+        'Elimina los blobs sin referencias y sus ficheros, y los ficheros del almacén '
+        'de contenidos sin blob. Debe ejecutarse periódicamente (cron)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--horas', type=int, default=1,
+            help='Antigüedad mínima de los ficheros sin blob que se eliminan (1 por defecto)'
+        )
+
+    def handle(self, *args, **options):
+        blobs, ficheros = Blob.objects.purgar(options['horas'])
+        self.stdout.write(self.style.SUCCESS(f'{blobs} blobs y {ficheros} ficheros sin blob eliminados'))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from procedimientos.models import SubidaFragmentada
+
+class Command(BaseCommand):
+    help = (
+        'Elimina las subidas fragmentadas abandonadas (sin fragmentos nuevos en las '
+        'últimas horas) y sus ficheros. Debe ejecutarse periódicamente (cron)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--horas', type=int, default=48,
+            help='Horas sin actividad tras las que se elimina una subida (48 por defecto)'
+        )
+
+    def handle(self, *args, **options):
+        total, _ = SubidaFragmentada.objects.caducadas(options['horas']).delete()
+        self.stdout.write(self.style.SUCCESS(f'{total} subidas fragmentadas eliminadas'))
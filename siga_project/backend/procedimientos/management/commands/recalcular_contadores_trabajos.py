@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+from procedimientos.contadores import recalcular_contadores, TAMANO_LOTE
+
+class Command(BaseCommand):
+    help = 'Rellena y verifica los contadores de progreso y tiempo estimado de los trabajos'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verificar', action='store_true',
+            help='Solo comprueba los contadores; termina con error si alguno no coincide'
+        )
+        parser.add_argument(
+            '--lote', type=int, default=TAMANO_LOTE,
+            help='Número de filas por lote de escritura'
+        )
+
+    def handle(self, *args, **options):
+        verificar = options['verificar']
+        diferencias = recalcular_contadores(corregir=not verificar, tamano_lote=options['lote'])
+        
+        # Al verificar (o con -v 2) mostrar el detalle de cada diferencia
+        if verificar or options['verbosity'] > 1:
+            for diferencia in diferencias:
+                self.stdout.write(
+                    f'Trabajo {diferencia.id} - {diferencia.campo}: '
+                    f'{diferencia.guardado} guardado, {diferencia.calculado} calculado'
+                )
+        
+        trabajos = len({diferencia.id for diferencia in diferencias})
+        if verificar:
+            if diferencias:
+                raise CommandError(f'{trabajos} trabajos tienen contadores incorrectos')
+            self.stdout.write(self.style.SUCCESS('Los contadores de todos los trabajos son correctos'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'Contadores recalculados ({trabajos} trabajos actualizados)'))
@@ -0,0 +1,36 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from procedimientos.models import AlertaPlazo, EventoAlerta
+
+class Command(BaseCommand):
+    help = (
+        'Recalcula la tabla de alertas de plazos (pasos vencidos o próximos a vencer). '
+        'Debe ejecutarse periódicamente (cron) o como proceso con --intervalo, y al menos '
+        'una vez poco después de medianoche (UTC), cuando cambian los días restantes. '
+        'Los plazos que vencen se notifican a los clientes del stream de alertas a través '
+        'del broker compartido (ALERTAS_BROKER)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--intervalo', type=int, default=0,
+            help='Segundos entre refrescos; si se indica, el comando queda en bucle'
+        )
+
+    def handle(self, *args, **options):
+        intervalo = options['intervalo']
+        while True:
+            close_old_connections()
+            total = AlertaPlazo.objects.refrescar()
+            # Eventos ya entregados (o demasiado antiguos para reenviarlos al reconectar)
+            EventoAlerta.objects.caducados().delete()
+            self.stdout.write(self.style.SUCCESS(f'Alertas de plazos recalculadas ({total} alertas)'))
+
+            if intervalo <= 0:
+                break
+            try:
+                time.sleep(intervalo)
+            except KeyboardInterrupt:
+                break
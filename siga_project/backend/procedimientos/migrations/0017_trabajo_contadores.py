@@ -0,0 +1,67 @@
+# Generated by Django 5.2.18 on 2026-10-17 12:23
+
+from collections import defaultdict
+
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def rellenar_contadores(apps, schema_editor):
+    """Calcula los contadores de los trabajos existentes a partir de sus pasos"""
+    Paso = apps.get_model('procedimientos', 'Paso')
+    PasoTrabajo = apps.get_model('procedimientos', 'PasoTrabajo')
+    Trabajo = apps.get_model('procedimientos', 'Trabajo')
+    
+    pasos = {
+        fila['trabajo']: (fila['total'], fila['completados'])
+        for fila in PasoTrabajo.objects.order_by().values('trabajo').annotate(
+            total=Count('id'), completados=Count('id', filter=Q(estado='COMPLETADO'))
+        )
+    }
+    
+    tiempos = defaultdict(float)
+    for procedimiento_id, tiempo in Paso.objects.order_by('numero').values_list('procedimiento_id', 'tiempo_estimado'):
+        try:
+            tiempos[procedimiento_id] += float(tiempo) if tiempo else 0
+        except (ValueError, TypeError):
+            pass
+    
+    Trabajo.objects.bulk_update(
+        [
+            Trabajo(
+                id=trabajo_id,
+                pasos_total=pasos.get(trabajo_id, (0, 0))[0],
+                pasos_completados=pasos.get(trabajo_id, (0, 0))[1],
+                tiempo_estimado_total=tiempos.get(procedimiento_id, 0),
+            )
+            for trabajo_id, procedimiento_id in Trabajo.objects.values_list('id', 'procedimiento_id')
+        ],
+        ['pasos_total', 'pasos_completados', 'tiempo_estimado_total'],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('procedimientos', '0016_documento_tipo_documento'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trabajo',
+            name='pasos_completados',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='trabajo',
+            name='pasos_total',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='trabajo',
+            name='tiempo_estimado_total',
+            field=models.FloatField(default=0, editable=False, help_text='Suma en días del tiempo estimado de los pasos del procedimiento'),
+        ),
+        migrations.RunPython(rellenar_contadores, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,94 @@
+# Generated by Django 5.2.18 on 2026-10-17 13:05
+
+from datetime import timedelta
+from decimal import Decimal, InvalidOperation
+
+from django.db import migrations, models
+
+# Máximo representable con max_digits=6, decimal_places=2
+MAXIMO_DIAS = Decimal('9999.99')
+
+
+def texto_a_dias(valor):
+    """Convierte el tiempo estimado guardado como texto ("2", "1,5", " 3 ") a Decimal; None si no es válido"""
+    if not valor:
+        return None
+    try:
+        dias = Decimal(str(valor).strip().replace(',', '.')).quantize(Decimal('0.01'))
+    except (InvalidOperation, ValueError):
+        return None
+    if not dias.is_finite() or dias < 0 or dias > MAXIMO_DIAS:
+        return None
+    return dias
+
+
+def convertir_tiempos(apps, schema_editor):
+    Paso = apps.get_model('procedimientos', 'Paso')
+    pasos = []
+    for paso in Paso.objects.exclude(tiempo_estimado__isnull=True).only('id', 'tiempo_estimado'):
+        paso.tiempo_estimado_dias = texto_a_dias(paso.tiempo_estimado)
+        if paso.tiempo_estimado_dias is not None:
+            pasos.append(paso)
+    Paso.objects.bulk_update(pasos, ['tiempo_estimado_dias'], batch_size=500)
+
+
+def revertir_tiempos(apps, schema_editor):
+    Paso = apps.get_model('procedimientos', 'Paso')
+    pasos = []
+    for paso in Paso.objects.exclude(tiempo_estimado_dias__isnull=True).only('id', 'tiempo_estimado_dias'):
+        paso.tiempo_estimado = format(paso.tiempo_estimado_dias.normalize(), 'f')
+        pasos.append(paso)
+    Paso.objects.bulk_update(pasos, ['tiempo_estimado'], batch_size=500)
+
+
+def rellenar_fechas_limite(apps, schema_editor):
+    """Fecha límite de los pasos ya iniciados: fecha_inicio + tiempo estimado del paso"""
+    PasoTrabajo = apps.get_model('procedimientos', 'PasoTrabajo')
+    pasos = []
+    filas = PasoTrabajo.objects.filter(
+        fecha_inicio__isnull=False, paso__tiempo_estimado__isnull=False
+    ).values_list('id', 'fecha_inicio', 'paso__tiempo_estimado')
+    for paso_id, fecha_inicio, dias in filas.iterator(chunk_size=2000):
+        if dias:
+            pasos.append(PasoTrabajo(id=paso_id, fecha_limite=fecha_inicio + timedelta(days=float(dias))))
+    PasoTrabajo.objects.bulk_update(pasos, ['fecha_limite'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('procedimientos', '0017_trabajo_contadores'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='paso',
+            name='tiempo_estimado_dias',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=6, null=True),
+        ),
+        migrations.RunPython(convertir_tiempos, revertir_tiempos),
+        migrations.RemoveField(
+            model_name='paso',
+            name='tiempo_estimado',
+        ),
+        migrations.RenameField(
+            model_name='paso',
+            old_name='tiempo_estimado_dias',
+            new_name='tiempo_estimado',
+        ),
+        migrations.AlterField(
+            model_name='paso',
+            name='tiempo_estimado',
+            field=models.DecimalField(blank=True, decimal_places=2, help_text='Tiempo estimado para completar el paso, en días', max_digits=6, null=True),
+        ),
+        migrations.AddField(
+            model_name='pasotrabajo',
+            name='fecha_limite',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(rellenar_fechas_limite, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='pasotrabajo',
+            index=models.Index(fields=['estado', 'fecha_limite'], name='pasotrabajo_estado_limite_idx'),
+        ),
+    ]
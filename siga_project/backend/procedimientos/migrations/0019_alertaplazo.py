@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-17 12:32
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('procedimientos', '0018_tiempo_estimado_dias'),
+        ('unidades', '0008_unidad_ultimo_hijo'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AlertaPlazo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha_limite', models.DateField(help_text='Fecha (UTC) en la que vence el paso')),
+                ('estado', models.CharField(choices=[('PENDIENTE', 'Pendiente'), ('EN_PROGRESO', 'En progreso'), ('COMPLETADO', 'Completado'), ('BLOQUEADO', 'Bloqueado')], max_length=20)),
+                ('trabajo_titulo', models.CharField(max_length=200)),
+                ('paso_numero', models.IntegerField()),
+                ('paso_titulo', models.CharField(max_length=200)),
+                ('tiempo_estimado', models.DecimalField(decimal_places=2, max_digits=6)),
+                ('usuario_asignado', models.CharField(blank=True, max_length=150, null=True)),
+                ('responsable_nombre', models.CharField(blank=True, max_length=255, null=True)),
+                ('unidad_nombre', models.CharField(blank=True, max_length=255, null=True)),
+                ('fecha_calculo', models.DateTimeField(auto_now=True)),
+                ('paso_trabajo', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='alerta_plazo', to='procedimientos.pasotrabajo')),
+                ('trabajo', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='alertas_plazo', to='procedimientos.trabajo')),
+                ('unidad', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='alertas_plazo', to='unidades.unidad')),
+                ('usuario_creador', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('usuario_iniciado', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Alerta de plazo',
+                'verbose_name_plural': 'Alertas de plazo',
+                'ordering': ['fecha_limite'],
+                'indexes': [models.Index(fields=['unidad', 'fecha_limite'], name='alertaplazo_unidad_limite_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-17 12:44
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('procedimientos', '0019_alertaplazo'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InstantaneaProcedimiento',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.CharField(max_length=10)),
+                ('contenido', models.TextField()),
+                ('etag', models.CharField(max_length=64)),
+                ('fecha_generacion', models.DateTimeField(auto_now=True)),
+                ('procedimiento', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='instantaneas', to='procedimientos.procedimiento')),
+            ],
+            options={
+                'verbose_name': 'Instantánea de Procedimiento',
+                'verbose_name_plural': 'Instantáneas de Procedimientos',
+                'unique_together': {('procedimiento', 'version')},
+            },
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-17 12:46
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('procedimientos', '0020_instantaneaprocedimiento'),
+        ('unidades', '0008_unidad_ultimo_hijo'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='historialprocedimiento',
+            index=models.Index(fields=['procedimiento', '-fecha_cambio', '-id'], name='historial_proc_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='historialprocedimiento',
+            index=models.Index(fields=['-fecha_cambio', '-id'], name='historial_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='procedimiento',
+            index=models.Index(fields=['-fecha_actualizacion', '-id'], name='proc_fecha_act_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='trabajo',
+            index=models.Index(fields=['-fecha_inicio', '-id'], name='trabajo_fecha_inicio_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='trabajo',
+            index=models.Index(fields=['unidad', '-fecha_inicio', '-id'], name='trabajo_unidad_fecha_idx'),
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 5.2.18 on 2026-10-17 12:51
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def borrar_instantaneas(apps, schema_editor):
+    """Los documentos muestran ahora tipo_documento: recompilar las instantáneas"""
+    apps.get_model('procedimientos', 'InstantaneaProcedimiento').objects.all().delete()
+
+
+def marcar_documentos_de_pasos(apps, schema_editor):
+    """
+    Los documentos de pasos creados antes de tipo_documento quedaron como GENERAL y solo
+    se distinguían por la carpeta procedimientos/<id>/pasos/ de su archivo, que se pierde
+    al pasarlos al almacén de contenidos (deduplicar_documentos): marcarlos como PASO.
+    """
+    Documento = apps.get_model('procedimientos', 'Documento')
+    DocumentoPaso = apps.get_model('procedimientos', 'DocumentoPaso')
+    Documento.objects.filter(
+        models.Q(pk__in=DocumentoPaso.objects.values('documento')) | models.Q(archivo__contains='/pasos/')
+    ).exclude(tipo_documento='PASO').update(tipo_documento='PASO')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('procedimientos', '0021_indices_paginacion_cursor'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Blob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sha256', models.CharField(max_length=64, unique=True)),
+                ('tamano', models.PositiveBigIntegerField()),
+                ('archivo', models.FileField(max_length=200, upload_to='blobs')),
+                ('referencias', models.PositiveIntegerField(default=0)),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Blob',
+                'verbose_name_plural': 'Blobs',
+            },
+        ),
+        migrations.AddField(
+            model_name='documento',
+            name='blob',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='documentos', to='procedimientos.blob'),
+        ),
+        migrations.RunPython(marcar_documentos_de_pasos, migrations.RunPython.noop),
+        migrations.RunPython(borrar_instantaneas, migrations.RunPython.noop),
+    ]
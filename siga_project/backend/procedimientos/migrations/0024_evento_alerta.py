@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-17 13:16
+
+import django.core.serializers.json
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('procedimientos', '0023_subida_fragmentada'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EventoAlerta',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(max_length=20)),
+                ('canales', models.JSONField()),
+                ('datos', models.JSONField(encoder=django.core.serializers.json.DjangoJSONEncoder)),
+                ('fecha', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+            options={
+                'verbose_name': 'Evento de alerta',
+                'verbose_name_plural': 'Eventos de alertas',
+            },
+        ),
+    ]
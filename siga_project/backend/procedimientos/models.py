@@ -1,10 +1,23 @@
-from django.db import models
+import hashlib
+import json
+import shutil
+import tempfile
+from datetime import timezone as dt_timezone
+
+from django.db import IntegrityError, connections, models, transaction
+from django.db.models.functions import TruncDate
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
 from users.models import Usuario
 from django.conf import settings
 from django.utils import timezone
 import os
-from django.core.files.base import ContentFile
+from django.core.files import locks
+from django.core.files.base import ContentFile, File
+from django.core.serializers.json import DjangoJSONEncoder
 from unidades.models import Unidad
+from .archivos import TAMANO_BLOQUE, copiar_archivo, crear_directorios, ruta_local, volcar_con_hash
+from .eventos import publicar_alerta
 
 class TipoProcedimiento(models.Model):
     nombre = models.CharField(max_length=100)
@@ -18,6 +31,127 @@ class TipoProcedimiento(models.Model):
         verbose_name_plural = "Tipos de Procedimientos"
         ordering = ['nombre']
 
+# Máximo de niveles que se recorren en una cadena de procedimientos. Las cadenas
+# reales tienen tantos eslabones como niveles (Puesto → ... → Dirección General);
+# superar el límite solo es posible si la cadena contiene un ciclo.
+LIMITE_CADENA = 50
+
+
+class CicloProcedimientosError(ValueError):
+    """La cadena de procedimientos relacionados contiene un ciclo"""
+
+
+class ProcedimientoQuerySet(models.QuerySet):
+    def con_derivados(self):
+        """
+        Anota total_derivados (procedimientos que se envían a cada uno), que usan
+        es_inicio_proceso y los serializadores en lugar de una consulta por fila.
+        """
+        # Las consultas con GROUP BY no aplican Meta.ordering: se repite explícitamente
+        return self.annotate(
+            total_derivados=models.Count('procedimientos_derivados')
+        ).order_by(*self.model._meta.ordering)
+    
+    def con_pasos(self):
+        """
+        Precarga los pasos de cada procedimiento con sus documentos (ver
+        PasoQuerySet.con_documentos): dos consultas más, sea cual sea el número de pasos.
+        """
+        return self.prefetch_related(models.Prefetch('pasos', queryset=Paso.objects.con_documentos()))
+    
+    def para_detalle(self):
+        """
+        Todo lo que muestra ProcedimientoDetailSerializer: tipo, procedimiento
+        relacionado, derivados y pasos con sus documentos.
+        """
+        return self.select_related('tipo', 'procedimiento_relacionado').con_derivados().prefetch_related(
+            'procedimientos_derivados'
+        ).con_pasos()
+    
+    def _recorrer_cadena(self, procedimiento_id):
+        """
+        Recorre la cadena en ambos sentidos con una única consulta recursiva (CTE).
+        
+        Devuelve dos listas de ids: los procedimientos superiores (siguiendo
+        procedimiento_relacionado, del más cercano al más lejano) y los inferiores
+        (todos los que derivan directa o indirectamente del procedimiento, incluido
+        él mismo). Ambos recorridos se cortan en LIMITE_CADENA niveles.
+        """
+        connection = connections[self.db]
+        tabla = connection.ops.quote_name(self.model._meta.db_table)
+        relacionado = connection.ops.quote_name(self.model._meta.get_field('procedimiento_relacionado').column)
+        sql = f"""
+            WITH RECURSIVE
+                superiores (id, profundidad) AS (
+                    SELECT {relacionado}, 1 FROM {tabla}
+                    WHERE id = %s AND {relacionado} IS NOT NULL
+                    UNION ALL
+                    SELECT p.{relacionado}, s.profundidad + 1 FROM {tabla} p
+                    JOIN superiores s ON p.id = s.id
+                    WHERE p.{relacionado} IS NOT NULL AND s.profundidad < %s
+                ),
+                inferiores (id, profundidad) AS (
+                    SELECT id, 0 FROM {tabla} WHERE id = %s
+                    UNION ALL
+                    SELECT p.id, i.profundidad - 1 FROM {tabla} p
+                    JOIN inferiores i ON p.{relacionado} = i.id
+                    WHERE i.profundidad > %s
+                )
+            SELECT id, profundidad FROM superiores
+            UNION ALL
+            SELECT id, profundidad FROM inferiores
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [procedimiento_id, LIMITE_CADENA, procedimiento_id, -LIMITE_CADENA])
+            filas = cursor.fetchall()
+        
+        superiores = [pid for pid, profundidad in sorted(filas, key=lambda f: f[1]) if profundidad > 0]
+        inferiores = [pid for pid, profundidad in filas if profundidad <= 0]
+        return superiores, inferiores
+    
+    def ids_superiores(self, procedimiento_id):
+        """Ids de los procedimientos a los que se envía, directa o indirectamente"""
+        return self._recorrer_cadena(procedimiento_id)[0]
+    
+    def cadena(self, procedimiento, completa=True):
+        """
+        Cadena de procedimientos relacionados de menor a mayor nivel.
+        
+        Con completa=True empieza en el procedimiento inicial: desde el indicado se
+        baja por los derivados, eligiendo en cada nivel el más reciente, hasta uno sin
+        predecesores. Con completa=False empieza en el propio procedimiento. Siempre
+        se resuelve con dos consultas (CTE + carga de los procedimientos) sea cual sea
+        la longitud. Lanza CicloProcedimientosError si la cadena contiene un ciclo.
+        """
+        superiores, inferiores = self._recorrer_cadena(procedimiento.pk)
+        
+        if (procedimiento.pk in superiores
+                or len(set(superiores)) != len(superiores)
+                or len(set(inferiores)) != len(inferiores)
+                or len(superiores) >= LIMITE_CADENA):
+            raise CicloProcedimientosError(
+                f"La cadena del procedimiento {procedimiento.pk} contiene un ciclo"
+            )
+        
+        procedimientos = self.select_related('tipo').con_derivados().in_bulk(
+            superiores + (inferiores if completa else [procedimiento.pk])
+        )
+        
+        # Bajar por los derivados igual que el recorrido clásico: en cada nivel el
+        # primero según la ordenación por defecto (fecha_actualizacion descendente)
+        derivados = {}
+        for pid in inferiores if completa else []:
+            proc = procedimientos[pid]
+            if pid != procedimiento.pk:
+                derivados.setdefault(proc.procedimiento_relacionado_id, []).append(proc)
+        
+        inicio = [procedimientos[procedimiento.pk]]
+        while inicio[-1].pk in derivados:
+            inicio.append(max(derivados[inicio[-1].pk], key=lambda p: p.fecha_actualizacion))
+        
+        return inicio[::-1] + [procedimientos[pid] for pid in superiores]
+
+
 class Procedimiento(models.Model):
     ESTADO_CHOICES = [
         ('BORRADOR', 'Borrador'),
@@ -62,33 +196,39 @@ class Procedimiento(models.Model):
         help_text="Número de días máximo para completar el procedimiento"
     )
     
+    objects = ProcedimientoQuerySet.as_manager()
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instancia = super().from_db(db, field_names, values)
+        # Procedimiento relacionado al cargarlo: si cambia, también hay que invalidar la
+        # instantánea del anterior (ver invalidar_instantaneas_procedimiento)
+        instancia._relacionado_cargado = instancia.__dict__.get('procedimiento_relacionado_id')
+        return instancia
+    
     def __str__(self):
         return f"{self.nombre} (v{self.version}, {self.get_nivel_display()})"
     
     # Método para obtener la cadena completa de procedimientos relacionados
     def get_cadena_procedimientos(self):
         """Devuelve la cadena completa de procedimientos relacionados de menor a mayor nivel"""
-        cadena = [self]
-        proc_actual = self
-        
-        # Buscar hacia arriba (niveles superiores)
-        while proc_actual.procedimiento_relacionado:
-            proc_actual = proc_actual.procedimiento_relacionado
-            cadena.append(proc_actual)
-        
-        return cadena
+        return Procedimiento.objects.cadena(self, completa=False)
     
     # Método para verificar si este procedimiento es el inicio de un proceso
     @property
     def es_inicio_proceso(self):
         """Determina si este procedimiento es el inicio de un proceso (no tiene predecesores)"""
+        # Usar la anotación de con_derivados() si el queryset la incluye
+        total_derivados = getattr(self, 'total_derivados', None)
+        if total_derivados is not None:
+            return total_derivados == 0
         return not Procedimiento.objects.filter(procedimiento_relacionado=self).exists()
     
     # Método para verificar si este procedimiento es el final de un proceso
     @property
     def es_fin_proceso(self):
         """Determina si este procedimiento es el final de un proceso (no tiene procedimiento relacionado)"""
-        return self.procedimiento_relacionado is None
+        return self.procedimiento_relacionado_id is None
     
     # Método para verificar aplicabilidad
     def es_aplicable_a_unidad(self, unidad):
@@ -111,16 +251,39 @@ class Procedimiento(models.Model):
         verbose_name = "Procedimiento"
         verbose_name_plural = "Procedimientos"
         ordering = ['-fecha_actualizacion']
+        indexes = [
+            # Listado paginado por cursor sobre la ordenación por defecto
+            models.Index(fields=['-fecha_actualizacion', '-id'], name='proc_fecha_act_idx'),
+        ]
         # Añadir restricción única para nombre+tipo+nivel
         unique_together = ['nombre', 'tipo', 'nivel']
 
+def dias_estimados(tiempo_estimado):
+    """Tiempo estimado de un paso (días) como float; 0 si no está definido"""
+    return float(tiempo_estimado) if tiempo_estimado else 0
+
+
+class PasoQuerySet(models.QuerySet):
+    def con_documentos(self):
+        """
+        Precarga los DocumentoPaso de cada paso junto con su Documento (una sola
+        consulta con JOIN), que es lo que lee PasoSerializer.documentos.
+        """
+        return self.prefetch_related(models.Prefetch(
+            'documento_paso', queryset=DocumentoPaso.objects.select_related('documento')
+        ))
+
+
 class Paso(models.Model):
     procedimiento = models.ForeignKey(Procedimiento, on_delete=models.CASCADE, related_name='pasos')
     # Cambiar la definición del campo numero para que no permita nulos y tenga un valor por defecto
     numero = models.IntegerField(null=False, default=1)  # Asegurar que nunca sea nulo
     titulo = models.CharField(max_length=200)
     descripcion = models.TextField(blank=True, null=True)
-    tiempo_estimado = models.CharField(max_length=10, blank=True, null=True)
+    tiempo_estimado = models.DecimalField(
+        max_digits=6, decimal_places=2, blank=True, null=True,
+        help_text="Tiempo estimado para completar el paso, en días"
+    )
     responsable = models.CharField(max_length=100, blank=True, null=True)
     bifurcaciones = models.JSONField(default=list, blank=True)  
     es_final = models.BooleanField(default=False, help_text="Indica si este paso finaliza el procedimiento")
@@ -130,6 +293,17 @@ class Paso(models.Model):
         help_text="Indica si este paso requiere un envío que necesita respuesta para continuar"
     )
     
+    objects = PasoQuerySet.as_manager()
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instancia = super().from_db(db, field_names, values)
+        # Tiempo estimado al cargarlo: los trabajos solo se recalculan si cambia (ver
+        # actualizar_tiempo_estimado_trabajos)
+        if 'tiempo_estimado' in instancia.__dict__:
+            instancia._tiempo_cargado = instancia.tiempo_estimado
+        return instancia
+    
     def __str__(self):
         return f"{self.procedimiento.nombre} - Paso {self.numero}: {self.titulo}"
     
@@ -183,6 +357,162 @@ def documento_upload_path(instance, filename):
     os.makedirs(os.path.join(settings.MEDIA_ROOT, other_path), exist_ok=True)
     return f'{other_path}/{filename}'
 
+# Carpeta (dentro de MEDIA_ROOT) del almacén de contenidos
+DIRECTORIO_BLOBS = 'blobs'
+
+
+def ruta_blob(sha256, extension=''):
+    """Nombre del fichero de un blob: blobs/<2 primeros caracteres>/<sha256>[.extensión]"""
+    sufijo = f'.{extension}' if extension else ''
+    return f'{DIRECTORIO_BLOBS}/{sha256[:2]}/{sha256}{sufijo}'
+
+
+def extension_archivo(nombre):
+    return nombre.split('.')[-1].lower() if '.' in nombre else ''
+
+
+class BlobQuerySet(models.QuerySet):
+    def guardar(self, fichero, extension=''):
+        """
+        Guarda el contenido de fichero (File o UploadedFile) en el almacén y devuelve su
+        Blob con una referencia más. El fichero se lee una sola vez, calculando el
+        SHA-256 mientras se escribe en un temporal; si ese contenido ya existía, el
+        temporal se descarta y solo se incrementa el contador de referencias.
+        
+        Una subida que Django ya ha volcado a disco (TemporaryUploadedFile) no se vuelve
+        a escribir: se lee para calcular el hash y se mueve al almacén, sin copia si
+        FILE_UPLOAD_TEMP_DIR está en el mismo sistema de ficheros que MEDIA_ROOT.
+        """
+        storage = self.model._meta.get_field('archivo').storage
+        # El temporal se crea en el propio almacén si es local, para moverlo sin copiar
+        directorio = ruta_local(storage, DIRECTORIO_BLOBS)
+        if directorio:
+            crear_directorios(storage, directorio)
+        
+        if directorio and hasattr(fichero, 'temporary_file_path'):
+            sha256, tamano = volcar_con_hash(fichero)
+            # Si no se mueve (contenido repetido), Django lo elimina al cerrar la subida
+            return self._registrar(storage, fichero.temporary_file_path(), sha256, tamano, extension)
+        
+        with tempfile.NamedTemporaryFile(dir=directorio, prefix='.subida-', delete=False) as temporal:
+            sha256, tamano = volcar_con_hash(fichero, temporal)
+        try:
+            return self._registrar(storage, temporal.name, sha256, tamano, extension)
+        finally:
+            if os.path.exists(temporal.name):
+                os.remove(temporal.name)
+    
+    def _registrar(self, storage, temporal, sha256, tamano, extension):
+        # El fichero se escribe con la fila del blob bloqueada (o antes de crearla), y
+        # purgar lo borra con la fila bloqueada: nunca se borra un fichero en uso
+        while True:
+            with transaction.atomic():
+                blob = self.select_for_update().filter(sha256=sha256).first()
+                if blob is not None:
+                    if not blob.archivo.storage.exists(blob.archivo.name):
+                        # purgar borró el fichero pero no llegó a eliminar la fila
+                        self._guardar_fichero(storage, temporal, blob.archivo.name)
+                    self.referenciar(blob.pk)
+                    blob.referencias += 1
+                    return blob
+                
+                nombre = self._guardar_fichero(storage, temporal, ruta_blob(sha256, extension))
+                try:
+                    with transaction.atomic():
+                        return self.create(sha256=sha256, tamano=tamano, archivo=nombre, referencias=1)
+                except IntegrityError:
+                    # Otra petición ha registrado el mismo contenido a la vez: referenciarlo
+                    continue
+    
+    def _guardar_fichero(self, storage, temporal, nombre):
+        ruta = ruta_local(storage, nombre)
+        if not ruta:
+            with open(temporal, 'rb') as contenido:
+                return storage.save(nombre, File(contenido))
+        crear_directorios(storage, os.path.dirname(ruta))
+        # Renombrado si está en el mismo sistema de ficheros; si no, copia. El temporal
+        # se crea con permisos 0600: darle los de los ficheros guardados por el
+        # almacenamiento (FILE_UPLOAD_PERMISSIONS)
+        shutil.move(temporal, ruta)
+        if storage.file_permissions_mode is not None:
+            os.chmod(ruta, storage.file_permissions_mode)
+        return nombre
+    
+    def referenciar(self, blob_id):
+        """Una referencia más al blob (otro documento que comparte su contenido)"""
+        self.filter(pk=blob_id).update(referencias=models.F('referencias') + 1)
+    
+    def liberar(self, blob_id):
+        """
+        Una referencia menos al blob. Sin referencias, el registro y el fichero quedan
+        hasta que los elimina purgar: si antes se vuelve a subir el mismo contenido,
+        se reutilizan.
+        """
+        self.filter(pk=blob_id, referencias__gt=0).update(referencias=models.F('referencias') - 1)
+    
+    def purgar(self, horas=1):
+        """
+        Elimina los blobs sin referencias con su fichero, y los ficheros del almacén
+        sin blob con más de horas de antigüedad (movidos por una transacción que se
+        deshizo después). Devuelve el número de blobs y de ficheros eliminados.
+        
+        Cada blob se elimina con su fila bloqueada, de modo que _registrar espera y
+        después crea de nuevo la fila y el fichero. Un fichero sin fila puede ser de un
+        _registrar cuya transacción aún no ha terminado: por eso solo se eliminan los
+        antiguos.
+        """
+        blobs = 0
+        for blob_id in self.filter(referencias=0).values_list('pk', flat=True):
+            with transaction.atomic():
+                blob = self.select_for_update().filter(pk=blob_id, referencias=0).first()
+                if blob is None:
+                    continue
+                blob.archivo.storage.delete(blob.archivo.name)
+                blob.delete()
+                blobs += 1
+        
+        storage = self.model._meta.get_field('archivo').storage
+        limite = timezone.now() - timezone.timedelta(hours=horas)
+        ficheros = 0
+        if not storage.exists(DIRECTORIO_BLOBS):
+            return blobs, ficheros
+        for carpeta in storage.listdir(DIRECTORIO_BLOBS)[0]:
+            nombres = {
+                f'{DIRECTORIO_BLOBS}/{carpeta}/{fichero}'
+                for fichero in storage.listdir(f'{DIRECTORIO_BLOBS}/{carpeta}')[1]
+            }
+            nombres -= set(self.filter(archivo__in=nombres).values_list('archivo', flat=True))
+            for nombre in nombres:
+                if storage.get_modified_time(nombre) < limite:
+                    storage.delete(nombre)
+                    ficheros += 1
+        return blobs, ficheros
+
+
+class Blob(models.Model):
+    """
+    Contenido de un fichero de documento, guardado una sola vez por SHA-256.
+    
+    Los documentos con el mismo contenido (el mismo PDF adjunto a varios pasos o
+    procedimientos) apuntan al mismo blob: Documento.archivo guarda el nombre de su
+    fichero. referencias cuenta esos documentos; los blobs sin ninguno se eliminan
+    con su fichero con el comando limpiar_blobs.
+    """
+    sha256 = models.CharField(max_length=64, unique=True)
+    tamano = models.PositiveBigIntegerField()
+    archivo = models.FileField(upload_to=DIRECTORIO_BLOBS, max_length=200)
+    referencias = models.PositiveIntegerField(default=0)
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+    
+    objects = BlobQuerySet.as_manager()
+    
+    class Meta:
+        verbose_name = "Blob"
+        verbose_name_plural = "Blobs"
+    
+    def __str__(self):
+        return f"{self.sha256} ({self.referencias} referencias)"
+
 class Documento(models.Model):
     nombre = models.CharField(max_length=200)
     descripcion = models.TextField(blank=True, null=True)
@@ -205,6 +535,11 @@ class Documento(models.Model):
     fecha_creacion = models.DateTimeField(auto_now_add=True)
     fecha_actualizacion = models.DateTimeField(auto_now=True)
     extension = models.CharField(max_length=10, blank=True, null=True)
+    # Contenido compartido del archivo; los documentos anteriores al almacén de
+    # contenidos no tienen (ver el comando deduplicar_documentos)
+    blob = models.ForeignKey(
+        Blob, on_delete=models.PROTECT, null=True, blank=True, editable=False, related_name='documentos'
+    )
     
     @property
     def archivo_url(self):
@@ -213,14 +548,25 @@ class Documento(models.Model):
         return None
     
     def save(self, *args, **kwargs):
-        # Extraer la extensión del archivo
+        # Extraer la extensión del archivo (del nombre subido, antes de guardarlo como blob)
         if self.archivo and not self.extension:
-            self.extension = self.archivo.name.split('.')[-1].lower() if '.' in self.archivo.name else ''
-        super().save(*args, **kwargs)
+            self.extension = extension_archivo(self.archivo.name)
+        
+        with transaction.atomic():
+            blob_anterior = None
+            if self.archivo and not self.archivo._committed:
+                # Archivo nuevo: al almacén de contenidos, que no lo duplica si ya existe
+                blob_anterior = self.blob_id
+                self.blob = Blob.objects.guardar(self.archivo, self.extension)
+                self.archivo = self.blob.archivo.name
+            super().save(*args, **kwargs)
+            if blob_anterior:
+                Blob.objects.liberar(blob_anterior)
 
     def delete(self, *args, **kwargs):
-        # Si tiene archivo, eliminarlo del sistema de archivos
-        if self.archivo:
+        # Si tiene archivo propio (anterior al almacén de contenidos), eliminarlo del
+        # sistema de archivos; los blobs se liberan en liberar_blob_documento
+        if self.archivo and self.blob_id is None:
             try:
                 storage, path = self.archivo.storage, self.archivo.path
                 storage.delete(path)
@@ -232,6 +578,29 @@ class Documento(models.Model):
         
         super().delete(*args, **kwargs)
 
+class DocumentoPasoQuerySet(models.QuerySet):
+    def adjuntar_archivo(self, paso, archivo, nombre, descripcion='', orden=1, notas=''):
+        """
+        Crea un documento del paso con el archivo subido y lo relaciona con el paso, en
+        una transacción. El archivo se escribe una sola vez, directamente en el almacén
+        de contenidos (con la extensión y el SHA-256 calculados al guardarlo), sin pasar
+        por un documento general temporal.
+        """
+        with transaction.atomic():
+            documento = Documento.objects.create(
+                nombre=nombre,
+                descripcion=descripcion,
+                procedimiento_id=paso.procedimiento_id,
+                archivo=archivo,
+                tipo_documento='PASO',
+            )
+            documento_paso = self.model(paso=paso, documento=documento, orden=orden, notas=notas)
+            # El documento ya es del paso: no hace falta la copia de DocumentoPaso.save
+            documento_paso._documento_propio = True
+            documento_paso.save(using=self.db)
+        return documento_paso
+
+
 class DocumentoPaso(models.Model):
     """
     Relaciona un documento con un paso específico y permite añadir notas
@@ -241,6 +610,8 @@ class DocumentoPaso(models.Model):
     orden = models.IntegerField(default=1)
     notas = models.TextField(blank=True, null=True)
     
+    objects = DocumentoPasoQuerySet.as_manager()
+    
     class Meta:
         verbose_name = "Documento de paso"
         verbose_name_plural = "Documentos de pasos"
@@ -248,16 +619,14 @@ class DocumentoPaso(models.Model):
         unique_together = ['paso', 'documento']
         
     def save(self, *args, **kwargs):
-        # Si se está creando un nuevo DocumentoPaso (no tiene id aún)
-        if not self.pk:
+        # Si se está creando un nuevo DocumentoPaso (no tiene id aún) con un documento
+        # existente, se crea una copia para el paso
+        if not self.pk and not getattr(self, '_documento_propio', False):
             # Verificar si ya existe un documento físico
             original_doc = self.documento
             
             # Si hay archivo físico, crear un nuevo documento con ese archivo en la ubicación correcta
             if original_doc.archivo:
-                from django.core.files.base import ContentFile
-                import os
-                
                 # Crear un nuevo documento
                 nuevo_doc = Documento()
                 nuevo_doc.nombre = original_doc.nombre
@@ -270,20 +639,21 @@ class DocumentoPaso(models.Model):
                 nuevo_doc._paso_id = self.paso.numero
                 nuevo_doc._procedimiento_id = self.paso.procedimiento.id
                 
-                # Guardar primero sin archivo para crear el registro
-                nuevo_doc.save()
-                
-                # Abrir y copiar el contenido del archivo original
-                original_doc.archivo.open()
-                content = original_doc.archivo.read()
-                original_doc.archivo.close()
-                
-                # Obtener el nombre del archivo original y añadir prefijo del paso
-                nombre_base, extension = os.path.splitext(os.path.basename(original_doc.archivo.name))
-                nuevo_nombre = f"{nombre_base}{extension}"
-                
-                # Guardar el archivo en la ubicación común para todos los pasos
-                nuevo_doc.archivo.save(nuevo_nombre, ContentFile(content), save=True)
+                if original_doc.blob_id:
+                    # El nuevo documento comparte el contenido del original
+                    nuevo_doc.blob_id = original_doc.blob_id
+                    nuevo_doc.archivo = original_doc.archivo.name
+                    Blob.objects.referenciar(original_doc.blob_id)
+                    nuevo_doc.save()
+                else:
+                    # Guardar primero sin archivo para crear el registro
+                    nuevo_doc.save()
+                    
+                    # Copiar el archivo original a la ubicación común para todos los pasos,
+                    # sin cargarlo en memoria (enlace duro o copia por bloques)
+                    nuevo_nombre = os.path.basename(original_doc.archivo.name)
+                    copiar_archivo(original_doc.archivo, nuevo_doc.archivo, nuevo_nombre)
+                    nuevo_doc.save()
                 
                 # Reemplazar la referencia al documento original con el nuevo
                 self.documento = nuevo_doc
@@ -321,6 +691,136 @@ class HistorialProcedimiento(models.Model):
         verbose_name = "Historial de Procedimiento"
         verbose_name_plural = "Historial de Procedimientos"
         ordering = ['-fecha_cambio']
+        indexes = [
+            # Historial de un procedimiento y listado paginado por cursor
+            models.Index(fields=['procedimiento', '-fecha_cambio', '-id'], name='historial_proc_fecha_idx'),
+            models.Index(fields=['-fecha_cambio', '-id'], name='historial_fecha_idx'),
+        ]
+
+class InstantaneaProcedimientoQuerySet(models.QuerySet):
+    def vigentes(self):
+        """Instantáneas de la versión actual de su procedimiento"""
+        return self.filter(version=models.F('procedimiento__version'))
+    
+    def generar(self, procedimiento):
+        """
+        Compila (o recompila) la instantánea de la versión actual del procedimiento,
+        que debe venir de Procedimiento.objects.para_detalle().
+        """
+        from rest_framework.renderers import JSONRenderer
+        from .serializers import ProcedimientoDetailSerializer
+        
+        contenido = JSONRenderer().render(ProcedimientoDetailSerializer(procedimiento).data)
+        instantanea, _ = self.update_or_create(
+            procedimiento_id=procedimiento.pk,
+            version=procedimiento.version,
+            defaults={
+                'contenido': contenido.decode('utf-8'),
+                'etag': hashlib.sha256(contenido).hexdigest(),
+            },
+        )
+        return instantanea
+    
+    def vigente(self, procedimiento):
+        """
+        Instantánea de la versión actual del procedimiento: la precargada en
+        instantaneas_vigentes (Prefetch con to_attr), la guardada o una recién compilada.
+        """
+        instantaneas = getattr(procedimiento, 'instantaneas_vigentes', None)
+        if instantaneas is None:
+            instantaneas = list(self.vigentes().filter(procedimiento_id=procedimiento.pk))
+        if not instantaneas:
+            instantaneas = [self.generar(Procedimiento.objects.para_detalle().get(pk=procedimiento.pk))]
+            procedimiento.instantaneas_vigentes = instantaneas
+        return instantaneas[0]
+    
+    def invalidar(self, *filtros, **kwargs):
+        """
+        Elimina las instantáneas de la versión actual de los procedimientos indicados;
+        se recompilan en la siguiente lectura. Las de versiones anteriores no cambian.
+        """
+        return self.vigentes().filter(*filtros, **kwargs).delete()
+
+
+class InstantaneaProcedimiento(models.Model):
+    """
+    Salida JSON de ProcedimientoDetailSerializer para una versión de un procedimiento.
+    
+    Las lecturas del detalle (y el procedimiento_detalle de los trabajos) se sirven
+    desde aquí con una consulta por clave y un ETag fuerte, en lugar de serializar
+    pasos, documentos y derivados en cada petición. La instantánea de la versión
+    actual se recompila al crear una versión o actualizar el procedimiento, y se
+    invalida si cambian sus pasos, sus documentos o los procedimientos que muestra;
+    las de versiones anteriores quedan como estaban.
+    """
+    procedimiento = models.ForeignKey(Procedimiento, on_delete=models.CASCADE, related_name='instantaneas')
+    version = models.CharField(max_length=10)
+    contenido = models.TextField()
+    # SHA-256 de contenido (en UTF-8)
+    etag = models.CharField(max_length=64)
+    fecha_generacion = models.DateTimeField(auto_now=True)
+    
+    objects = InstantaneaProcedimientoQuerySet.as_manager()
+    
+    class Meta:
+        verbose_name = "Instantánea de Procedimiento"
+        verbose_name_plural = "Instantáneas de Procedimientos"
+        unique_together = ['procedimiento', 'version']
+    
+    def __str__(self):
+        return f"{self.procedimiento_id} - v{self.version}"
+    
+    @property
+    def datos(self):
+        return json.loads(self.contenido)
+
+class TrabajoQuerySet(models.QuerySet):
+    def abrir(self, procedimiento, unidades, usuario_creador, titulo, descripcion=''):
+        """
+        Abre un trabajo del procedimiento en cada una de las unidades indicadas y
+        crea sus pasos. Devuelve la lista de trabajos creados.
+        
+        Todo ocurre en una transacción: los trabajos se insertan con un bulk_create
+        (uno a uno solo si el motor no devuelve las claves de una inserción masiva,
+        como MySQL) y todos los PasoTrabajo con un único bulk_create, con el estado
+        inicial ya calculado: el paso 1 queda PENDIENTE y el resto BLOQUEADO.
+        """
+        pasos = list(procedimiento.pasos.order_by('numero').values_list('id', 'numero', 'tiempo_estimado'))
+        tiempo_estimado_total = sum(dias_estimados(tiempo) for _, _, tiempo in pasos)
+        trabajos = [
+            Trabajo(
+                procedimiento=procedimiento,
+                titulo=titulo,
+                descripcion=descripcion,
+                usuario_creador=usuario_creador,
+                unidad=unidad,
+                estado='INICIADO',
+                pasos_total=len(pasos),
+                pasos_completados=0,
+                tiempo_estimado_total=tiempo_estimado_total,
+            )
+            for unidad in unidades
+        ]
+        
+        with transaction.atomic(using=self.db):
+            if connections[self.db].features.can_return_rows_from_bulk_insert:
+                trabajos = self.bulk_create(trabajos)
+            else:
+                for trabajo in trabajos:
+                    trabajo.save(using=self.db)
+            
+            PasoTrabajo.objects.using(self.db).bulk_create([
+                PasoTrabajo(
+                    trabajo=trabajo,
+                    paso_id=paso_id,
+                    estado='PENDIENTE' if numero == 1 else 'BLOQUEADO',
+                )
+                for trabajo in trabajos
+                for paso_id, numero, _ in pasos
+            ], batch_size=1000)
+        
+        return trabajos
+
 
 class Trabajo(models.Model):
     """
@@ -348,13 +848,51 @@ class Trabajo(models.Model):
     estado = models.CharField(max_length=20, choices=STATUS_CHOICES, default='INICIADO')
     paso_actual = models.PositiveIntegerField(default=1)
     
+    # Contadores desnormalizados para listar trabajos sin consultar sus pasos. Se
+    # fijan al abrir el trabajo y se actualizan con UPDATE atómicos (F()); el
+    # comando recalcular_contadores_trabajos los rellena y verifica.
+    pasos_total = models.PositiveIntegerField(default=0, editable=False)
+    pasos_completados = models.PositiveIntegerField(default=0, editable=False)
+    tiempo_estimado_total = models.FloatField(
+        default=0, editable=False,
+        help_text="Suma en días del tiempo estimado de los pasos del procedimiento"
+    )
+    
+    objects = TrabajoQuerySet.as_manager()
+    
+    CAMPOS_CONTADORES = ('pasos_total', 'pasos_completados', 'tiempo_estimado_total')
+    
     def __str__(self):
         return f"{self.titulo} - {self.procedimiento.nombre}"
     
+    def save(self, *args, **kwargs):
+        # Un guardado completo de una instancia ya existente no escribe los
+        # contadores: su valor en memoria puede estar desfasado respecto a los
+        # incrementos atómicos hechos mientras tanto
+        if not self._state.adding and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            kwargs['update_fields'] = [
+                campo.name for campo in self._meta.concrete_fields
+                if not campo.primary_key and campo.name not in self.CAMPOS_CONTADORES
+            ]
+        super().save(*args, **kwargs)
+    
+    @property
+    def progreso(self):
+        """Porcentaje de pasos completados, calculado con los contadores"""
+        if not self.pasos_total:
+            return 0
+        return int((self.pasos_completados / self.pasos_total) * 100)
+    
     class Meta:
         verbose_name = "Trabajo"
         verbose_name_plural = "Trabajos"
         ordering = ['-fecha_inicio']
+        indexes = [
+            # Listado paginado por cursor: todos los trabajos (administradores) o los
+            # de una unidad
+            models.Index(fields=['-fecha_inicio', '-id'], name='trabajo_fecha_inicio_idx'),
+            models.Index(fields=['unidad', '-fecha_inicio', '-id'], name='trabajo_unidad_fecha_idx'),
+        ]
 
     def completar_trabajo(self):
         """Marca el trabajo como completado y establece la fecha de fin"""
@@ -385,6 +923,59 @@ class Trabajo(models.Model):
         return timezone.now() - self.fecha_inicio
 
 
+# Días de antelación con los que un paso se considera próximo a vencer
+DIAS_AVISO_PLAZO = 3
+
+
+def es_propio(usuario, prefijo=''):
+    """Expresión booleana: el trabajo (accesible con prefijo) lo inició o lo creó el usuario"""
+    return models.Case(
+        models.When(
+            models.Q(**{f'{prefijo}usuario_iniciado': usuario}) | models.Q(**{f'{prefijo}usuario_creador': usuario}),
+            then=models.Value(True),
+        ),
+        default=models.Value(False),
+        output_field=models.BooleanField(),
+    )
+
+
+class PasoTrabajoQuerySet(models.QuerySet):
+    def alertas_plazo(self, usuario=None, propios_primero=True, dias_aviso=DIAS_AVISO_PLAZO):
+        """
+        Pasos iniciados (pendientes o en progreso) de trabajos activos que ya han
+        vencido o vencen en los próximos dias_aviso días, con el paso, el trabajo, sus
+        usuarios y su unidad cargados en la misma consulta.
+        
+        Los días se cuentan por fecha (UTC): la ventana es fecha_limite anterior al
+        inicio del día hoy + dias_aviso + 1, un rango sobre el índice (estado,
+        fecha_limite). Cada fila lleva dia_limite (fecha de fecha_limite). Se ordena
+        por dia_limite, antes los vencidos, y dentro del mismo día por trabajo (más
+        reciente primero) y número de paso. Con usuario se anota además es_propio (el
+        trabajo lo inició o lo creó el usuario) y, con propios_primero, los pasos
+        propios van delante.
+        """
+        inicio_hoy = timezone.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        pasos = self.filter(
+            estado__in=['PENDIENTE', 'EN_PROGRESO'],
+            fecha_inicio__isnull=False,
+            fecha_limite__lt=inicio_hoy + timezone.timedelta(days=dias_aviso + 1),
+            paso__tiempo_estimado__gt=0,
+        ).exclude(
+            trabajo__estado__in=['COMPLETADO', 'CANCELADO'],
+        ).select_related(
+            'paso', 'trabajo__usuario_iniciado', 'trabajo__usuario_creador', 'trabajo__unidad',
+        ).annotate(
+            dia_limite=TruncDate('fecha_limite', tzinfo=dt_timezone.utc),
+        )
+        
+        orden = ['dia_limite', '-trabajo__fecha_inicio', 'trabajo_id', 'paso__numero']
+        if usuario is not None:
+            pasos = pasos.annotate(es_propio=es_propio(usuario, 'trabajo__'))
+            if propios_primero:
+                orden.insert(0, '-es_propio')
+        return pasos.order_by(*orden)
+
+
 class PasoTrabajo(models.Model):
     """
     Representa un paso específico dentro de un trabajo.
@@ -406,27 +997,53 @@ class PasoTrabajo(models.Model):
                                          related_name='pasos_completados', blank=True, null=True)
     notas = models.TextField(blank=True, null=True)
     bifurcacion_elegida = models.IntegerField(blank=True, null=True) # ID del paso elegido en una bifurcación
+    # Fecha límite guardada al iniciar el paso (fecha_inicio + tiempo estimado), para
+    # poder filtrar pasos vencidos o próximos a vencer con un rango indexado
+    fecha_limite = models.DateTimeField(blank=True, null=True, editable=False)
+    
+    objects = PasoTrabajoQuerySet.as_manager()
     
     class Meta:
         verbose_name = "Paso de Trabajo"
         verbose_name_plural = "Pasos de Trabajo"
         ordering = ['paso__numero']
+        indexes = [
+            models.Index(fields=['estado', 'fecha_limite'], name='pasotrabajo_estado_limite_idx'),
+        ]
         
     def __str__(self):
         return f"Paso {self.paso.numero}: {self.paso.titulo} - {self.trabajo.titulo}"
     
+    def save(self, *args, **kwargs):
+        # Un paso con fecha de inicio pero sin fecha límite (iniciado por otra vía
+        # que iniciar_paso) la obtiene al guardarse
+        if self.fecha_inicio and self.fecha_limite is None:
+            self.fecha_limite = self.calcular_fecha_limite()
+            if self.fecha_limite and kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = set(kwargs['update_fields']) | {'fecha_limite'}
+        super().save(*args, **kwargs)
+    
+    def calcular_fecha_limite(self):
+        """fecha_inicio más el tiempo estimado del paso, o None si falta alguno"""
+        if not self.fecha_inicio or not self.paso.tiempo_estimado:
+            return None
+        return self.fecha_inicio + timezone.timedelta(days=float(self.paso.tiempo_estimado))
+    
     def iniciar_paso(self, usuario):
-        """Marca el paso como iniciado"""
+        """Marca el paso como iniciado y fija su fecha límite"""
         self.estado = 'EN_PROGRESO'
         self.fecha_inicio = timezone.now()
+        self.fecha_limite = self.calcular_fecha_limite()
         self.save()
         
     def completar_paso(self, usuario):
         """Marca el paso como completado"""
+        estado_anterior = self.estado
         self.estado = 'COMPLETADO'
         self.fecha_fin = timezone.now()
         self.usuario_completado = usuario
         self.save()
+        self.actualizar_contador_trabajo(estado_anterior)
         
         # Verificar si es el último paso o si es un paso marcado como final
         if self.paso.es_final:
@@ -450,23 +1067,25 @@ class PasoTrabajo(models.Model):
                 siguiente_paso.estado = 'PENDIENTE'
                 siguiente_paso.save()
 
+    def actualizar_contador_trabajo(self, estado_anterior):
+        """
+        Ajusta Trabajo.pasos_completados tras un cambio de estado del paso, con un
+        UPDATE atómico en la base de datos (y el mismo ajuste en la instancia cargada).
+        """
+        incremento = int(self.estado == 'COMPLETADO') - int(estado_anterior == 'COMPLETADO')
+        if not incremento:
+            return
+        
+        Trabajo.objects.filter(pk=self.trabajo_id).update(
+            pasos_completados=models.F('pasos_completados') + incremento
+        )
+        if PasoTrabajo.trabajo.is_cached(self):
+            self.trabajo.pasos_completados += incremento
+    
     @property
     def paso_numero(self):
         return self.paso.numero
 
-    @property
-    def fecha_limite(self):
-        """Calcula la fecha límite basada en fecha_inicio y tiempo_estimado del paso"""
-        if not self.fecha_inicio or not self.paso.tiempo_estimado:
-            return None
-            
-        # Convertir tiempo_estimado a float y calcular días
-        try:
-            tiempo_estimado_dias = float(self.paso.tiempo_estimado)
-            return self.fecha_inicio + timezone.timedelta(days=tiempo_estimado_dias)
-        except (ValueError, TypeError):
-            return None
-    
     @property
     def proximo_a_vencer(self):
         """Determina si un paso está próximo a vencer (2 días o menos)"""
@@ -508,4 +1127,418 @@ class EnvioPaso(models.Model):
         
     class Meta:
         verbose_name = "Envío de Paso"
-        verbose_name_plural = "Envíos de Pasos"
\ No newline at end of file
+        verbose_name_plural = "Envíos de Pasos"
+
+
+class SubidaFragmentadaError(Exception):
+    """La subida no se puede finalizar o el fragmento no encaja en ella"""
+
+
+class FragmentoFueraDeOrden(SubidaFragmentadaError):
+    """El fragmento no empieza donde termina lo recibido (otra petición ya lo ha escrito)"""
+
+
+class FicheroSubido(File):
+    # FileSystemStorage mueve (renombra) los ficheros con temporary_file_path en lugar
+    # de copiarlos
+    def temporary_file_path(self):
+        return self.file.name
+
+
+class SubidaFragmentadaQuerySet(models.QuerySet):
+    def caducadas(self, horas):
+        """Subidas sin fragmentos nuevos en las últimas horas"""
+        return self.filter(fecha_actualizacion__lt=timezone.now() - timezone.timedelta(hours=horas))
+
+
+class SubidaFragmentada(models.Model):
+    """
+    Subida reanudable de un fichero grande (la documentación de un EnvioPaso) en varias
+    peticiones. Cada fragmento se escribe en disco a continuación de lo recibido; si la
+    conexión se corta, el cliente continúa desde recibido. Una vez finalizada, su id se
+    indica al completar el paso y el fichero pasa al envío.
+    """
+    usuario = models.ForeignKey(Usuario, on_delete=models.CASCADE, related_name='subidas_fragmentadas')
+    nombre = models.CharField(max_length=255)
+    tamano = models.PositiveBigIntegerField()
+    recibido = models.PositiveBigIntegerField(default=0)
+    finalizada = models.DateTimeField(null=True, blank=True)
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+    fecha_actualizacion = models.DateTimeField(auto_now=True)
+    
+    objects = SubidaFragmentadaQuerySet.as_manager()
+    
+    class Meta:
+        verbose_name = "Subida fragmentada"
+        verbose_name_plural = "Subidas fragmentadas"
+    
+    def __str__(self):
+        return f"{self.nombre} ({self.recibido}/{self.tamano} bytes)"
+    
+    @property
+    def ruta(self):
+        """Fichero en disco donde se reúnen los fragmentos"""
+        # Fuera de MEDIA_ROOT (SUBIDAS_DIRECTORIO): un fichero a medias no se descarga
+        return os.path.join(settings.SUBIDAS_DIRECTORIO, f'{self.pk}.parcial')
+    
+    def escribir(self, flujo, offset, longitud):
+        """
+        Escribe en el fichero, a partir de offset, los longitud bytes que se leen de flujo
+        (el cuerpo de la petición) por bloques. Lo escrito cuenta aunque la conexión se
+        corte a mitad. Lanza FragmentoFueraDeOrden si offset no es lo recibido o si otra
+        petición está escribiendo en la subida.
+        """
+        if offset != self.recibido:
+            raise FragmentoFueraDeOrden
+        os.makedirs(os.path.dirname(self.ruta), mode=0o700, exist_ok=True)
+        
+        with open(os.open(self.ruta, os.O_WRONLY | os.O_CREAT, 0o600), 'wb') as destino:
+            # Una sola petición escribe a la vez (el bloqueo se libera al cerrar): dos
+            # reintentos del mismo fragmento no pueden escribir a la vez en el fichero.
+            # Sin soporte de bloqueos en la plataforma (LOCK_EX es 0) no se bloquea
+            if not locks.lock(destino, locks.LOCK_EX | locks.LOCK_NB) and locks.LOCK_EX:
+                raise FragmentoFueraDeOrden
+            # Con el fichero bloqueado, lo recibido puede haber avanzado entre tanto
+            self.recibido = SubidaFragmentada.objects.values_list('recibido', flat=True).get(pk=self.pk)
+            if offset != self.recibido:
+                raise FragmentoFueraDeOrden
+            
+            escrito = 0
+            try:
+                destino.seek(offset)
+                while escrito < longitud:
+                    bloque = flujo.read(min(TAMANO_BLOQUE, longitud - escrito))
+                    if not bloque:
+                        break
+                    destino.write(bloque)
+                    escrito += len(bloque)
+                destino.flush()
+            finally:
+                actualizadas = SubidaFragmentada.objects.filter(pk=self.pk, recibido=offset).update(
+                    recibido=offset + escrito, fecha_actualizacion=timezone.now()
+                )
+        if not actualizadas:
+            # La subida ha vuelto a empezar (finalizar con otro SHA-256) mientras se escribía
+            raise FragmentoFueraDeOrden
+        self.recibido = offset + escrito
+    
+    def finalizar(self, sha256=None):
+        """
+        Da la subida por completa. Con sha256 (calculado por el cliente) se comprueba
+        antes el contenido; si no coincide, lo recibido se descarta para empezar de nuevo.
+        """
+        if self.recibido != self.tamano:
+            raise SubidaFragmentadaError(f"Faltan {self.tamano - self.recibido} bytes por recibir")
+        if sha256:
+            with open(self.ruta, 'rb') as fichero:
+                calculado, _ = volcar_con_hash(File(fichero))
+            if calculado != sha256.lower():
+                self.recibido = 0
+                self.save(update_fields=['recibido', 'fecha_actualizacion'])
+                raise SubidaFragmentadaError("El contenido no coincide con el SHA-256 indicado: la subida vuelve a empezar")
+        self.finalizada = timezone.now()
+        self.save(update_fields=['finalizada', 'fecha_actualizacion'])
+    
+    def adjuntar(self, campo):
+        """
+        Pasa el fichero de la subida finalizada al FileField campo, con su nombre
+        original, sin guardar la instancia. En el almacenamiento local se mueve.
+        """
+        with open(self.ruta, 'rb') as fichero:
+            campo.save(self.nombre, FicheroSubido(fichero), save=False)
+
+
+class AlertaPlazoQuerySet(models.QuerySet):
+    def refrescar(self, trabajos=None):
+        """
+        Recalcula la tabla de alertas a partir de PasoTrabajo.objects.alertas_plazo()
+        y devuelve el número de alertas escritas.
+        
+        Sin trabajos se rehace la tabla completa (refresco periódico); con trabajos
+        (ids o queryset) solo las alertas de esos trabajos, que es lo que se hace al
+        iniciar o completar un paso. Borrado e inserción van en una transacción, de
+        modo que los lectores ven las alertas anteriores o las nuevas, nunca una
+        tabla a medias.
+        
+        Antes de calcular se bloquean los trabajos afectados (todos en el refresco
+        completo): dos refrescos que coinciden se ejecutan uno tras otro y el segundo
+        calcula con los cambios ya confirmados, de modo que un refresco completo no
+        puede reponer la alerta de un paso que otro acaba de completar.
+        """
+        pasos = PasoTrabajo.objects.alertas_plazo()
+        actuales = self.all()
+        bloqueados = Trabajo.objects.using(self.db).select_for_update().order_by('pk')
+        if trabajos is not None:
+            pasos = pasos.filter(trabajo__in=trabajos)
+            actuales = actuales.filter(trabajo__in=trabajos)
+            bloqueados = bloqueados.filter(pk__in=trabajos)
+        
+        with transaction.atomic(using=self.db):
+            list(bloqueados.values_list('pk', flat=True))
+            alertas = [AlertaPlazo.desde_paso(paso) for paso in pasos]
+            anteriores = {
+                fila['paso_trabajo_id']: fila
+                for fila in actuales.order_by().values(
+                    'paso_trabajo_id', 'trabajo_id', 'unidad_id', 'fecha_limite', 'estado', 'fecha_calculo'
+                )
+            }
+            actuales.delete()
+            self.bulk_create(alertas, batch_size=1000)
+            transaction.on_commit(lambda: publicar_cambios_alertas(anteriores, alertas), using=self.db)
+        return len(alertas)
+    
+    def para_usuario(self, usuario, propios_primero=True):
+        """Alertas anotadas con es_propio y ordenadas como alertas_plazo()"""
+        orden = ['fecha_limite', '-trabajo_id', 'paso_numero']
+        if propios_primero:
+            orden.insert(0, '-es_propio')
+        return self.annotate(es_propio=es_propio(usuario)).order_by(*orden)
+
+
+class AlertaPlazo(models.Model):
+    """
+    Alerta precalculada de un paso vencido o próximo a vencer.
+    
+    Guarda ya resueltos los datos que muestra el frontend (títulos, responsable,
+    unidad), de modo que el endpoint de alertas, consultado periódicamente por cada
+    cliente, es una lectura por unidad sobre el índice (unidad, fecha_limite). La
+    tabla se rehace con el comando refrescar_alertas_plazos y se actualiza por
+    trabajo al iniciar o completar sus pasos. Los días restantes se calculan al leer.
+    """
+    paso_trabajo = models.OneToOneField(PasoTrabajo, on_delete=models.CASCADE, related_name='alerta_plazo')
+    trabajo = models.ForeignKey(Trabajo, on_delete=models.CASCADE, related_name='alertas_plazo')
+    unidad = models.ForeignKey(Unidad, on_delete=models.CASCADE, related_name='alertas_plazo')
+    usuario_creador = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL,
+                                        related_name='+', blank=True, null=True)
+    usuario_iniciado = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL,
+                                         related_name='+', blank=True, null=True)
+    fecha_limite = models.DateField(help_text="Fecha (UTC) en la que vence el paso")
+    estado = models.CharField(max_length=20, choices=PasoTrabajo.STATUS_CHOICES)
+    trabajo_titulo = models.CharField(max_length=200)
+    paso_numero = models.IntegerField()
+    paso_titulo = models.CharField(max_length=200)
+    tiempo_estimado = models.DecimalField(max_digits=6, decimal_places=2)
+    usuario_asignado = models.CharField(max_length=150, blank=True, null=True)
+    responsable_nombre = models.CharField(max_length=255, blank=True, null=True)
+    unidad_nombre = models.CharField(max_length=255, blank=True, null=True)
+    fecha_calculo = models.DateTimeField(auto_now=True)
+    
+    objects = AlertaPlazoQuerySet.as_manager()
+    
+    class Meta:
+        verbose_name = "Alerta de plazo"
+        verbose_name_plural = "Alertas de plazo"
+        ordering = ['fecha_limite']
+        indexes = [
+            models.Index(fields=['unidad', 'fecha_limite'], name='alertaplazo_unidad_limite_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.trabajo_titulo} - Paso {self.paso_numero} ({self.fecha_limite})"
+    
+    def datos(self, hoy):
+        """Datos de la alerta tal y como los espera el frontend (sin es_propio, que depende del usuario)"""
+        dias_restantes = (self.fecha_limite - hoy).days
+        return {
+            'trabajo_id': self.trabajo_id,
+            'trabajo_titulo': self.trabajo_titulo,
+            'paso_id': self.paso_trabajo_id,
+            'paso_numero': self.paso_numero,
+            'paso_titulo': self.paso_titulo,
+            'fecha_limite': self.fecha_limite,
+            # Días restantes (negativos si ya venció)
+            'dias_restantes': dias_restantes,
+            'vencido': dias_restantes < 0,
+            'estado': self.estado,
+            'tiempo_estimado': float(self.tiempo_estimado),
+            # Usuario asignado y nombre completo del responsable
+            'usuario_asignado': self.usuario_asignado,
+            'responsable_nombre': self.responsable_nombre,
+            'unidad_nombre': self.unidad_nombre,
+            'unidad_id': self.unidad_id,
+        }
+    
+    @classmethod
+    def desde_paso(cls, paso):
+        """Alerta (sin guardar) de un paso obtenido con PasoTrabajo.objects.alertas_plazo()"""
+        trabajo = paso.trabajo
+        responsable = trabajo.usuario_iniciado or trabajo.usuario_creador
+        return cls(
+            paso_trabajo=paso,
+            trabajo=trabajo,
+            unidad_id=trabajo.unidad_id,
+            usuario_creador_id=trabajo.usuario_creador_id,
+            usuario_iniciado_id=trabajo.usuario_iniciado_id,
+            fecha_limite=paso.dia_limite,
+            estado=paso.estado,
+            trabajo_titulo=trabajo.titulo,
+            paso_numero=paso.paso.numero,
+            paso_titulo=paso.paso.titulo or f"Paso {paso.paso.numero}",
+            tiempo_estimado=paso.paso.tiempo_estimado,
+            usuario_asignado=responsable.username if responsable else None,
+            responsable_nombre=responsable.get_full_name() if responsable else None,
+            unidad_nombre=trabajo.unidad.nombre,
+        )
+
+
+class EventoAlertaQuerySet(models.QuerySet):
+    def caducados(self, horas=24):
+        """Eventos publicados hace más de las horas indicadas"""
+        return self.filter(fecha__lt=timezone.now() - timezone.timedelta(hours=horas))
+
+
+class EventoAlerta(models.Model):
+    """
+    Cambio de una alerta de plazos publicado por BrokerBaseDatos (ver eventos.py). La
+    tabla comunica los procesos que recalculan las alertas con los que sirven
+    alertas-plazos/stream/; los eventos de las últimas horas permiten reenviar los
+    perdidos a un cliente que reconecta.
+    """
+    tipo = models.CharField(max_length=20)
+    canales = models.JSONField()
+    datos = models.JSONField(encoder=DjangoJSONEncoder)
+    fecha = models.DateTimeField(auto_now_add=True, db_index=True)
+    
+    objects = EventoAlertaQuerySet.as_manager()
+    
+    class Meta:
+        verbose_name = "Evento de alerta"
+        verbose_name_plural = "Eventos de alertas"
+
+
+def publicar_cambios_alertas(anteriores, alertas):
+    """
+    Publica las diferencias entre las alertas anteriores (filas de values()) y las
+    recién calculadas: 'baja' para las que desaparecen y 'alerta' para las nuevas,
+    las que cambian de fecha, estado o unidad y las que han vencido desde su último
+    cálculo. Los datos de 'alerta' incluyen 'propietarios' (creador e iniciador del
+    trabajo) para que cada suscriptor calcule es_propio.
+    """
+    hoy = timezone.now().date()
+    nuevas = {alerta.paso_trabajo_id: alerta for alerta in alertas}
+    
+    for paso_id, fila in anteriores.items():
+        alerta = nuevas.get(paso_id)
+        if alerta is None or alerta.unidad_id != fila['unidad_id']:
+            publicar_alerta('baja', fila['unidad_id'], {
+                'paso_id': paso_id, 'trabajo_id': fila['trabajo_id'], 'unidad_id': fila['unidad_id'],
+            })
+    
+    for paso_id, alerta in nuevas.items():
+        fila = anteriores.get(paso_id)
+        cambiada = fila is None or (
+            (fila['fecha_limite'], fila['estado'], fila['unidad_id'])
+            != (alerta.fecha_limite, alerta.estado, alerta.unidad_id)
+        )
+        vencida = fila is not None and fila['fecha_calculo'].date() <= alerta.fecha_limite < hoy
+        if cambiada or vencida:
+            publicar_alerta('alerta', alerta.unidad_id, {
+                **alerta.datos(hoy),
+                'propietarios': [alerta.usuario_creador_id, alerta.usuario_iniciado_id],
+            })
+
+
+def recalcular_fechas_limite(paso):
+    """
+    Tras cambiar el tiempo estimado de paso, recalcula en un UPDATE la fecha límite de
+    sus PasoTrabajo iniciados y sin completar (fecha_inicio + el nuevo tiempo, como
+    calcular_fecha_limite) y rehace las alertas de sus trabajos.
+    """
+    iniciados = PasoTrabajo.objects.filter(paso=paso, fecha_inicio__isnull=False).exclude(estado='COMPLETADO')
+    trabajos = list(iniciados.order_by().values_list('trabajo_id', flat=True).distinct())
+    if not trabajos:
+        return
+    fecha_limite = None
+    if dias_estimados(paso.tiempo_estimado):
+        fecha_limite = models.ExpressionWrapper(
+            models.F('fecha_inicio') + timezone.timedelta(days=dias_estimados(paso.tiempo_estimado)),
+            output_field=models.DateTimeField(),
+        )
+    iniciados.update(fecha_limite=fecha_limite)
+    AlertaPlazo.objects.refrescar(trabajos=trabajos)
+
+
+@receiver(post_save, sender=Paso)
+@receiver(post_delete, sender=Paso)
+def actualizar_tiempo_estimado_trabajos(sender, instance, signal, created=False, update_fields=None, **kwargs):
+    """
+    Mantiene Trabajo.tiempo_estimado_total al añadir, modificar o eliminar pasos del
+    procedimiento: una consulta para sumar los tiempos y un UPDATE de sus trabajos.
+    Solo cuando cambia el total: no al renumerar pasos ni al editar otros campos. Si
+    cambia el tiempo de un paso existente, también las fechas límite de sus pasos de
+    trabajo en curso (recalcular_fechas_limite).
+    """
+    if signal is post_save and not created:
+        if update_fields is not None and 'tiempo_estimado' not in update_fields:
+            return
+        # Sin valor cargado (instancia no leída de la base de datos) se recalcula
+        cargado = hasattr(instance, '_tiempo_cargado')
+        anterior = getattr(instance, '_tiempo_cargado', None)
+        instance._tiempo_cargado = instance.tiempo_estimado
+        if cargado and dias_estimados(anterior) == dias_estimados(instance.tiempo_estimado):
+            return
+        recalcular_fechas_limite(instance)
+    else:
+        instance._tiempo_cargado = instance.tiempo_estimado
+        # Un paso sin tiempo estimado no cambia el total al crearse ni al eliminarse
+        if not dias_estimados(instance.tiempo_estimado):
+            return
+    
+    tiempos = Paso.objects.filter(procedimiento_id=instance.procedimiento_id).values_list('tiempo_estimado', flat=True)
+    Trabajo.objects.filter(procedimiento_id=instance.procedimiento_id).update(
+        tiempo_estimado_total=sum(dias_estimados(tiempo) for tiempo in tiempos)
+    )
+
+
+@receiver(post_save, sender=Procedimiento)
+@receiver(pre_delete, sender=Procedimiento)
+def invalidar_instantaneas_procedimiento(sender, instance, **kwargs):
+    """
+    Un procedimiento aparece en su propia instantánea, en la de su procedimiento
+    relacionado (derivados) y en las de sus derivados (procedimiento_relacionado_info).
+    Al borrarlo se invalida antes, mientras los derivados aún lo referencian.
+    """
+    ids = {instance.pk, instance.procedimiento_relacionado_id, getattr(instance, '_relacionado_cargado', None)}
+    InstantaneaProcedimiento.objects.invalidar(
+        models.Q(procedimiento_id__in=ids - {None}) | models.Q(procedimiento__procedimiento_relacionado=instance.pk)
+    )
+    instance._relacionado_cargado = instance.procedimiento_relacionado_id
+
+
+@receiver(post_save, sender=TipoProcedimiento)
+def invalidar_instantaneas_tipo(sender, instance, **kwargs):
+    InstantaneaProcedimiento.objects.invalidar(procedimiento__tipo=instance.pk)
+
+
+@receiver(post_save, sender=Paso)
+@receiver(post_delete, sender=Paso)
+def invalidar_instantaneas_paso(sender, instance, **kwargs):
+    InstantaneaProcedimiento.objects.invalidar(procedimiento_id=instance.procedimiento_id)
+
+
+@receiver(post_save, sender=DocumentoPaso)
+@receiver(post_delete, sender=DocumentoPaso)
+def invalidar_instantaneas_documento_paso(sender, instance, **kwargs):
+    InstantaneaProcedimiento.objects.invalidar(procedimiento__pasos=instance.paso_id)
+
+
+@receiver(post_delete, sender=Documento)
+def liberar_blob_documento(sender, instance, **kwargs):
+    # También al borrarse en cascada (con su procedimiento), sin pasar por delete()
+    if instance.blob_id:
+        Blob.objects.liberar(instance.blob_id)
+
+
+@receiver(post_save, sender=Documento)
+def invalidar_instantaneas_documento(sender, instance, **kwargs):
+    # Al borrarlo se borran sus DocumentoPaso, que ya invalidan
+    InstantaneaProcedimiento.objects.invalidar(procedimiento__pasos__documento_paso__documento=instance.pk)
+
+
+@receiver(post_delete, sender=SubidaFragmentada)
+def borrar_fichero_subida(sender, instance, **kwargs):
+    # Cancelada o caducada; si ya se ha adjuntado a un envío, el fichero se ha movido
+    try:
+        os.remove(instance.ruta)
+    except FileNotFoundError:
+        pass
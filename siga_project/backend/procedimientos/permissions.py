@@ -43,21 +43,21 @@ class IsOwnerOrSameUnit(permissions.BasePermission):
         # Verificar si el objeto tiene usuario_creador
         if hasattr(obj, 'usuario_creador'):
             # Permitir al creador del trabajo
-            if obj.usuario_creador == request.user:
+            if obj.usuario_creador_id == request.user.pk:
                 return True
             
-            # Permitir a usuarios de la misma unidad
-            if hasattr(request.user, 'unidad_destino') and request.user.unidad_destino:
-                return obj.unidad == request.user.unidad_destino
+            # Permitir a usuarios de la misma unidad (comparando ids, sin cargar las unidades)
+            if getattr(request.user, 'unidad_destino_id', None):
+                return obj.unidad_id == request.user.unidad_destino_id
         
         # Para PasoTrabajo, verificar por trabajo
         if hasattr(obj, 'trabajo'):
             # Permitir al creador del trabajo
-            if obj.trabajo.usuario_creador == request.user:
+            if obj.trabajo.usuario_creador_id == request.user.pk:
                 return True
             
             # Permitir a usuarios de la misma unidad
-            if hasattr(request.user, 'unidad_destino') and request.user.unidad_destino:
-                return obj.trabajo.unidad == request.user.unidad_destino
+            if getattr(request.user, 'unidad_destino_id', None):
+                return obj.trabajo.unidad_id == request.user.unidad_destino_id
         
         return False
\ No newline at end of file
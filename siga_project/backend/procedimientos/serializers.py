@@ -1,6 +1,23 @@
+import os
+from urllib.parse import urlencode
+from django.conf import settings
+from django.urls import reverse
 from rest_framework import serializers
-from .models import Procedimiento, TipoProcedimiento, Paso, Documento, DocumentoPaso, HistorialProcedimiento, Trabajo, PasoTrabajo, EnvioPaso
+from .models import Procedimiento, TipoProcedimiento, Paso, Documento, DocumentoPaso, HistorialProcedimiento, InstantaneaProcedimiento, Trabajo, PasoTrabajo, EnvioPaso, SubidaFragmentada
 from users.serializers import UserSerializer
+from unidades.models import Unidad
+
+def url_archivo(request, nombre, **parametros):
+    """
+    URL de download_document para el fichero nombre de MEDIA_ROOT, absoluta si hay
+    petición. Pide usuario autenticado: para abrirla desde un enlace, el frontend obtiene
+    antes una URL firmada con firmar_descarga. MEDIA_URL no se sirve.
+    """
+    url = reverse('download_document', args=[nombre])
+    if parametros:
+        url += '?' + urlencode(parametros)
+    return request.build_absolute_uri(url) if request else url
+
 
 class TipoProcedimientoSerializer(serializers.ModelSerializer):
     class Meta:
@@ -8,22 +25,24 @@ class TipoProcedimientoSerializer(serializers.ModelSerializer):
         fields = ['id', 'nombre', 'descripcion']
 
 class DocumentoSerializer(serializers.ModelSerializer):
-    procedimiento_id = serializers.IntegerField(source='procedimiento.id', read_only=True, allow_null=True)
+    # procedimiento_id del propio documento, sin cargar el procedimiento
+    procedimiento_id = serializers.IntegerField(read_only=True, allow_null=True)
     archivo_url = serializers.SerializerMethodField()
     
     class Meta:
         model = Documento
-        fields = ['id', 'nombre', 'descripcion', 'procedimiento', 'procedimiento_id', 'archivo', 'archivo_url', 'url', 'extension', 'fecha_creacion', 'fecha_actualizacion']
+        fields = ['id', 'nombre', 'descripcion', 'procedimiento', 'procedimiento_id', 'archivo', 'archivo_url', 'url', 'extension', 'tipo_documento', 'fecha_creacion', 'fecha_actualizacion']
         extra_kwargs = {
             'archivo': {'write_only': True, 'required': False},
+            # Los ficheros se guardan por contenido (blobs): la ruta ya no indica si el
+            # documento es general o de un paso
+            'tipo_documento': {'read_only': True},
         }
     
     def get_archivo_url(self, obj):
         if obj.archivo:
-            request = self.context.get('request')
-            if request:
-                return request.build_absolute_uri(obj.archivo.url)
-            return obj.archivo.url
+            # Con el documento, para descargarlo con su nombre aunque comparta el blob
+            return url_archivo(self.context.get('request'), obj.archivo.name, documento=obj.pk)
         return None
 
     def create(self, validated_data):
@@ -62,8 +81,26 @@ class DocumentoPasoSerializer(serializers.ModelSerializer):
     def get_documento_detalle(self, obj):
         return DocumentoSerializer(obj.documento).data
 
+class DiasField(serializers.DecimalField):
+    """Duración en días: numérica en las respuestas y vacía ('') equivalente a null"""
+    
+    def __init__(self, **kwargs):
+        kwargs.setdefault('max_digits', 6)
+        kwargs.setdefault('decimal_places', 2)
+        kwargs.setdefault('min_value', 0)
+        kwargs.setdefault('coerce_to_string', False)
+        kwargs.setdefault('allow_null', True)
+        kwargs.setdefault('required', False)
+        super().__init__(**kwargs)
+    
+    def run_validation(self, data=serializers.empty):
+        if isinstance(data, str) and not data.strip():
+            data = None
+        return super().run_validation(data)
+
 class PasoSerializer(serializers.ModelSerializer):
     documentos = serializers.SerializerMethodField(read_only=True)
+    tiempo_estimado = DiasField()
     documentos_ids = serializers.ListField(
         child=serializers.IntegerField(), 
         write_only=True,
@@ -80,9 +117,8 @@ class PasoSerializer(serializers.ModelSerializer):
         """
         Obtiene los documentos asociados al paso y los serializa.
         """
-        from .models import DocumentoPaso
-        documentos_paso = DocumentoPaso.objects.filter(paso=obj)
-        return DocumentoPasoSerializer(documentos_paso, many=True).data
+        # Usa los documentos precargados (prefetch de documento_paso__documento) si los hay
+        return DocumentoPasoSerializer(obj.documento_paso.all(), many=True).data
 
 class HistorialProcedimientoSerializer(serializers.ModelSerializer):
     usuario_detalle = UserSerializer(source='usuario', read_only=True)
@@ -95,13 +131,16 @@ class HistorialProcedimientoSerializer(serializers.ModelSerializer):
 class ProcedimientoListSerializer(serializers.ModelSerializer):
     tipo_nombre = serializers.CharField(source='tipo.nombre', read_only=True)
     nivel_display = serializers.SerializerMethodField()
+    es_inicio_proceso = serializers.BooleanField(read_only=True)
+    es_fin_proceso = serializers.BooleanField(read_only=True)
     
     class Meta:
         model = Procedimiento
         fields = [
             'id', 'nombre', 'descripcion', 'tipo', 'nivel', 'estado',
             'fecha_actualizacion', 'version', 'tipo_nombre', 'nivel_display',
-            'procedimiento_relacionado', 'tiempo_maximo'  # Añadir tiempo_maximo aquí
+            'procedimiento_relacionado', 'tiempo_maximo',  # Añadir tiempo_maximo aquí
+            'es_inicio_proceso', 'es_fin_proceso'
         ]
     
     def get_nivel_display(self, obj):
@@ -130,6 +169,8 @@ class ProcedimientoDetailSerializer(serializers.ModelSerializer):
     pasos = PasoSerializer(many=True, read_only=True)
     procedimiento_relacionado_info = serializers.SerializerMethodField(read_only=True)
     procedimientos_derivados = serializers.SerializerMethodField(read_only=True)
+    es_inicio_proceso = serializers.BooleanField(read_only=True)
+    es_fin_proceso = serializers.BooleanField(read_only=True)
     
     class Meta:
         model = Procedimiento
@@ -137,7 +178,18 @@ class ProcedimientoDetailSerializer(serializers.ModelSerializer):
                   'estado', 'version', 'fecha_creacion', 'fecha_actualizacion', 
                   'creado_por', 'actualizado_por', 'pasos', 
                   'procedimiento_relacionado', 'procedimiento_relacionado_info',
-                  'procedimientos_derivados', 'tiempo_maximo']
+                  'procedimientos_derivados', 'tiempo_maximo',
+                  'es_inicio_proceso', 'es_fin_proceso']
+    
+    def validate_procedimiento_relacionado(self, value):
+        # Impedir ciclos: el destino no puede ser el propio procedimiento ni uno que
+        # ya se envíe (directa o indirectamente) a este
+        if value is not None and self.instance is not None:
+            if value.pk == self.instance.pk or self.instance.pk in Procedimiento.objects.ids_superiores(value.pk):
+                raise serializers.ValidationError(
+                    "El procedimiento relacionado no puede ser el propio procedimiento ni uno de sus derivados"
+                )
+        return value
     
     def get_procedimiento_relacionado_info(self, obj):
         if (obj.procedimiento_relacionado):
@@ -150,15 +202,13 @@ class ProcedimientoDetailSerializer(serializers.ModelSerializer):
         return None
     
     def get_procedimientos_derivados(self, obj):
-        derivados = Procedimiento.objects.filter(procedimiento_relacionado=obj)
-        if derivados.exists():
-            return [{
-                'id': proc.id,
-                'nombre': proc.nombre,
-                'nivel': proc.nivel,
-                'nivel_display': proc.get_nivel_display()
-            } for proc in derivados]
-        return []
+        # Con el queryset de la vista los derivados ya vienen precargados
+        return [{
+            'id': proc.id,
+            'nombre': proc.nombre,
+            'nivel': proc.nivel,
+            'nivel_display': proc.get_nivel_display()
+        } for proc in obj.procedimientos_derivados.all()]
 
 class ProcedimientoSerializer(serializers.ModelSerializer):
     # Campos existentes
@@ -182,6 +232,33 @@ class EnvioPasoSerializer(serializers.ModelSerializer):
     class Meta:
         model = EnvioPaso
         fields = ['id', 'numero_salida', 'fecha_envio', 'documentacion', 'notas_adicionales']
+    
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        if instance.documentacion:
+            data['documentacion'] = url_archivo(self.context.get('request'), instance.documentacion.name)
+        return data
+
+
+class SubidaFragmentadaSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = SubidaFragmentada
+        fields = ['id', 'nombre', 'tamano', 'recibido', 'finalizada', 'fecha_creacion']
+        read_only_fields = ['recibido', 'finalizada', 'fecha_creacion']
+    
+    def validate_nombre(self, value):
+        # Solo el nombre del fichero, sin carpetas
+        nombre = os.path.basename(value.replace('\\', '/'))
+        if not nombre:
+            raise serializers.ValidationError("Nombre de fichero no válido")
+        return nombre
+    
+    def validate_tamano(self, value):
+        if not 0 < value <= settings.SUBIDAS_TAMANO_MAXIMO:
+            raise serializers.ValidationError(
+                f"El tamaño debe estar entre 1 y {settings.SUBIDAS_TAMANO_MAXIMO} bytes"
+            )
+        return value
 
 
 class PasoTrabajoListSerializer(serializers.ModelSerializer):
@@ -217,7 +294,7 @@ class PasoTrabajoSerializer(serializers.ModelSerializer):
     usuario_completado_nombre = serializers.CharField(source='usuario_completado.username', read_only=True)
     
     # Añadir campos calculados
-    fecha_limite = serializers.SerializerMethodField()
+    fecha_limite = serializers.DateTimeField(read_only=True)
     proximo_a_vencer = serializers.BooleanField(read_only=True)
     dias_restantes = serializers.IntegerField(read_only=True)
     
@@ -227,17 +304,14 @@ class PasoTrabajoSerializer(serializers.ModelSerializer):
                  'usuario_completado', 'usuario_completado_nombre', 'notas',
                  'paso_detalle', 'trabajo', 'envio', 'fecha_limite',
                  'proximo_a_vencer', 'dias_restantes']
-    
-    def get_fecha_limite(self, obj):
-        fecha_limite = obj.fecha_limite
-        return fecha_limite if fecha_limite else None
 
 class TrabajoListSerializer(serializers.ModelSerializer):
     procedimiento_nombre = serializers.CharField(source='procedimiento.nombre')
     usuario_creador_nombre = serializers.SerializerMethodField()
     unidad_nombre = serializers.CharField(source='unidad.nombre')
-    tiempo_estimado_total = serializers.SerializerMethodField()
-    progreso = serializers.SerializerMethodField()
+    # Ambos se leen de los contadores del trabajo, sin consultar sus pasos
+    tiempo_estimado_total = serializers.FloatField(read_only=True)
+    progreso = serializers.IntegerField(read_only=True)
     
     class Meta:
         model = Trabajo
@@ -250,26 +324,10 @@ class TrabajoListSerializer(serializers.ModelSerializer):
     
     def get_usuario_creador_nombre(self, obj):
         return obj.usuario_creador.tip  # Cambiado para mostrar TIP
-    
-    def get_tiempo_estimado_total(self, obj):
-        # Suma de todos los tiempos estimados de los pasos asociados al procedimiento
-        tiempo_total = sum(
-            float(paso.tiempo_estimado) if paso.tiempo_estimado else 0 
-            for paso in obj.procedimiento.pasos.all()
-        )
-        return tiempo_total
-    
-    def get_progreso(self, obj):
-        total_pasos = obj.pasos_trabajo.count()
-        if total_pasos == 0:
-            return 0
-        
-        pasos_completados = obj.pasos_trabajo.filter(estado='COMPLETADO').count()
-        return int((pasos_completados / total_pasos) * 100)
 
 
 class TrabajoDetailSerializer(serializers.ModelSerializer):
-    procedimiento_detalle = ProcedimientoDetailSerializer(source='procedimiento', read_only=True)
+    procedimiento_detalle = serializers.SerializerMethodField()
     pasos = PasoTrabajoListSerializer(source='pasos_trabajo', many=True, read_only=True)
     usuario_creador_nombre = serializers.SerializerMethodField()
     unidad_nombre = serializers.CharField(source='unidad.nombre')
@@ -285,6 +343,10 @@ class TrabajoDetailSerializer(serializers.ModelSerializer):
             'tiempo_transcurrido_dias', 'pasos', 'documentos'
         ]
     
+    def get_procedimiento_detalle(self, obj):
+        # Salida de ProcedimientoDetailSerializer guardada para la versión actual
+        return InstantaneaProcedimiento.objects.vigente(obj.procedimiento).datos
+    
     def get_usuario_creador_nombre(self, obj):
         return obj.usuario_creador.tip  # Cambiado para mostrar TIP
     
@@ -297,8 +359,8 @@ class TrabajoDetailSerializer(serializers.ModelSerializer):
         from procedimientos.serializers import DocumentoSerializer
         
         # El modelo Documento no tiene un campo 'trabajo', solo 'procedimiento'
-        # Obtener documentos del procedimiento asociado al trabajo
-        docs = Documento.objects.filter(procedimiento=obj.procedimiento)
+        # Obtener documentos del procedimiento asociado al trabajo (precargados por la vista)
+        docs = obj.procedimiento.documentos.all()
         serializer = DocumentoSerializer(docs, many=True)
         
         return serializer.data
@@ -316,31 +378,55 @@ class TrabajoCreateSerializer(serializers.ModelSerializer):
         if not hasattr(usuario, 'unidad_destino') or usuario.unidad_destino is None:
             raise serializers.ValidationError("El usuario no tiene una unidad asignada")
         
-        unidad = usuario.unidad_destino
-        
-        # El resto del código de creación...
-        trabajo = Trabajo.objects.create(
+        # Crear el trabajo y todos sus pasos en una transacción, con inserciones masivas
+        return Trabajo.objects.abrir(
             procedimiento=validated_data['procedimiento'],
+            unidades=[usuario.unidad_destino],  # Se asigna la unidad_destino del usuario
+            usuario_creador=usuario,
             titulo=validated_data['titulo'],
             descripcion=validated_data.get('descripcion', ''),
-            usuario_creador=usuario,
-            unidad=unidad,  # Aquí se asigna la unidad_destino del usuario
-            estado='INICIADO'
-        )
+        )[0]
+
+
+class TrabajoLoteSerializer(serializers.Serializer):
+    """
+    Apertura del mismo procedimiento en varias unidades de una vez. Las unidades se
+    indican explícitamente, o mediante una unidad_padre y el tipo de sus
+    dependientes (por defecto, todos los Puestos que cuelgan de ella).
+    """
+    procedimiento = serializers.PrimaryKeyRelatedField(queryset=Procedimiento.objects.all())
+    titulo = serializers.CharField(max_length=200)
+    descripcion = serializers.CharField(required=False, allow_blank=True, default='')
+    unidades = serializers.PrimaryKeyRelatedField(queryset=Unidad.objects.all(), many=True, required=False)
+    unidad_padre = serializers.PrimaryKeyRelatedField(queryset=Unidad.objects.all(), required=False)
+    tipo_unidad = serializers.ChoiceField(choices=Unidad.TIPO_CHOICES, default=Unidad.TIPO_PUESTO)
+    
+    def validate(self, data):
+        unidades = list(data.get('unidades', []))
+        if data.get('unidad_padre'):
+            unidades += Unidad.objects.descendientes(data['unidad_padre']).filter(tipo_unidad=data['tipo_unidad'])
         
-        # Crear instancias de pasos para este trabajo
-        procedimiento = validated_data['procedimiento']
-        pasos = procedimiento.pasos.all().order_by('numero')
+        # Eliminar duplicados conservando el orden
+        unidades = list({unidad.pk: unidad for unidad in unidades}.values())
+        if not unidades:
+            raise serializers.ValidationError("No se ha indicado ninguna unidad en la que abrir el trabajo")
         
-        for paso in pasos:
-            estado_inicial = 'PENDIENTE' if paso.numero == 1 else 'BLOQUEADO'
-            PasoTrabajo.objects.create(
-                trabajo=trabajo,
-                paso=paso,
-                estado=estado_inicial
-            )
+        usuario = self.context['request'].user
+        sin_acceso = [unidad.pk for unidad in unidades if not usuario.puede_acceder_unidad(unidad.pk)]
+        if sin_acceso:
+            raise serializers.ValidationError(f"No tiene acceso a las unidades: {sin_acceso}")
         
-        return trabajo
+        data['unidades'] = unidades
+        return data
+    
+    def create(self, validated_data):
+        return Trabajo.objects.abrir(
+            procedimiento=validated_data['procedimiento'],
+            unidades=validated_data['unidades'],
+            usuario_creador=self.context['request'].user,
+            titulo=validated_data['titulo'],
+            descripcion=validated_data['descripcion'],
+        )
 
 class TrabajoSerializer(serializers.ModelSerializer):
     usuario_creador_tip = serializers.SerializerMethodField()
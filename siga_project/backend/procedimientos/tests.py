@@ -1,3 +1,924 @@
-from django.test import TestCase
+import hashlib
+import itertools
+import os
+import shutil
+import stat
+import tempfile
+from io import StringIO
+from django.conf import settings
+from django.core.files import locks
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile, TemporaryUploadedFile
+from django.core.management import call_command
+from django.db import IntegrityError, transaction
+from django.core.management.base import CommandError
+from django.utils import timezone
+from django.test import TestCase, override_settings
+from rest_framework_simplejwt.tokens import AccessToken
+from rest_framework.test import APIClient
+from unidades.models import Unidad
+from users.models import Usuario
+from siga_project.consultas import ConsultaDuranteSerializacion, vigilar_serializador
+from .eventos import BrokerBaseDatos, BrokerEnMemoria, canal_unidad, obtener_broker
+from .models import AlertaPlazo, Blob, Documento, DocumentoPaso, EnvioPaso, EventoAlerta, InstantaneaProcedimiento, Paso, PasoTrabajo, Procedimiento, SubidaFragmentada, TipoProcedimiento, Trabajo, CicloProcedimientosError
+from .serializers import DocumentoSerializer, TrabajoListSerializer
 
-# Create your tests here.
+# Numeración de los usuarios de prueba (email, TIP y referencia son únicos)
+_numeros_usuario = itertools.count(1)
+
+
+def crear_usuario(nombre='Ana', apellido1='Ruiz', superusuario=False, **campos):
+    numero = next(_numeros_usuario)
+    crear = Usuario.objects.create_superuser if superusuario else Usuario.objects.create_user
+    return crear(
+        f'usuario{numero}@example.com', f'T{numero:06d}', 'clave',
+        nombre=nombre, apellido1=apellido1, ref=f'USR{numero}', **campos
+    )
+
+
+class ProcedimientoTestCase(TestCase):
+    """
+    Datos comunes de las pruebas de procedimientos y trabajos: una unidad, un usuario
+    destinado en ella (autenticado en self.client) y un procedimiento sin pasos. Cada
+    clase fija el tipo de usuario y añade sus datos en setUpTestData.
+    """
+    client_class = APIClient
+    tipo_usuario = Usuario.USER
+    superusuario = False
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.unidad = cls.crear_unidad()
+        cls.usuario = crear_usuario(
+            superusuario=cls.superusuario, tipo_usuario=cls.tipo_usuario, unidad_destino=cls.unidad
+        )
+        cls.tipo = TipoProcedimiento.objects.create(nombre="Tipo")
+        cls.procedimiento = Procedimiento.objects.create(nombre="Procedimiento", descripcion="", tipo=cls.tipo)
+
+    @classmethod
+    def crear_unidad(cls):
+        return Unidad.objects.create(nombre="Puesto", tipo_unidad=Unidad.TIPO_PUESTO)
+
+    def setUp(self):
+        self.client.force_authenticate(self.usuario)
+
+    def usar_media_temporal(self, **ajustes):
+        """MEDIA_ROOT (y los ajustes indicados) en un directorio temporal durante la prueba"""
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        ajustes = override_settings(MEDIA_ROOT=self.media, **ajustes)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+
+
+class CadenaProcedimientosTest(TestCase):
+
+    def setUp(self):
+        self.tipo = TipoProcedimiento.objects.create(nombre="Tipo")
+        self.usuario = crear_usuario(tipo_usuario=Usuario.ADMIN)
+        self.client = APIClient()
+        self.client.force_authenticate(self.usuario)
+
+    def crear_cadena(self, longitud, prefijo='Procedimiento'):
+        superior = None
+        cadena = []
+        for i in range(longitud):
+            superior = Procedimiento.objects.create(
+                nombre=f"{prefijo} {i}", descripcion="", tipo=self.tipo,
+                procedimiento_relacionado=superior
+            )
+            cadena.append(superior)
+        # El primero creado es el de mayor nivel: la cadena va del último al primero
+        return cadena[::-1]
+
+    def test_cadena_completa_desde_cualquier_eslabon(self):
+        cadena = self.crear_cadena(4)
+        response = self.client.get(f'/api/procedimientos/procedimientos/{cadena[2].pk}/cadena_completa/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([p['id'] for p in response.data['cadena_completa']], [p.pk for p in cadena])
+        self.assertEqual(cadena[1].get_cadena_procedimientos(), cadena[1:])
+
+    def test_consultas_independientes_de_la_longitud(self):
+        corta = self.crear_cadena(2)
+        larga = self.crear_cadena(8, prefijo='Larga')
+        with self.assertNumQueries(3):
+            self.client.get(f'/api/procedimientos/procedimientos/{corta[0].pk}/cadena_completa/')
+        with self.assertNumQueries(3):
+            self.client.get(f'/api/procedimientos/procedimientos/{larga[0].pk}/cadena_completa/')
+
+    def test_ciclo(self):
+        cadena = self.crear_cadena(3)
+        Procedimiento.objects.filter(pk=cadena[-1].pk).update(procedimiento_relacionado=cadena[0])
+        with self.assertRaises(CicloProcedimientosError):
+            Procedimiento.objects.cadena(cadena[1])
+        response = self.client.get(f'/api/procedimientos/procedimientos/{cadena[1].pk}/cadena_completa/')
+        self.assertEqual(response.status_code, 409)
+
+    def test_no_permite_crear_ciclos(self):
+        cadena = self.crear_cadena(3)
+        response = self.client.patch(
+            f'/api/procedimientos/procedimientos/{cadena[-1].pk}/',
+            {'procedimiento_relacionado': cadena[0].pk}, format='json'
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('procedimiento_relacionado', response.data)
+
+
+class IndicadoresCadenaTest(TestCase):
+
+    def setUp(self):
+        self.tipo = TipoProcedimiento.objects.create(nombre="Tipo")
+        usuario = crear_usuario(tipo_usuario=Usuario.ADMIN)
+        self.client = APIClient()
+        self.client.force_authenticate(usuario)
+
+    def crear(self, nombre, superior=None):
+        return Procedimiento.objects.create(
+            nombre=nombre, descripcion="", tipo=self.tipo, procedimiento_relacionado=superior
+        )
+
+    def test_listado_con_consultas_constantes(self):
+        superior = self.crear("Superior")
+        for i in range(5):
+            self.crear(f"Derivado {i}", superior)
+        # Recuento de la paginación + página con tipo y derivados anotados
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/procedimientos/procedimientos/')
+        indicadores = {p['id']: p['es_inicio_proceso'] for p in response.data['results']}
+        self.assertFalse(indicadores[superior.pk])
+        self.assertEqual(sum(indicadores.values()), 5)
+
+    def test_detalle_con_derivados_precargados(self):
+        superior = self.crear("Superior")
+        derivado = self.crear("Derivado", superior)
+        # El detalle se sirve como JSON ya compilado (InstantaneaProcedimiento)
+        detalle = self.client.get(f'/api/procedimientos/procedimientos/{superior.pk}/').json()
+        self.assertEqual([p['id'] for p in detalle['procedimientos_derivados']], [derivado.pk])
+        self.assertFalse(detalle['es_inicio_proceso'])
+        self.assertTrue(detalle['es_fin_proceso'])
+
+
+class AperturaTrabajosTest(ProcedimientoTestCase):
+    tipo_usuario = Usuario.ADMIN
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        Paso.objects.bulk_create([
+            Paso(procedimiento=cls.procedimiento, numero=numero, titulo=f"Paso {numero}")
+            for numero in range(1, 41)
+        ])
+
+    @classmethod
+    def crear_unidad(cls):
+        # El usuario está destinado en una Comandancia con tres Puestos
+        comandancia = Unidad.objects.create(nombre="Comandancia", tipo_unidad=Unidad.TIPO_COMANDANCIA)
+        compania = Unidad.objects.create(nombre="Compañía", id_padre=comandancia, tipo_unidad=Unidad.TIPO_COMPANIA)
+        cls.puestos = [
+            Unidad.objects.create(nombre=f"Puesto {i}", id_padre=compania, tipo_unidad=Unidad.TIPO_PUESTO)
+            for i in range(3)
+        ]
+        return comandancia
+
+    def test_pasos_creados_en_bloque(self):
+        # Sesión/usuario, validación, pasos del procedimiento, savepoint, INSERT del
+        # trabajo, INSERT de los 40 pasos y release, sea cual sea el número de pasos
+        with self.assertNumQueries(6):
+            response = self.client.post('/api/procedimientos/trabajos/', {
+                'procedimiento': self.procedimiento.pk, 'titulo': "Trabajo"
+            }, format='json')
+        self.assertEqual(response.status_code, 201)
+        trabajo = Trabajo.objects.get()
+        estados = list(trabajo.pasos_trabajo.values_list('estado', flat=True))
+        self.assertEqual(len(estados), 40)
+        self.assertEqual(estados[0], 'PENDIENTE')
+        self.assertEqual(set(estados[1:]), {'BLOQUEADO'})
+
+    def test_crear_lote_en_los_puestos_de_una_comandancia(self):
+        response = self.client.post('/api/procedimientos/trabajos/crear_lote/', {
+            'procedimiento': self.procedimiento.pk, 'titulo': "Campaña",
+            'unidad_padre': self.unidad.pk,
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['total'], 3)
+        self.assertEqual(
+            set(Trabajo.objects.values_list('unidad', flat=True)), {p.pk for p in self.puestos}
+        )
+        self.assertEqual(PasoTrabajo.objects.count(), 120)
+
+    def test_crear_lote_sin_acceso(self):
+        ajena = Unidad.objects.create(nombre="Ajena", tipo_unidad=Unidad.TIPO_PUESTO)
+        response = self.client.post('/api/procedimientos/trabajos/crear_lote/', {
+            'procedimiento': self.procedimiento.pk, 'titulo': "Campaña", 'unidades': [ajena.pk],
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Trabajo.objects.exists())
+
+
+class ContadoresTrabajoTest(ProcedimientoTestCase):
+    tipo_usuario = Usuario.SUPERADMIN
+    superusuario = True
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        for numero, tiempo in enumerate(['2', '1.5', None, None], 1):
+            Paso.objects.create(procedimiento=cls.procedimiento, numero=numero, titulo=f"Paso {numero}",
+                                tiempo_estimado=tiempo)
+
+    def abrir(self, cantidad=1):
+        return Trabajo.objects.abrir(self.procedimiento, [self.unidad] * cantidad, self.usuario, "Trabajo")
+
+    def test_contadores_al_abrir_y_completar(self):
+        trabajo = self.abrir()[0]
+        self.assertEqual((trabajo.pasos_total, trabajo.pasos_completados, trabajo.tiempo_estimado_total), (4, 0, 3.5))
+        
+        primero = trabajo.pasos_trabajo.first()
+        primero.completar_paso(self.usuario)
+        trabajo.refresh_from_db()
+        self.assertEqual(trabajo.pasos_completados, 1)
+        self.assertEqual(trabajo.progreso, 25)
+        
+        # Un guardado completo con una copia desfasada no pisa el contador
+        copia = Trabajo.objects.get(pk=trabajo.pk)
+        Trabajo.objects.filter(pk=trabajo.pk).update(pasos_completados=2)
+        copia.titulo = "Renombrado"
+        copia.save()
+        self.assertEqual(Trabajo.objects.get(pk=trabajo.pk).pasos_completados, 2)
+
+    def test_tiempo_estimado_sigue_a_los_pasos(self):
+        trabajo = self.abrir()[0]
+        Paso.objects.create(procedimiento=self.procedimiento, numero=5, titulo="Paso 5", tiempo_estimado='4')
+        trabajo.refresh_from_db()
+        self.assertEqual(trabajo.tiempo_estimado_total, 7.5)
+        
+        # Editar otros campos no recalcula; cambiar el tiempo o eliminar el paso, sí
+        paso = Paso.objects.get(procedimiento=self.procedimiento, numero=1)
+        paso.titulo = "Renombrado"
+        # Guardado e invalidación de la instantánea del procedimiento
+        with self.assertNumQueries(2):
+            paso.save()
+        paso.tiempo_estimado = '3'
+        paso.save()
+        trabajo.refresh_from_db()
+        self.assertEqual(trabajo.tiempo_estimado_total, 8.5)
+        
+        # Al eliminar un paso se renumeran los siguientes sin recalcular por cada uno
+        Paso.objects.create(procedimiento=self.procedimiento, numero=6, titulo="Paso 6")
+        quinto = Paso.objects.get(procedimiento=self.procedimiento, numero=5)
+        response = self.client.delete(f'/api/procedimientos/pasos/{quinto.pk}/')
+        self.assertEqual(response.status_code, 204)
+        trabajo.refresh_from_db()
+        self.assertEqual(trabajo.tiempo_estimado_total, 4.5)
+        self.assertTrue(Paso.objects.filter(procedimiento=self.procedimiento, numero=5, titulo="Paso 6").exists())
+
+    def test_listado_sin_consultar_pasos(self):
+        self.abrir(12)
+        # Recuento de la paginación + página con procedimiento, creador y unidad
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/procedimientos/trabajos/')
+        self.assertEqual(response.data['results'][0]['tiempo_estimado_total'], 3.5)
+        self.assertEqual(response.data['results'][0]['progreso'], 0)
+
+    def test_comando_rellena_y_verifica(self):
+        trabajo = self.abrir()[0]
+        Trabajo.objects.filter(pk=trabajo.pk).update(pasos_total=0, tiempo_estimado_total=0)
+        with self.assertRaises(CommandError):
+            call_command('recalcular_contadores_trabajos', '--verificar', stdout=StringIO())
+        call_command('recalcular_contadores_trabajos', stdout=StringIO())
+        call_command('recalcular_contadores_trabajos', '--verificar', stdout=StringIO())
+        trabajo.refresh_from_db()
+        self.assertEqual((trabajo.pasos_total, trabajo.tiempo_estimado_total), (4, 3.5))
+
+
+class FechaLimitePasoTest(ProcedimientoTestCase):
+    tipo_usuario = Usuario.SUPERADMIN
+    superusuario = True
+
+    def test_tiempo_estimado_numerico_y_vacio(self):
+        response = self.client.post('/api/procedimientos/pasos/', {
+            'procedimiento': self.procedimiento.pk, 'numero': 1, 'titulo': "Paso 1", 'tiempo_estimado': '1.5',
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(response.data['tiempo_estimado'], 1.5)
+        
+        response = self.client.post('/api/procedimientos/pasos/', {
+            'procedimiento': self.procedimiento.pk, 'numero': 2, 'titulo': "Paso 2", 'tiempo_estimado': '',
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertIsNone(response.data['tiempo_estimado'])
+        
+        response = self.client.post('/api/procedimientos/pasos/', {
+            'procedimiento': self.procedimiento.pk, 'numero': 3, 'titulo': "Paso 3", 'tiempo_estimado': 'dos',
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_fecha_limite_al_iniciar(self):
+        Paso.objects.create(procedimiento=self.procedimiento, numero=1, titulo="Paso 1", tiempo_estimado=2)
+        Paso.objects.create(procedimiento=self.procedimiento, numero=2, titulo="Paso 2")
+        trabajo = Trabajo.objects.abrir(self.procedimiento, [self.unidad], self.usuario, "Trabajo")[0]
+        primero, segundo = trabajo.pasos_trabajo.order_by('paso__numero')
+        
+        response = self.client.post(f'/api/procedimientos/pasos-trabajo/{primero.pk}/iniciar/')
+        self.assertEqual(response.status_code, 200)
+        primero.refresh_from_db()
+        self.assertEqual(primero.fecha_limite, primero.fecha_inicio + timezone.timedelta(days=2))
+        
+        # Sin tiempo estimado no hay fecha límite
+        segundo.iniciar_paso(self.usuario)
+        self.assertIsNone(segundo.fecha_limite)
+        
+        # Los pasos vencidos se obtienen con un filtro de rango sobre la columna
+        PasoTrabajo.objects.filter(pk=primero.pk).update(fecha_limite=timezone.now() - timezone.timedelta(days=1))
+        vencidos = PasoTrabajo.objects.filter(estado='EN_PROGRESO', fecha_limite__lt=timezone.now())
+        self.assertEqual(list(vencidos.values_list('pk', flat=True)), [primero.pk])
+
+
+class AlertasPlazosTest(ProcedimientoTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        otra_unidad = Unidad.objects.create(nombre="Otro puesto", tipo_unidad=Unidad.TIPO_PUESTO)
+        companero = crear_usuario('Luis', 'Gil', tipo_usuario=Usuario.USER, unidad_destino=cls.unidad)
+        Paso.objects.create(procedimiento=cls.procedimiento, numero=1, titulo="Paso 1", tiempo_estimado=2)
+        
+        # (creador, unidad, días hasta la fecha límite o None si el paso no se ha iniciado)
+        casos = {
+            'propio_lejos': (cls.usuario, cls.unidad, 10),
+            'propio_proximo': (cls.usuario, cls.unidad, 2),
+            'ajeno_vencido': (companero, cls.unidad, -3),
+            'ajeno_hoy': (companero, cls.unidad, 0),
+            'ajeno_sin_iniciar': (companero, cls.unidad, None),
+            'otra_unidad': (companero, otra_unidad, -1),
+        }
+        cls.pasos = {}
+        ahora = timezone.now()
+        for nombre, (creador, unidad, dias) in casos.items():
+            trabajo = Trabajo.objects.abrir(cls.procedimiento, [unidad], creador, nombre)[0]
+            paso = trabajo.pasos_trabajo.get()
+            if dias is not None:
+                PasoTrabajo.objects.filter(pk=paso.pk).update(
+                    estado='EN_PROGRESO', fecha_inicio=ahora - timezone.timedelta(days=1),
+                    fecha_limite=ahora + timezone.timedelta(days=dias),
+                )
+            cls.pasos[nombre] = paso.pk
+        # Las fechas se han fijado con update(): rehacer la tabla de alertas
+        AlertaPlazo.objects.refrescar()
+
+    def test_alertas_de_la_unidad(self):
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/procedimientos/alertas-plazos/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [(alerta['paso_id'], alerta['es_propio'], alerta['vencido'], alerta['dias_restantes']) for alerta in response.data],
+            [(self.pasos['propio_proximo'], True, False, 2),
+             (self.pasos['ajeno_vencido'], False, True, -3),
+             (self.pasos['ajeno_hoy'], False, False, 0)]
+        )
+        alerta = response.data[0]
+        self.assertEqual(alerta['trabajo_titulo'], 'propio_proximo')
+        self.assertEqual(alerta['tiempo_estimado'], 2.0)
+        self.assertEqual(alerta['responsable_nombre'], self.usuario.get_full_name())
+        self.assertEqual(alerta['unidad_id'], self.unidad.pk)
+
+    def test_superadmin_ve_todas_las_unidades(self):
+        superadmin = crear_usuario('Eva', 'Sanz', tipo_usuario=Usuario.SUPERADMIN, unidad_destino=self.unidad)
+        self.assertFalse(superadmin.is_superuser)
+        self.client.force_authenticate(superadmin)
+        response = self.client.get('/api/procedimientos/alertas-plazos/', {'all': 'true'})
+        self.assertEqual(len(response.data), 4)
+
+    def test_fechas_limite_siguen_al_tiempo_estimado(self):
+        paso = Paso.objects.get(procedimiento=self.procedimiento)
+        # Todos los pasos iniciados empezaron hace un día: con 20 días ninguno avisa
+        paso.tiempo_estimado = 20
+        paso.save()
+        self.assertEqual(self.client.get('/api/procedimientos/alertas-plazos/').data, [])
+        
+        paso.tiempo_estimado = 1
+        paso.save()
+        response = self.client.get('/api/procedimientos/alertas-plazos/')
+        self.assertEqual(
+            sorted((alerta['paso_id'], alerta['dias_restantes']) for alerta in response.data),
+            sorted((self.pasos[nombre], 0) for nombre in ('propio_lejos', 'propio_proximo', 'ajeno_vencido', 'ajeno_hoy'))
+        )
+        # Lo mismo que al recalcular la tabla completa
+        AlertaPlazo.objects.refrescar()
+        self.assertEqual(self.client.get('/api/procedimientos/alertas-plazos/').data, response.data)
+
+    def test_alertas_paginadas(self):
+        response = self.client.get('/api/procedimientos/alertas-plazos/', {'page_size': 2})
+        self.assertEqual(response.data['count'], 3)
+        self.assertEqual([alerta['paso_id'] for alerta in response.data['results']],
+                         [self.pasos['propio_proximo'], self.pasos['ajeno_vencido']])
+
+    def test_alertas_al_iniciar_y_completar(self):
+        trabajo = Trabajo.objects.abrir(self.procedimiento, [self.unidad], self.usuario, "Nuevo")[0]
+        paso = trabajo.pasos_trabajo.get()
+        
+        self.client.post(f'/api/procedimientos/pasos-trabajo/{paso.pk}/iniciar/')
+        response = self.client.get('/api/procedimientos/alertas-plazos/')
+        alertas = {alerta['paso_id']: alerta for alerta in response.data}
+        self.assertEqual(alertas[paso.pk]['dias_restantes'], 2)
+        self.assertTrue(alertas[paso.pk]['es_propio'])
+        
+        self.client.post(f'/api/procedimientos/pasos-trabajo/{paso.pk}/completar/')
+        self.assertFalse(AlertaPlazo.objects.filter(paso_trabajo=paso).exists())
+        self.assertEqual(AlertaPlazo.objects.count(), 4)
+
+    def test_alertas_siguen_al_trabajo(self):
+        trabajo_id = PasoTrabajo.objects.get(pk=self.pasos['propio_proximo']).trabajo_id
+        
+        response = self.client.patch(f'/api/procedimientos/trabajos/{trabajo_id}/', {'titulo': 'Renombrado'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(AlertaPlazo.objects.get(trabajo_id=trabajo_id).trabajo_titulo, 'Renombrado')
+        
+        self.client.post(f'/api/procedimientos/trabajos/{trabajo_id}/cancelar/')
+        self.assertFalse(AlertaPlazo.objects.filter(trabajo_id=trabajo_id).exists())
+        self.client.post(f'/api/procedimientos/trabajos/{trabajo_id}/reanudar/')
+        self.assertTrue(AlertaPlazo.objects.filter(trabajo_id=trabajo_id).exists())
+
+
+class BrokerRegistro(BrokerEnMemoria):
+    """Broker de pruebas: además de difundir, registra (tipo, datos) de cada evento publicado"""
+
+    def __init__(self):
+        super().__init__()
+        self.publicados = []
+
+    def publicar(self, tipo, canales, datos):
+        self.publicados.append((tipo, datos))
+        return super().publicar(tipo, canales, datos)
+
+
+@override_settings(ALERTAS_BROKER='procedimientos.tests.BrokerRegistro', ALERTAS_HEARTBEAT=0.05)
+class AlertasStreamTest(ProcedimientoTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        Paso.objects.create(procedimiento=cls.procedimiento, numero=1, titulo="Paso 1", tiempo_estimado=1)
+
+    def setUp(self):
+        super().setUp()
+        self.broker = obtener_broker()
+        self.broker.publicados.clear()
+
+    def test_publica_altas_y_bajas(self):
+        trabajo = Trabajo.objects.abrir(self.procedimiento, [self.unidad], self.usuario, "Trabajo")[0]
+        paso = trabajo.pasos_trabajo.get()
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/api/procedimientos/pasos-trabajo/{paso.pk}/iniciar/')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/api/procedimientos/pasos-trabajo/{paso.pk}/completar/')
+        
+        self.assertEqual([tipo for tipo, _ in self.broker.publicados], ['alerta', 'baja'])
+        alerta = self.broker.publicados[0][1]
+        self.assertEqual((alerta['paso_id'], alerta['dias_restantes']), (paso.pk, 1))
+        self.assertIn(self.usuario.pk, alerta['propietarios'])
+
+    async def test_stream_reenvia_pendientes_y_latidos(self):
+        anterior = self.broker.publicar('baja', [canal_unidad(self.unidad.pk)], {'paso_id': 1})
+        self.broker.publicar('baja', [canal_unidad(0)], {'paso_id': 2})
+        self.broker.publicar('alerta', [canal_unidad(self.unidad.pk)], {'paso_id': 3, 'propietarios': [self.usuario.pk]})
+        
+        response = await self.async_client.get(
+            '/api/procedimientos/alertas-plazos/stream/',
+            {'token': str(AccessToken.for_user(self.usuario))},
+            headers={'Last-Event-ID': str(anterior.id)},
+        )
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        contenido = response.streaming_content
+        try:
+            self.assertTrue((await anext(contenido)).startswith(b'retry:'))
+            # Solo el evento posterior de su unidad, con es_propio calculado para el usuario
+            evento = await anext(contenido)
+            self.assertIn(b'event: alerta', evento)
+            self.assertIn(b'"es_propio": true', evento)
+            self.assertNotIn(b'propietarios', evento)
+            self.assertEqual(await anext(contenido), b': latido\n\n')
+        finally:
+            await contenido.aclose()
+
+    async def test_stream_sin_token(self):
+        response = await self.async_client.get('/api/procedimientos/alertas-plazos/stream/')
+        self.assertEqual(response.status_code, 401)
+
+    def test_broker_compartido_entre_procesos(self):
+        # Dos instancias, como el comando periódico y el proceso que sirve el stream
+        comando, servidor = BrokerBaseDatos(), BrokerBaseDatos()
+        primero = comando.publicar('baja', [canal_unidad(self.unidad.pk)], {'paso_id': 1})
+        comando.publicar('baja', [canal_unidad(0)], {'paso_id': 2})
+        comando.publicar('alerta', [canal_unidad(self.unidad.pk)], {'paso_id': 3, 'fecha_limite': timezone.now().date()})
+        
+        pendientes = servidor.pendientes(primero.id, [canal_unidad(self.unidad.pk)])
+        self.assertEqual([(evento.tipo, evento.datos['paso_id']) for evento in pendientes], [('alerta', 3)])
+        # Sin los eventos intermedios (ya eliminados) el cliente debe pedir la lista completa
+        EventoAlerta.objects.filter(pk=primero.id).delete()
+        self.assertIsNone(servidor.pendientes(primero.id - 1, [canal_unidad(self.unidad.pk)]))
+
+    def test_stream_no_disponible_por_wsgi(self):
+        # El cliente sigue consultando alertas-plazos/ periódicamente
+        response = self.client.get(
+            '/api/procedimientos/alertas-plazos/stream/', {'token': str(AccessToken.for_user(self.usuario))}
+        )
+        self.assertEqual(response.status_code, 503)
+
+
+@override_settings(SIGA_PROHIBIR_CONSULTAS_SERIALIZACION=True)
+class PrecargaTrabajosTest(ProcedimientoTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        for numero in range(1, 6):
+            paso = Paso.objects.create(procedimiento=cls.procedimiento, numero=numero, titulo=f"Paso {numero}")
+            documento = Documento.objects.create(nombre=f"Documento {numero}", procedimiento=cls.procedimiento,
+                                                 url=f"https://example.com/{numero}")
+            DocumentoPaso.objects.create(paso=paso, documento=documento)
+        cls.trabajo = Trabajo.objects.abrir(cls.procedimiento, [cls.unidad], cls.usuario, "Trabajo")[0]
+
+    def test_detalle_con_consultas_declaradas(self):
+        # La primera lectura compila la instantánea del procedimiento
+        self.client.get(f'/api/procedimientos/trabajos/{self.trabajo.pk}/')
+        
+        # Trabajo (con procedimiento), documentos, instantánea y pasos del trabajo,
+        # sea cual sea el número de pasos
+        with self.assertNumQueries(4):
+            response = self.client.get(f'/api/procedimientos/trabajos/{self.trabajo.pk}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['pasos']), 5)
+        self.assertEqual(len(response.data['procedimiento_detalle']['pasos'][0]['documentos']), 1)
+        
+        paso = self.trabajo.pasos_trabajo.first()
+        response = self.client.get(f'/api/procedimientos/pasos-trabajo/{paso.pk}/')
+        self.assertEqual(response.status_code, 200)
+
+    def test_detecta_relaciones_sin_precargar(self):
+        serializer = vigilar_serializador(TrabajoListSerializer(Trabajo.objects.all(), many=True), "Listado")
+        with self.assertRaises(ConsultaDuranteSerializacion):
+            serializer.data
+
+
+class InstantaneasProcedimientoTest(ProcedimientoTestCase):
+    tipo_usuario = Usuario.ADMIN
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.paso = Paso.objects.create(procedimiento=cls.procedimiento, numero=1, titulo="Paso 1")
+        cls.url = f'/api/procedimientos/procedimientos/{cls.procedimiento.pk}/'
+
+    def test_detalle_desde_instantanea_con_etag(self):
+        primera = self.client.get(self.url)
+        self.assertEqual(primera.status_code, 200)
+        self.assertEqual(primera.json()['pasos'][0]['titulo'], "Paso 1")
+        
+        with self.assertNumQueries(1):
+            segunda = self.client.get(self.url)
+        self.assertEqual(segunda.content, primera.content)
+        self.assertEqual(segunda['ETag'], primera['ETag'])
+        
+        no_modificada = self.client.get(self.url, HTTP_IF_NONE_MATCH=primera['ETag'])
+        self.assertEqual(no_modificada.status_code, 304)
+
+    def test_cambios_en_pasos_recompilan_la_instantanea(self):
+        etag = self.client.get(self.url)['ETag']
+        self.paso.titulo = "Paso renombrado"
+        self.paso.save()
+        
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.json()['pasos'][0]['titulo'], "Paso renombrado")
+
+    def test_nueva_version_conserva_la_anterior(self):
+        self.client.get(self.url)
+        response = self.client.post(f'{self.url}nueva_version/', {'descripcion': "Cambios"})
+        self.assertEqual(response.json()['version'], '1.1')
+        
+        self.assertEqual(self.client.get(self.url).json()['version'], '1.1')
+        self.assertEqual(self.client.get(self.url, {'version': '1.0'}).json()['version'], '1.0')
+        self.assertEqual(InstantaneaProcedimiento.objects.filter(procedimiento=self.procedimiento).count(), 2)
+        self.assertEqual(self.client.get(self.url, {'version': '9.9'}).status_code, 404)
+
+
+class PaginacionCursorTest(ProcedimientoTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        Paso.objects.create(procedimiento=cls.procedimiento, numero=1, titulo="Paso 1")
+        cls.trabajos = [
+            Trabajo.objects.abrir(cls.procedimiento, [cls.unidad], cls.usuario, f"Trabajo {i}")[0]
+            for i in range(5)
+        ]
+
+    def test_recorre_todas_las_paginas_sin_count(self):
+        ids = []
+        url, parametros = '/api/procedimientos/trabajos/', {'cursor': '', 'page_size': 2}
+        while url:
+            # Página (sin COUNT ni OFFSET) y un único recorrido con sus relaciones
+            with self.assertNumQueries(1):
+                pagina = self.client.get(url, parametros).data
+            self.assertNotIn('count', pagina)
+            self.assertLessEqual(len(pagina['results']), 2)
+            ids += [trabajo['id'] for trabajo in pagina['results']]
+            url, parametros = pagina['next'], {}
+        # Mismo orden que la paginación por número de página (más recientes primero)
+        self.assertEqual(ids, [trabajo.pk for trabajo in reversed(self.trabajos)])
+
+    def test_cursor_ignora_ordering_de_la_peticion(self):
+        for i in range(2):
+            Procedimiento.objects.create(nombre=f"Procedimiento {i}", descripcion="", tipo=self.tipo)
+        # El cursor usa la ordenación de la vista, no la pedida (campo relacionado)
+        response = self.client.get('/api/procedimientos/procedimientos/', {
+            'cursor': '', 'page_size': 1, 'ordering': 'tipo__nombre'
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.get(response.data['next']).status_code, 200)
+
+    def test_paginacion_por_numero_con_page_size(self):
+        pagina = self.client.get('/api/procedimientos/trabajos/', {'page_size': 1000}).data
+        self.assertEqual(pagina['count'], 5)
+        self.assertEqual(len(pagina['results']), 5)
+
+
+class CopiaDocumentosPasoTest(ProcedimientoTestCase):
+    tipo_usuario = Usuario.ADMIN
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.paso = Paso.objects.create(procedimiento=cls.procedimiento, numero=1, titulo="Paso 1")
+
+    def setUp(self):
+        super().setUp()
+        self.usar_media_temporal()
+
+    def test_copia_de_documento_sin_blob(self):
+        # Documento anterior al almacén de contenidos: archivo propio en disco
+        contenido = os.urandom(3 * 1024 * 1024)
+        nombre = default_storage.save(f'procedimientos/{self.procedimiento.pk}/general/escaneado.pdf', ContentFile(contenido))
+        original = Documento.objects.create(nombre="Escaneado", procedimiento=self.procedimiento, archivo=nombre)
+        self.assertIsNone(original.blob_id)
+        
+        copia = DocumentoPaso.objects.create(paso=self.paso, documento=original).documento
+        self.assertNotEqual(copia.pk, original.pk)
+        self.assertTrue(copia.archivo.name.startswith(f'procedimientos/{self.procedimiento.pk}/pasos/'))
+        self.assertEqual(copia.extension, 'pdf')
+        
+        # La copia no depende del original: la vista lo elimina después
+        os.remove(original.archivo.path)
+        with copia.archivo.open('rb') as fichero:
+            self.assertEqual(fichero.read(), contenido)
+
+    def test_contenido_compartido_con_referencias(self):
+        contenido = os.urandom(1024 * 1024)
+        original = Documento.objects.create(
+            nombre="Reglamento", procedimiento=self.procedimiento,
+            archivo=SimpleUploadedFile("reglamento.pdf", contenido),
+        )
+        blob = original.blob
+        self.assertEqual(blob.sha256, hashlib.sha256(contenido).hexdigest())
+        self.assertEqual(original.extension, 'pdf')
+        
+        # El mismo fichero subido a otro documento y adjunto a un paso: un único blob
+        otro = Documento.objects.create(
+            nombre="Reglamento (copia)", procedimiento=self.procedimiento,
+            archivo=SimpleUploadedFile("copia.pdf", contenido),
+        )
+        copia = DocumentoPaso.objects.create(paso=self.paso, documento=original).documento
+        self.assertEqual({otro.blob_id, copia.blob_id}, {blob.pk})
+        self.assertEqual(copia.archivo.name, original.archivo.name)
+        blob.refresh_from_db()
+        self.assertEqual(blob.referencias, 3)
+        
+        # Sin referencias, purgar elimina el blob y su fichero
+        ruta = blob.archivo.path
+        original.delete()
+        otro.delete()
+        self.assertEqual(Blob.objects.purgar(), (0, 0))
+        self.assertTrue(os.path.exists(ruta))
+        self.procedimiento.delete()
+        blob.refresh_from_db()
+        self.assertEqual(blob.referencias, 0)
+        self.assertEqual(Blob.objects.purgar(), (1, 0))
+        self.assertFalse(Blob.objects.filter(pk=blob.pk).exists())
+        self.assertFalse(os.path.exists(ruta))
+    
+    def test_purgar_ficheros_huerfanos(self):
+        # Un fichero movido al almacén por una transacción que se deshizo no tiene blob
+        contenido = os.urandom(1024)
+        try:
+            with transaction.atomic():
+                nombre = Blob.objects.guardar(ContentFile(contenido), 'pdf').archivo.name
+                raise IntegrityError
+        except IntegrityError:
+            pass
+        self.assertFalse(Blob.objects.exists())
+        self.assertTrue(default_storage.exists(nombre))
+        
+        # Los recientes se conservan: pueden ser de una subida aún en curso
+        self.assertEqual(Blob.objects.purgar(), (0, 0))
+        self.assertEqual(Blob.objects.purgar(horas=0), (0, 1))
+        self.assertFalse(default_storage.exists(nombre))
+    
+    def test_registrar_restaura_fichero_eliminado(self):
+        contenido = os.urandom(1024)
+        blob = Blob.objects.guardar(ContentFile(contenido), 'pdf')
+        Blob.objects.liberar(blob.pk)
+        default_storage.delete(blob.archivo.name)
+        
+        otra = Blob.objects.guardar(ContentFile(contenido), 'pdf')
+        self.assertEqual(otra.pk, blob.pk)
+        self.assertEqual(otra.referencias, 1)
+        with default_storage.open(blob.archivo.name) as fichero:
+            self.assertEqual(fichero.read(), contenido)
+
+    @override_settings(FILE_UPLOAD_MAX_MEMORY_SIZE=0)
+    def test_subida_a_paso_en_una_escritura(self):
+        contenido = os.urandom(256 * 1024)
+        
+        response = self.client.post(f'/api/procedimientos/pasos/{self.paso.pk}/documentos/', {
+            'archivo': SimpleUploadedFile("Acta.PDF", contenido), 'nombre': "Acta", 'notas': "Firmada",
+        }, format='multipart')
+        self.assertEqual(response.status_code, 201)
+        
+        # Un único documento, ya del paso, guardado directamente en el almacén de contenidos
+        documento = Documento.objects.get()
+        self.assertEqual(documento.tipo_documento, 'PASO')
+        self.assertEqual(documento.extension, 'pdf')
+        self.assertEqual(documento.blob.sha256, hashlib.sha256(contenido).hexdigest())
+        self.assertEqual(response.data['documento'], documento.pk)
+        self.assertFalse(os.path.exists(os.path.join(self.media, 'procedimientos')))
+        with documento.archivo.open('rb') as fichero:
+            self.assertEqual(fichero.read(), contenido)
+
+    @override_settings(FILE_UPLOAD_PERMISSIONS=0o640, FILE_UPLOAD_DIRECTORY_PERMISSIONS=0o750)
+    def test_permisos_de_los_ficheros_del_almacen(self):
+        subida_en_disco = TemporaryUploadedFile("disco.pdf", 'application/pdf', 1024, None)
+        subida_en_disco.write(os.urandom(1024))
+        self.addCleanup(subida_en_disco.close)
+        for subida in (SimpleUploadedFile("memoria.pdf", os.urandom(1024)), subida_en_disco):
+            documento = Documento.objects.create(nombre=subida.name, procedimiento=self.procedimiento, archivo=subida)
+            # Los mismos permisos que el resto de ficheros guardados por el almacenamiento,
+            # no los 0600 del temporal
+            ruta = documento.archivo.path
+            self.assertEqual(stat.S_IMODE(os.stat(ruta).st_mode), 0o640)
+            self.assertEqual(stat.S_IMODE(os.stat(os.path.dirname(ruta)).st_mode), 0o750)
+
+
+class DescargaDocumentosTest(ProcedimientoTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.usar_media_temporal()
+        self.contenido = os.urandom(100 * 1024)
+        self.documento = Documento.objects.create(
+            nombre="Reglamento", archivo=SimpleUploadedFile("reglamento.pdf", self.contenido)
+        )
+        self.url = f'/downloads/{self.documento.archivo.name}'
+
+    def descargar(self, **cabeceras):
+        response = self.client.get(self.url, headers=cabeceras)
+        if response.streaming:
+            response.contenido = b''.join(response.streaming_content)
+            response.close()
+        return response
+
+    def test_rangos_y_peticiones_condicionales(self):
+        completo = self.descargar()
+        self.assertEqual(completo.status_code, 200)
+        self.assertEqual(completo.contenido, self.contenido)
+        self.assertEqual(completo['Content-Disposition'], 'attachment; filename="Reglamento.pdf"')
+        self.assertEqual(completo['Accept-Ranges'], 'bytes')
+        
+        parcial = self.descargar(Range='bytes=1000-1999')
+        self.assertEqual(parcial.status_code, 206)
+        self.assertEqual(parcial['Content-Range'], f'bytes 1000-1999/{len(self.contenido)}')
+        self.assertEqual(parcial.contenido, self.contenido[1000:2000])
+        self.assertEqual(self.descargar(Range='bytes=-10').contenido, self.contenido[-10:])
+        self.assertEqual(self.descargar(Range=f'bytes={len(self.contenido)}-').status_code, 416)
+        # If-Range con otra versión del fichero: se envía completo
+        self.assertEqual(self.descargar(Range='bytes=0-9', If_Range='"otro"').status_code, 200)
+        
+        self.assertEqual(self.descargar(If_None_Match=completo['ETag']).status_code, 304)
+        self.assertEqual(self.descargar(If_Modified_Since=completo['Last-Modified']).status_code, 304)
+
+    def test_permisos(self):
+        self.assertEqual(APIClient().get(self.url).status_code, 401)
+        # Ficheros que no son de ningún documento, o fuera de MEDIA_ROOT
+        default_storage.save('procedimientos/otros/suelto.pdf', ContentFile(b'x'))
+        self.assertEqual(self.client.get('/downloads/procedimientos/otros/suelto.pdf').status_code, 404)
+        self.assertEqual(self.client.get('/downloads/../settings.py').status_code, 404)
+        # MEDIA_URL no se sirve: archivo_url lleva a la descarga
+        self.assertEqual(self.client.get(self.documento.archivo.url).status_code, 404)
+        archivo_url = DocumentoSerializer(self.documento).data['archivo_url']
+        self.assertEqual(archivo_url, f'{self.url}?documento={self.documento.pk}')
+
+    def test_url_firmada(self):
+        response = self.client.get('/api/procedimientos/descargas/firmar/', {'url': f'http://testserver{self.url}'})
+        self.assertEqual(response.status_code, 200)
+        firmada = response.data['url']
+        self.assertNotIn(str(AccessToken.for_user(self.usuario)), firmada)
+        
+        # Desde un enlace, sin cabecera Authorization
+        descarga = APIClient().get(firmada)
+        self.assertEqual(descarga.status_code, 200)
+        descarga.close()
+        # La firma solo vale para ese fichero y durante DESCARGAS_FIRMA_CADUCIDAD
+        otro = Documento.objects.create(nombre="Otro", archivo=SimpleUploadedFile("otro.pdf", b'otro'))
+        firma = firmada.split('firma=')[1]
+        self.assertEqual(APIClient().get(f'/downloads/{otro.archivo.name}', {'firma': firma}).status_code, 401)
+        with override_settings(DESCARGAS_FIRMA_CADUCIDAD=-1):
+            self.assertEqual(APIClient().get(firmada).status_code, 401)
+        # Solo se firman ficheros que el usuario puede descargar
+        response = self.client.get('/api/procedimientos/descargas/firmar/', {'url': '/downloads/../settings.py'})
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(APIClient().get('/api/procedimientos/descargas/firmar/', {'url': self.url}).status_code, 401)
+
+    @override_settings(
+        DESCARGAS_SERVIDOR='procedimientos.descargas.ServidorXAccel', DESCARGAS_X_ACCEL_PREFIJO='/protegido/'
+    )
+    def test_envio_por_el_servidor_web(self):
+        response = self.descargar(Range='bytes=0-9')
+        # nginx envía el fichero (y el rango): la respuesta de Django va vacía
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Accel-Redirect'], f'/protegido/{self.documento.archivo.name}')
+        self.assertEqual(response.content, b'')
+
+
+class SubidaFragmentadaTest(ProcedimientoTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        Paso.objects.create(procedimiento=cls.procedimiento, numero=1, titulo="Envío", requiere_envio=True)
+        trabajo = Trabajo.objects.abrir(cls.procedimiento, [cls.unidad], cls.usuario, "Trabajo")[0]
+        cls.paso_trabajo = trabajo.pasos_trabajo.get()
+        if cls.paso_trabajo.estado == 'PENDIENTE':
+            cls.paso_trabajo.iniciar_paso(cls.usuario)
+
+    def setUp(self):
+        super().setUp()
+        # Las subidas en curso, fuera de MEDIA_ROOT
+        self.usar_media_temporal(SUBIDAS_DIRECTORIO=tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, settings.SUBIDAS_DIRECTORIO, ignore_errors=True)
+
+    def enviar(self, subida, datos, offset):
+        return self.client.put(
+            f'/api/procedimientos/subidas/{subida}/fragmento/?offset={offset}',
+            datos, content_type='application/octet-stream'
+        )
+
+    def test_subida_reanudable_y_completar_paso(self):
+        contenido = os.urandom(3 * 1024 * 1024 + 100)
+        subida = self.client.post('/api/procedimientos/subidas/', {
+            'nombre': 'Oficio.pdf', 'tamano': len(contenido)
+        }).data['id']
+        
+        self.assertEqual(self.enviar(subida, contenido[:1024 * 1024], 0).data['recibido'], 1024 * 1024)
+        # Un fragmento repetido o desordenado no se escribe: se indica desde dónde seguir
+        response = self.enviar(subida, contenido[:1024 * 1024], 0)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['recibido'], 1024 * 1024)
+        # Sin terminar no se puede finalizar
+        self.assertEqual(self.client.post(f'/api/procedimientos/subidas/{subida}/finalizar/').status_code, 400)
+        # Mientras otra petición escribe (fichero bloqueado) el fragmento se rechaza
+        ruta = SubidaFragmentada.objects.get(pk=subida).ruta
+        self.assertFalse(ruta.startswith(settings.MEDIA_ROOT))
+        with open(ruta, 'r+b') as fichero:
+            locks.lock(fichero, locks.LOCK_EX)
+            self.assertEqual(self.enviar(subida, contenido[1024 * 1024:], 1024 * 1024).status_code, 409)
+        
+        self.enviar(subida, contenido[1024 * 1024:], self.client.get(f'/api/procedimientos/subidas/{subida}/').data['recibido'])
+        response = self.client.post(f'/api/procedimientos/subidas/{subida}/finalizar/', {
+            'sha256': hashlib.sha256(contenido).hexdigest()
+        })
+        self.assertEqual(response.status_code, 200)
+        
+        response = self.client.post(f'/api/procedimientos/pasos-trabajo/{self.paso_trabajo.pk}/completar/', {
+            'numero_salida': 'S-25', 'subida': subida
+        })
+        self.assertEqual(response.status_code, 200)
+        envio = EnvioPaso.objects.get(paso_trabajo=self.paso_trabajo)
+        self.assertTrue(envio.documentacion.name.endswith('/Oficio.pdf'))
+        with envio.documentacion.open('rb') as fichero:
+            self.assertEqual(fichero.read(), contenido)
+        detalle = self.client.get(f'/api/procedimientos/pasos-trabajo/{self.paso_trabajo.pk}/').data
+        self.assertEqual(detalle['envio']['documentacion'], f'http://testserver/downloads/{envio.documentacion.name}')
+        # El fichero se ha movido al envío y la subida ya no existe
+        self.assertFalse(os.path.exists(ruta))
+        self.assertFalse(SubidaFragmentada.objects.exists())
+
+    def test_otro_usuario_no_ve_la_subida(self):
+        subida = self.client.post('/api/procedimientos/subidas/', {'nombre': '../../x.pdf', 'tamano': 10}).data
+        self.assertEqual(subida['nombre'], 'x.pdf')
+        otro = crear_usuario('Luis', 'Gil')
+        cliente = APIClient()
+        cliente.force_authenticate(otro)
+        self.assertEqual(cliente.get(f"/api/procedimientos/subidas/{subida['id']}/").status_code, 404)
@@ -10,10 +10,13 @@ router.register(r'documentos', views.DocumentoViewSet)
 router.register(r'historial', views.HistorialProcedimientoViewSet, basename='historial')
 router.register(r'trabajos', views.TrabajoViewSet)
 router.register(r'pasos-trabajo', views.PasoTrabajoViewSet)
+router.register(r'subidas', views.SubidaFragmentadaViewSet, basename='subidas')
 
 urlpatterns = [
     path('', include(router.urls)),
     path('media/documentos/<path:path>', views.download_document, name='document-download'),
+    path('descargas/firmar/', views.firmar_descarga, name='firmar-descarga'),
     path('api/procedimientos/', include(router.urls)),
     path('alertas-plazos/', views.alertas_plazos, name='alertas-plazos'),
+    path('alertas-plazos/stream/', views.alertas_plazos_stream, name='alertas-plazos-stream'),
 ]
\ No newline at end of file
@@ -7,7 +7,7 @@ from django_filters.rest_framework import DjangoFilterBackend
 import os  # Añadir esta importación
 from django.db import models, transaction  # Añadir esta importación
 # Corregir nombre del modelo aquí
-from .models import TipoProcedimiento, Procedimiento, Paso, Documento, HistorialProcedimiento, DocumentoPaso
+from .models import TipoProcedimiento, Procedimiento, Paso, Documento, HistorialProcedimiento, DocumentoPaso, InstantaneaProcedimiento, CicloProcedimientosError
 from .serializers import (
     TipoProcedimientoSerializer,
     ProcedimientoListSerializer,
@@ -18,6 +18,11 @@ from .serializers import (
     DocumentoPasoSerializer  # Usar este nombre coherentemente
 )
 from .permissions import IsAdminOrSuperAdmin, IsAdminOrSuperAdminOrReadOnly
+from siga_project.consultas import PrecargaPorAccionMixin
+from siga_project.paginacion import PaginacionPaginaOCursor
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from rest_framework.generics import get_object_or_404
 
 class TipoProcedimientoViewSet(viewsets.ModelViewSet):
     queryset = TipoProcedimiento.objects.all()
@@ -59,19 +64,59 @@ class DocumentoViewSet(viewsets.ModelViewSet):
             # La función documento_upload_path se encargará de la ruta correcta
             pass
 
-class ProcedimientoViewSet(viewsets.ModelViewSet):
-    queryset = Procedimiento.objects.all()
+def respuesta_instantanea(request, instantanea):
+    """
+    Devuelve el JSON de una InstantaneaProcedimiento tal cual, con su ETag fuerte. Si
+    el cliente ya la tiene (If-None-Match) responde 304 sin cuerpo.
+    """
+    etag = f'"{instantanea.etag}"'
+    response = HttpResponse(instantanea.contenido, content_type='application/json')
+    response['ETag'] = etag
+    # El navegador puede guardarla, pero debe revalidarla en cada uso
+    response['Cache-Control'] = 'private, no-cache'
+    return get_conditional_response(request, etag=etag, response=response)
+
+class ProcedimientoViewSet(PrecargaPorAccionMixin, viewsets.ModelViewSet):
+    # Tipo, procedimiento relacionado y número de derivados en la misma consulta
+    queryset = Procedimiento.objects.select_related('tipo', 'procedimiento_relacionado').con_derivados()
     permission_classes = [IsAdminOrSuperAdminOrReadOnly]
+    pagination_class = PaginacionPaginaOCursor
+    ordering = ['-fecha_actualizacion', '-id']
     filter_backends = [filters.SearchFilter, filters.OrderingFilter, DjangoFilterBackend]
     search_fields = ['nombre', 'descripcion']
     ordering_fields = ['nombre', 'tipo__nombre', 'nivel', 'estado', 'fecha_actualizacion']
     filterset_fields = ['tipo', 'nivel', 'estado', 'creado_por']
     
+    def precargar_retrieve(self, queryset):
+        # ProcedimientoDetailSerializer: lista de derivados y pasos con sus documentos
+        return queryset.prefetch_related('procedimientos_derivados').con_pasos()
+    
+    precargar_update = precargar_partial_update = precargar_nueva_version = precargar_retrieve
+    
     def get_serializer_class(self):
         if self.action == 'list':
             return ProcedimientoListSerializer
         return ProcedimientoDetailSerializer
     
+    def retrieve(self, request, *args, **kwargs):
+        """
+        Detalle servido desde la instantánea de la versión actual (una consulta por
+        clave), compilándola si aún no existe. ?version= devuelve la instantánea de
+        una versión anterior.
+        """
+        instantaneas = InstantaneaProcedimiento.objects.all()
+        version = request.query_params.get('version')
+        if version:
+            instantanea = get_object_or_404(instantaneas, procedimiento_id=kwargs['pk'], version=version)
+            return respuesta_instantanea(request, instantanea)
+        
+        try:
+            instantanea = instantaneas.vigentes().get(procedimiento_id=kwargs['pk'])
+        except (InstantaneaProcedimiento.DoesNotExist, ValueError):
+            # Sin compilar todavía (con un pk no válido get_object responde 404)
+            instantanea = InstantaneaProcedimiento.objects.generar(self.get_object())
+        return respuesta_instantanea(request, instantanea)
+    
     def perform_create(self, serializer):
         serializer.save(
             creado_por=self.request.user,
@@ -103,6 +148,11 @@ class ProcedimientoViewSet(viewsets.ModelViewSet):
                 usuario=self.request.user,
                 descripcion_cambio=serializer.validated_data.get('descripcion_cambio', 'Actualización del procedimiento')
             )
+        
+        # Recompilar la instantánea con los datos actualizados
+        InstantaneaProcedimiento.objects.generar(
+            Procedimiento.objects.para_detalle().get(pk=serializer.instance.pk)
+        )
     
     @action(detail=True, methods=['post'])
     def nueva_version(self, request, pk=None):
@@ -130,26 +180,20 @@ class ProcedimientoViewSet(viewsets.ModelViewSet):
             descripcion_cambio=descripcion
         )
         
-        serializer = self.get_serializer(procedimiento)
-        return Response(serializer.data)
+        # Instantánea de la nueva versión; la de la anterior se conserva
+        instantanea = InstantaneaProcedimiento.objects.generar(procedimiento)
+        return respuesta_instantanea(request, instantanea)
     
     @action(detail=True, methods=['get'])
     def cadena_completa(self, request, pk=None):
         """Devuelve la cadena completa de procedimientos relacionados"""
         procedimiento = self.get_object()
         
-        # Encontrar el procedimiento inicial (nivel más bajo)
-        proc_inicial = procedimiento
-        while Procedimiento.objects.filter(procedimiento_relacionado=proc_inicial).exists():
-            proc_inicial = Procedimiento.objects.filter(procedimiento_relacionado=proc_inicial).first()
-        
-        # Construir la cadena completa desde el inicial
-        cadena = [proc_inicial]
-        proc_actual = proc_inicial
-        
-        while proc_actual.procedimiento_relacionado:
-            proc_actual = proc_actual.procedimiento_relacionado
-            cadena.append(proc_actual)
+        # Un único recorrido recursivo en base de datos, sea cual sea la longitud
+        try:
+            cadena = Procedimiento.objects.cadena(procedimiento)
+        except CicloProcedimientosError as e:
+            return Response({'detail': str(e)}, status=status.HTTP_409_CONFLICT)
         
         # Serializar la cadena
         serializer = ProcedimientoListSerializer(cadena, many=True)
@@ -199,8 +243,9 @@ class ProcedimientoViewSet(viewsets.ModelViewSet):
 
 # Modificar la clase PasoViewSet
 
-class PasoViewSet(viewsets.ModelViewSet):
-    queryset = Paso.objects.all()
+class PasoViewSet(PrecargaPorAccionMixin, viewsets.ModelViewSet):
+    # Documentos de cada paso precargados para PasoSerializer
+    queryset = Paso.objects.con_documentos()
     serializer_class = PasoSerializer
     filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
     filterset_fields = ['procedimiento']
@@ -278,72 +323,36 @@ class PasoViewSet(viewsets.ModelViewSet):
         
         if request.method == 'GET':
             # Obtener documentos asociados al paso
-            paso_documentos = DocumentoPaso.objects.filter(paso=paso)
+            paso_documentos = DocumentoPaso.objects.filter(paso=paso).select_related('documento')
             serializer = DocumentoPasoSerializer(paso_documentos, many=True)
             return Response(serializer.data)
         
         elif request.method == 'POST':
-            # Si viene un archivo en la petición, crear un nuevo documento
+            # Si viene un archivo en la petición, crear un nuevo documento del paso
             if request.FILES.get('archivo'):
-                try:
-                    import os
-                    from django.conf import settings
-                    
-                    # Preparar los datos para crear un nuevo documento
-                    documento_data = {
-                        'nombre': request.data.get('nombre', 'Documento sin título'),
-                        'descripcion': request.data.get('descripcion', ''),
-                        'procedimiento': paso.procedimiento.id,
-                        'archivo': request.FILES.get('archivo')
-                    }
-                    
-                    # Crear el documento temporalmente en general
-                    documento_serializer = DocumentoSerializer(data=documento_data)
-                    if (documento_serializer.is_valid()):
-                        documento_temp = documento_serializer.save()
-                        
-                        # Guardar la ruta del archivo original para eliminarlo después
-                        ruta_original = None
-                        if documento_temp.archivo and hasattr(documento_temp.archivo, 'path'):
-                            ruta_original = documento_temp.archivo.path
-                            
-                        # Ahora crear la relación con el paso, lo que moverá el archivo a la carpeta de pasos
-                        documento_paso = DocumentoPaso(
-                            paso=paso,
-                            documento=documento_temp,
-                            orden=request.data.get('orden', 1),
-                            notas=request.data.get('notas', '')
-                        )
-                        
-                        # Al guardar DocumentoPaso, su método save() crea una copia en la carpeta de pasos
-                        documento_paso.save()
-                        
-                        # Eliminar el archivo original si todavía existe y es diferente al nuevo
-                        if ruta_original and os.path.exists(ruta_original):
-                            # Verificar si la ruta contiene 'general' para confirmar que no es el archivo final
-                            if '/general/' in ruta_original or '\\general\\' in ruta_original:
-                                try:
-                                    os.remove(ruta_original)
-                                    print(f"Archivo original eliminado: {ruta_original}")
-                                except Exception as e:
-                                    print(f"Error al eliminar archivo original: {str(e)}")
-                        
-                        return Response(
-                            DocumentoPasoSerializer(documento_paso).data, 
-                            status=status.HTTP_201_CREATED
-                        )
-                    
-                    return Response(documento_serializer.errors, status=status.HTTP_400_BAD_REQUEST)
-                        
-                except Exception as e:
-                    # Si hay un error, asegurarse de limpiar cualquier documento creado
-                    if 'documento_temp' in locals() and documento_temp:
-                        documento_temp.delete()
-                    import traceback
-                    return Response({
-                        'error': str(e),
-                        'trace': traceback.format_exc()
-                    }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+                documento_serializer = DocumentoSerializer(data={
+                    'nombre': request.data.get('nombre', 'Documento sin título'),
+                    'descripcion': request.data.get('descripcion', ''),
+                    'procedimiento': paso.procedimiento_id,
+                    'archivo': request.FILES.get('archivo')
+                })
+                documento_serializer.is_valid(raise_exception=True)
+                datos = documento_serializer.validated_data
+                
+                # Documento y relación con el paso en una transacción; el archivo se
+                # escribe una sola vez, ya en su ubicación definitiva
+                documento_paso = DocumentoPaso.objects.adjuntar_archivo(
+                    paso,
+                    datos['archivo'],
+                    nombre=datos['nombre'],
+                    descripcion=datos.get('descripcion') or '',
+                    orden=request.data.get('orden', 1),
+                    notas=request.data.get('notas', ''),
+                )
+                return Response(
+                    DocumentoPasoSerializer(documento_paso).data, 
+                    status=status.HTTP_201_CREATED
+                )
     
     @action(detail=True, methods=['delete'], url_path='documentos/(?P<documento_id>[^/.]+)')
     def eliminar_documento(self, request, pk=None, documento_id=None):
@@ -355,16 +364,10 @@ class PasoViewSet(viewsets.ModelViewSet):
             # Obtener el documento asociado
             documento = paso_documento.documento
             
-            # Siempre eliminamos el documento físico ya que ahora cada paso tiene su propia copia
-            archivo_path = documento.archivo.path if documento.archivo else None
-            
-            # Eliminar la relación y el documento
+            # Eliminar la relación y el documento del paso; Documento.delete elimina su
+            # archivo o libera su blob, que solo se borra si ningún otro documento lo usa
             paso_documento.delete()
             documento.delete()
-            
-            # Si había un archivo físico, eliminarlo
-            if archivo_path and os.path.exists(archivo_path):
-                os.remove(archivo_path)
                 
             return Response(status=status.HTTP_204_NO_CONTENT)
         except DocumentoPaso.DoesNotExist:
@@ -383,10 +386,15 @@ class PasoViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
-class HistorialProcedimientoViewSet(viewsets.ReadOnlyModelViewSet):
-    queryset = HistorialProcedimiento.objects.all()
+class HistorialProcedimientoViewSet(PrecargaPorAccionMixin, viewsets.ReadOnlyModelViewSet):
+    # usuario_detalle (UserSerializer) muestra la unidad de destino, la de acceso y el empleo
+    queryset = HistorialProcedimiento.objects.select_related(
+        'usuario__unidad_destino', 'usuario__unidad_acceso', 'usuario__empleo'
+    )
     serializer_class = HistorialProcedimientoSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = PaginacionPaginaOCursor
+    ordering = ['-fecha_cambio', '-id']
     filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
     filterset_fields = ['procedimiento']
     ordering_fields = ['fecha_cambio']
@@ -398,103 +406,146 @@ class HistorialProcedimientoViewSet(viewsets.ReadOnlyModelViewSet):
             queryset = queryset.filter(procedimiento_id=procedimiento_id)
         return queryset
 
-# Añadir esta vista para manejo de descargas
+# Descarga de documentos
 
-from django.http import FileResponse, HttpResponse
-from django.conf import settings
-import os
 import mimetypes
+import stat
+from urllib.parse import parse_qsl, unquote, urlsplit
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import Http404
+from django.urls import reverse
+from django.utils._os import safe_join
+from django.utils.http import http_date
+from rest_framework.decorators import api_view, authentication_classes, permission_classes
+from rest_framework.settings import api_settings
+from .descargas import FicheroDescarga, FirmaDescargaAuthentication, etag_fichero, obtener_servidor, url_descarga
+from .models import EnvioPaso
+from .permissions import IsOwnerOrSameUnit
 
-def download_document(request, path):
+def _nombre_descarga(request, nombre, documento_id=None):
     """
-    Vista que sirve archivos con Content-Disposition: attachment para forzar descarga
+    Nombre con el que se descarga el fichero nombre (relativo a MEDIA_ROOT), o None si
+    el usuario no puede verlo. Los archivos de los documentos de procedimientos los ve
+    cualquier usuario autenticado; la documentación de un envío, quien puede ver su
+    trabajo.
     """
-    # Sanitizar el path para evitar vulnerabilidades
-    path = path.replace('..', '').replace('\\', '/').lstrip('/')
-    
-    # Construir path completo
-    full_path = os.path.join(settings.MEDIA_ROOT, path)
-    
-    # Verificar que el archivo existe
-    if not os.path.exists(full_path) or not os.path.isfile(full_path):
-        return HttpResponse("Archivo no encontrado", status=404)
-    
-    # Determinar tipo MIME
-    content_type, _ = mimetypes.guess_type(full_path)
-    if not content_type:
-        content_type = 'application/octet-stream'
-    
-    # Obtener nombre del archivo
-    filename = os.path.basename(full_path)
-    
-    # Abrir y servir el archivo
-    file = open(full_path, 'rb')
-    response = FileResponse(file, content_type=content_type)
-    
-    # Importante: establecer Content-Disposition como attachment para forzar descarga
-    response['Content-Disposition'] = f'attachment; filename="{filename}"'
-    
-    return response
+    documentos = Documento.objects.filter(archivo=nombre).only('nombre', 'extension', 'blob')
+    # Un blob puede ser de varios documentos: documento_id indica cuál
+    documento = documentos.filter(pk=documento_id).first() if str(documento_id).isdigit() else None
+    documento = documento or documentos.first()
+    if documento is not None:
+        if documento.blob_id and documento.extension:
+            # En el almacén de contenidos el fichero se llama como su hash
+            return f"{documento.nombre}.{documento.extension}"
+        return os.path.basename(nombre)
 
-# Añadir al final del archivo:
+    envio = EnvioPaso.objects.select_related('paso_trabajo__trabajo').filter(documentacion=nombre).first()
+    if envio is not None and IsOwnerOrSameUnit().has_object_permission(request, None, envio.paso_trabajo):
+        return os.path.basename(nombre)
+    return None
 
-from django.http import FileResponse, HttpResponse
-from django.conf import settings
-import os
-import mimetypes
+def _fichero_descarga(request, path, documento_id=None):
+    """
+    Ruta en disco, estado (os.stat), nombre relativo a MEDIA_ROOT y nombre de descarga
+    del fichero path que el usuario puede ver. Lanza Http404 si no existe, está fuera
+    de MEDIA_ROOT o el usuario no puede verlo.
+    """
+    try:
+        ruta = safe_join(settings.MEDIA_ROOT, path)
+        estado = os.stat(ruta)
+    except (SuspiciousFileOperation, OSError):
+        raise Http404
+    nombre = os.path.relpath(ruta, settings.MEDIA_ROOT).replace(os.sep, '/')
+    nombre_descarga = _nombre_descarga(request, nombre, documento_id) if stat.S_ISREG(estado.st_mode) else None
+    if nombre_descarga is None:
+        raise Http404
+    return ruta, estado, nombre, nombre_descarga
 
+@api_view(['GET', 'HEAD'])
+@authentication_classes([*api_settings.DEFAULT_AUTHENTICATION_CLASSES, FirmaDescargaAuthentication])
+@permission_classes([IsAuthenticated])
 def download_document(request, path):
     """
-    Función para descargar documentos
+    Descarga (Content-Disposition: attachment) de un fichero de MEDIA_ROOT que el
+    usuario puede ver, con la cabecera Authorization o con la firma de una URL de
+    firmar_descarga. Atiende las peticiones condicionales (ETag y fecha de
+    modificación) y deja el envío del fichero al servidor configurado en
+    DESCARGAS_SERVIDOR (ver procedimientos/descargas.py).
     """
-    file_path = os.path.join(settings.MEDIA_ROOT, path)
-    
-    if os.path.exists(file_path):
-        # Determinar el tipo MIME
-        content_type, encoding = mimetypes.guess_type(file_path)
-        if content_type is None:
-            content_type = 'application/octet-stream'
-        
-        # Abrir el archivo
-        file = open(file_path, 'rb')
-        response = FileResponse(file, content_type=content_type)
-        
-        # Establecer cabeceras para forzar descarga
-        filename = os.path.basename(file_path)
-        response['Content-Disposition'] = f'attachment; filename="{filename}"'
-        
-        return response
-    else:
-        return HttpResponse(status=404)
+    ruta, estado, nombre, nombre_descarga = _fichero_descarga(
+        request, path, request.query_params.get('documento')
+    )
+
+    etag = etag_fichero(estado.st_size, estado.st_mtime)
+    response = get_conditional_response(request, etag=etag, last_modified=int(estado.st_mtime))
+    if response is None:
+        content_type, _ = mimetypes.guess_type(nombre_descarga)
+        fichero = FicheroDescarga(
+            ruta=ruta,
+            nombre=nombre,
+            tamano=estado.st_size,
+            modificado=estado.st_mtime,
+            content_type=content_type or 'application/octet-stream',
+            nombre_descarga=nombre_descarga,
+        )
+        response = obtener_servidor().servir(request, fichero, etag)
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(estado.st_mtime)
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def firmar_descarga(request):
+    """
+    URL firmada y de corta duración (url_descarga) para abrir desde un enlace la URL de
+    descarga indicada en el parámetro url, tal como aparece en archivo_url o en la
+    documentación de un envío.
+    """
+    partes = urlsplit(request.query_params.get('url', ''))
+    prefijo = reverse('download_document', args=['-'])[:-1]
+    if not partes.path.startswith(prefijo):
+        return Response({"error": "No es una URL de descarga"}, status=status.HTTP_400_BAD_REQUEST)
+    documento_id = dict(parse_qsl(partes.query)).get('documento')
+    _, _, nombre, _ = _fichero_descarga(request, unquote(partes.path[len(prefijo):]), documento_id)
+    parametros = {'documento': documento_id} if documento_id else {}
+    return Response({'url': url_descarga(request, nombre, **parametros)})
 
 from rest_framework import viewsets, mixins, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from django.db.models import Q
+from django.db.models import Prefetch, Q
 from django.utils import timezone
-from .models import Trabajo, PasoTrabajo, EnvioPaso
+from .models import Trabajo, PasoTrabajo, EnvioPaso, AlertaPlazo, SubidaFragmentada, SubidaFragmentadaError, FragmentoFueraDeOrden
 from .serializers import (
     TrabajoListSerializer, TrabajoDetailSerializer, TrabajoCreateSerializer,
-    PasoTrabajoListSerializer, PasoTrabajoDetailSerializer, EnvioPasoSerializer
+    TrabajoLoteSerializer, TrabajoSerializer,
+    PasoTrabajoListSerializer, PasoTrabajoDetailSerializer, EnvioPasoSerializer,
+    SubidaFragmentadaSerializer
 )
 from .permissions import IsOwnerOrSameUnit
 
 # Vistas existentes...
 
-class TrabajoViewSet(viewsets.ModelViewSet):
+class TrabajoViewSet(PrecargaPorAccionMixin, viewsets.ModelViewSet):
     queryset = Trabajo.objects.all()
     permission_classes = [IsOwnerOrSameUnit]
+    pagination_class = PaginacionPaginaOCursor
+    ordering = ['-fecha_inicio', '-id']
     
     def get_serializer_class(self):
         if self.action == 'create':
             return TrabajoCreateSerializer
+        if self.action == 'crear_lote':
+            return TrabajoLoteSerializer
         if self.action == 'list':
             return TrabajoListSerializer
         return TrabajoDetailSerializer
     
     def get_queryset(self):
         user = self.request.user
-        queryset = Trabajo.objects.all()
+        queryset = super().get_queryset()
         
         # Si el usuario es superadmin o admin, mostrar todos los trabajos
         if user.is_superuser or user.tipo_usuario == 'ADMIN':  # Usar tipo_usuario en vez de role
@@ -503,21 +554,78 @@ class TrabajoViewSet(viewsets.ModelViewSet):
         # Para usuarios normales, filtrar por usuario_creador y unidad_destino
         filters = Q(usuario_creador=user)
         
-        if hasattr(user, 'unidad_destino') and user.unidad_destino is not None:
-            filters |= Q(unidad=user.unidad_destino)
+        if user.unidad_destino_id is not None:
+            filters |= Q(unidad_id=user.unidad_destino_id)
         
         return queryset.filter(filters)
     
+    def precargar_list(self, queryset):
+        # TrabajoListSerializer: nombres del procedimiento, del creador y de la unidad
+        return queryset.select_related('procedimiento', 'usuario_creador', 'unidad')
+    
+    def precargar_retrieve(self, queryset):
+        # TrabajoDetailSerializer: la instantánea de la versión actual del
+        # procedimiento, sus documentos generales y los pasos del trabajo
+        return queryset.select_related('usuario_creador', 'unidad', 'procedimiento').prefetch_related(
+            'procedimiento__documentos',
+            Prefetch(
+                'procedimiento__instantaneas',
+                queryset=InstantaneaProcedimiento.objects.vigentes(),
+                to_attr='instantaneas_vigentes',
+            ),
+            Prefetch('pasos_trabajo', queryset=PasoTrabajo.objects.select_related('paso')),
+        )
+    
+    precargar_update = precargar_partial_update = precargar_retrieve
+    
+    def retrieve(self, request, *args, **kwargs):
+        trabajo = self.get_object()
+        # Si el procedimiento aún no tiene instantánea, compilarla antes de serializar
+        InstantaneaProcedimiento.objects.vigente(trabajo.procedimiento)
+        serializer = self.get_serializer(trabajo)
+        return Response(serializer.data)
+    
     def perform_create(self, serializer):
         serializer.save(
             usuario_creador=self.request.user,
             unidad=self.request.user.unidad_destino  # Cambiar a unidad_destino
         )
     
+    def perform_update(self, serializer):
+        # Las alertas de plazo copian el título, el estado, la unidad y los usuarios
+        # del trabajo: rehacerlas si cambia alguno
+        def copiados(trabajo):
+            return (trabajo.titulo, trabajo.estado, trabajo.unidad_id,
+                    trabajo.usuario_creador_id, trabajo.usuario_iniciado_id)
+        anteriores = copiados(serializer.instance)
+        trabajo = serializer.save()
+        if copiados(trabajo) != anteriores:
+            AlertaPlazo.objects.refrescar(trabajos=[trabajo.pk])
+    
+    @action(detail=False, methods=['post'])
+    def crear_lote(self, request):
+        """
+        Abre el mismo procedimiento en varias unidades con una sola petición (por
+        ejemplo, en todos los Puestos de una Comandancia). Trabajos y pasos se crean
+        con inserciones masivas dentro de una transacción.
+        """
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        trabajos = serializer.save()
+        
+        return Response({
+            'total': len(trabajos),
+            'trabajos': [
+                {'id': trabajo.id, 'unidad': trabajo.unidad_id, 'titulo': trabajo.titulo}
+                for trabajo in trabajos
+            ],
+        }, status=status.HTTP_201_CREATED)
+    
     @action(detail=True, methods=['post'])
     def cancelar(self, request, pk=None):
         trabajo = self.get_object()
         trabajo.cancelar_trabajo()
+        AlertaPlazo.objects.refrescar(trabajos=[trabajo.pk])
         return Response({"message": "Trabajo cancelado correctamente"})
     
     @action(detail=True, methods=['post'])
@@ -530,19 +638,21 @@ class TrabajoViewSet(viewsets.ModelViewSet):
     def reanudar(self, request, pk=None):
         trabajo = self.get_object()
         trabajo.reanudar_trabajo()
+        AlertaPlazo.objects.refrescar(trabajos=[trabajo.pk])
         return Response({"message": "Trabajo reanudado correctamente"})
 
 
-class PasoTrabajoViewSet(viewsets.GenericViewSet, 
-                       mixins.RetrieveModelMixin, 
-                       mixins.UpdateModelMixin):
+class PasoTrabajoViewSet(PrecargaPorAccionMixin,
+                         viewsets.GenericViewSet, 
+                         mixins.RetrieveModelMixin, 
+                         mixins.UpdateModelMixin):
     queryset = PasoTrabajo.objects.all()
     serializer_class = PasoTrabajoDetailSerializer
     permission_classes = [IsOwnerOrSameUnit]
     
     def get_queryset(self):
         user = self.request.user
-        queryset = PasoTrabajo.objects.all()
+        queryset = super().get_queryset()
         
         # Si el usuario es superadmin o admin, mostrar todos los pasos
         if user.is_superuser or user.tipo_usuario in ['SuperAdmin', 'Admin']:
@@ -552,11 +662,33 @@ class PasoTrabajoViewSet(viewsets.GenericViewSet,
         filters = Q(trabajo__usuario_creador=user)
         
         # Usar unidad_destino en lugar de unidad
-        if hasattr(user, 'unidad_destino') and user.unidad_destino is not None:
-            filters |= Q(trabajo__unidad=user.unidad_destino)
+        if user.unidad_destino_id is not None:
+            filters |= Q(trabajo__unidad_id=user.unidad_destino_id)
         
         return queryset.filter(filters)
     
+    def precargar_retrieve(self, queryset):
+        # Trabajo para el permiso; paso con sus documentos, envío y usuario para
+        # PasoTrabajoDetailSerializer
+        return queryset.select_related(
+            'trabajo', 'paso', 'envio', 'usuario_completado'
+        ).prefetch_related(
+            Prefetch('paso__documento_paso', queryset=DocumentoPaso.objects.select_related('documento'))
+        )
+    
+    precargar_update = precargar_partial_update = precargar_completar = precargar_retrieve
+    
+    def precargar_iniciar(self, queryset):
+        return queryset.select_related('trabajo', 'paso')
+    
+    def perform_update(self, serializer):
+        # Mantener el contador de pasos completados del trabajo si cambia el estado
+        estado_anterior = serializer.instance.estado
+        paso_trabajo = serializer.save()
+        paso_trabajo.actualizar_contador_trabajo(estado_anterior)
+        if paso_trabajo.estado != estado_anterior:
+            AlertaPlazo.objects.refrescar(trabajos=[paso_trabajo.trabajo_id])
+    
     @action(detail=True, methods=['post'])
     def iniciar(self, request, pk=None):
         paso_trabajo = self.get_object()
@@ -568,12 +700,9 @@ class PasoTrabajoViewSet(viewsets.GenericViewSet,
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Iniciar el paso
-        paso_trabajo.estado = 'EN_PROGRESO'
-        paso_trabajo.fecha_inicio = timezone.now()
-        paso_trabajo.save()
-        
-        # La fecha límite se calculará automáticamente a través del property
+        # Iniciar el paso (fija también su fecha límite)
+        paso_trabajo.iniciar_paso(request.user)
+        AlertaPlazo.objects.refrescar(trabajos=[paso_trabajo.trabajo_id])
         
         return Response({"mensaje": "Paso iniciado correctamente"})
     
@@ -590,20 +719,40 @@ class PasoTrabajoViewSet(viewsets.GenericViewSet,
         
         # Verificar si el paso requiere envío
         if paso_trabajo.paso.requiere_envio:
-            # Aquí el backend espera numero_salida como campo directo, no dentro de un JSON 
-            if not request.data.get('numero_salida') or 'documentacion' not in request.FILES:
+            # Aquí el backend espera numero_salida como campo directo, no dentro de un JSON.
+            # La documentación llega en la misma petición o, si es grande, como id de una
+            # subida fragmentada ya finalizada (subida)
+            subida_id = request.data.get('subida')
+            if not request.data.get('numero_salida') or not (subida_id or 'documentacion' in request.FILES):
                 return Response(
                     {"error": "Se requiere número de salida y documentación"}, 
                     status=status.HTTP_400_BAD_REQUEST
                 )
             
+            subida = None
+            if subida_id:
+                subida = SubidaFragmentada.objects.filter(
+                    pk=subida_id, usuario=request.user, finalizada__isnull=False
+                ).first()
+                if subida is None:
+                    return Response(
+                        {"error": "La subida no existe o no está finalizada"},
+                        status=status.HTTP_400_BAD_REQUEST
+                    )
+            
             # Crear el registro de envío
-            EnvioPaso.objects.create(
+            envio = EnvioPaso(
                 paso_trabajo=paso_trabajo,
                 numero_salida=request.data.get('numero_salida'),
-                documentacion=request.FILES['documentacion'],
                 notas_adicionales=request.data.get('notas_adicionales', '')
             )
+            if subida is not None:
+                subida.adjuntar(envio.documentacion)
+            else:
+                envio.documentacion = request.FILES['documentacion']
+            envio.save()
+            if subida is not None:
+                subida.delete()
         
         # Si hay bifurcaciones, verificar que se eligió una
         if paso_trabajo.paso.bifurcaciones and len(paso_trabajo.paso.bifurcaciones) > 0:
@@ -637,107 +786,230 @@ class PasoTrabajoViewSet(viewsets.GenericViewSet,
                 siguiente_paso.estado = 'PENDIENTE'
                 siguiente_paso.save()
         
+        # El paso completado (o el trabajo, si era el último) deja de generar alerta
+        AlertaPlazo.objects.refrescar(trabajos=[paso_trabajo.trabajo_id])
+        
         serializer = self.get_serializer(paso_trabajo)
         return Response(serializer.data)
 
+class SubidaFragmentadaViewSet(mixins.CreateModelMixin,
+                               mixins.RetrieveModelMixin,
+                               mixins.DestroyModelMixin,
+                               viewsets.GenericViewSet):
+    """
+    Subida reanudable de la documentación de un envío:
+    
+    - POST subidas/ {nombre, tamano} crea la subida.
+    - PUT subidas/<id>/fragmento/?offset=N envía un fragmento (cuerpo binario) que
+      empieza en el byte N, que debe ser lo recibido hasta ahora.
+    - GET subidas/<id>/ indica lo recibido, para reanudar tras un corte.
+    - POST subidas/<id>/finalizar/ {sha256 opcional} la da por completa; su id se pasa
+      después como subida al completar el paso. DELETE la cancela.
+    """
+    serializer_class = SubidaFragmentadaSerializer
+    permission_classes = [IsAuthenticated]
+    
+    def get_queryset(self):
+        return SubidaFragmentada.objects.filter(usuario=self.request.user)
+    
+    def perform_create(self, serializer):
+        serializer.save(usuario=self.request.user)
+    
+    @action(detail=True, methods=['put'])
+    def fragmento(self, request, pk=None):
+        subida = self.get_object()
+        if subida.finalizada:
+            return Response({"error": "La subida ya está finalizada"}, status=status.HTTP_400_BAD_REQUEST)
+        
+        try:
+            offset = int(request.query_params.get('offset', ''))
+            longitud = int(request.META.get('CONTENT_LENGTH') or '')
+        except ValueError:
+            return Response(
+                {"error": "Se requiere el offset del fragmento y su Content-Length"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if offset < 0 or offset + longitud > subida.tamano:
+            return Response(
+                {"error": "El fragmento queda fuera del tamaño de la subida"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        try:
+            # El cuerpo se lee por bloques directamente de la petición, sin cargarlo
+            subida.escribir(request.stream, offset, longitud)
+        except FragmentoFueraDeOrden:
+            subida.refresh_from_db()
+            return Response(
+                {"error": "El fragmento no empieza donde termina lo recibido", "recibido": subida.recibido},
+                status=status.HTTP_409_CONFLICT
+            )
+        return Response(self.get_serializer(subida).data)
+    
+    @action(detail=True, methods=['post'])
+    def finalizar(self, request, pk=None):
+        subida = self.get_object()
+        try:
+            subida.finalizar(request.data.get('sha256'))
+        except SubidaFragmentadaError as e:
+            return Response(
+                {"error": str(e), "recibido": subida.recibido}, status=status.HTTP_400_BAD_REQUEST
+            )
+        return Response(self.get_serializer(subida).data)
+
 from rest_framework.decorators import api_view, permission_classes
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from asgiref.sync import sync_to_async
+from django.core.serializers.json import DjangoJSONEncoder
+from django.core.handlers.asgi import ASGIRequest
+from django.http import JsonResponse, StreamingHttpResponse
+import json
+from .eventos import CANAL_GLOBAL, ESPERA_RECONEXION_MS, canal_unidad, obtener_broker
+
+class AlertasPlazosPagination(PageNumberPagination):
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def alertas_plazos(request):
-    """Obtener alertas de pasos próximos a vencer o ya vencidos para el usuario y su unidad"""
+    """
+    Obtener alertas de pasos próximos a vencer (3 días) o ya vencidos para el usuario y su unidad.
+    
+    Se leen de la tabla precalculada AlertaPlazo (una consulta sobre el índice por
+    unidad), ordenadas en la base de datos: primero los pasos propios (salvo en la
+    vista global del SuperAdmin), luego los vencidos y por días restantes. La
+    respuesta es una lista; si se indica page o page_size se pagina
+    ({count, next, previous, results}).
+    """
     # Verificar si el usuario es SuperAdmin
-    is_super_admin = request.user.is_superuser or (hasattr(request.user, 'tipo_usuario') and request.user.tipo_usuario == 'SUPERADMIN')
+    is_super_admin = request.user.is_superuser or request.user.is_superadmin
     
     # Verificar si se solicitan todas las alertas mediante parámetro de consulta
     show_all = request.query_params.get('all', '').lower() == 'true'
+    todas = is_super_admin and show_all
     
-    # Obtener trabajos según el rol del usuario
-    if is_super_admin and show_all:
-        # SuperAdmin: Mostrar todos los trabajos activos del sistema
-        trabajos = Trabajo.objects.filter(
-            ~Q(estado__in=['COMPLETADO', 'CANCELADO'])
-        )
-    else:
-        # Usuario regular: Solo mostrar trabajos de su unidad
-        unidad_usuario = request.user.unidad_destino
-        
-        if not unidad_usuario:
+    alertas = AlertaPlazo.objects.para_usuario(request.user, propios_primero=not todas)
+    if not todas:
+        # Usuario regular: solo los trabajos de su unidad
+        if request.user.unidad_destino_id is None:
             return Response([])  # Si el usuario no tiene unidad asignada, retornar lista vacía
-        
-        trabajos = Trabajo.objects.filter(
-            # Trabajos de la misma unidad
-            Q(unidad=unidad_usuario) &  
-            # Excluir trabajos ya finalizados o cancelados
-            ~Q(estado__in=['COMPLETADO', 'CANCELADO'])
-        )
-    
-    # Lista para almacenar las alertas
-    alertas = []
+        alertas = alertas.filter(unidad_id=request.user.unidad_destino_id)
     
     # Fecha actual para comparar
-    fecha_actual = timezone.now().date()
-    
-    for trabajo in trabajos:
-        # Obtener pasos en progreso o pendientes que tengan fecha de inicio
-        pasos = PasoTrabajo.objects.filter(
-            trabajo=trabajo,
-            estado__in=['PENDIENTE', 'EN_PROGRESO'],
-            fecha_inicio__isnull=False
+    hoy = timezone.now().date()
+    
+    if 'page' in request.query_params or 'page_size' in request.query_params:
+        paginator = AlertasPlazosPagination()
+        pagina = paginator.paginate_queryset(alertas, request)
+        return paginator.get_paginated_response([{**alerta.datos(hoy), 'es_propio': alerta.es_propio} for alerta in pagina])
+    
+    return Response([{**alerta.datos(hoy), 'es_propio': alerta.es_propio} for alerta in alertas])
+
+def _usuario_stream(request):
+    """
+    Usuario autenticado con el token JWT de la cabecera Authorization o del parámetro
+    token (EventSource no permite enviar cabeceras), o None.
+    """
+    autenticador = JWTAuthentication()
+    try:
+        token = request.GET.get('token')
+        if token:
+            return autenticador.get_user(autenticador.get_validated_token(token))
+        resultado = autenticador.authenticate(request)
+        return resultado[0] if resultado else None
+    except (InvalidToken, AuthenticationFailed):
+        return None
+
+
+def _evento_sse(evento, usuario):
+    """Formato Server-Sent Events de un evento del broker para el usuario indicado"""
+    datos = dict(evento.datos)
+    propietarios = datos.pop('propietarios', None)
+    if propietarios is not None:
+        datos['es_propio'] = usuario.pk in propietarios
+    return f"id: {evento.id}\nevent: {evento.tipo}\ndata: {json.dumps(datos, cls=DjangoJSONEncoder)}\n\n"
+
+
+async def alertas_plazos_stream(request):
+    """
+    Cambios en las alertas de plazos en tiempo real (Server-Sent Events), para no
+    tener que consultar periódicamente alertas-plazos/. Requiere servir la aplicación
+    por ASGI (siga_project/asgi.py).
+    
+    Eventos: 'alerta' (alerta nueva o modificada, con los mismos datos que
+    alertas-plazos/), 'baja' (paso_id que deja de tener alerta) y 'reinicio' (se han
+    perdido eventos: volver a pedir la lista completa). Cada ALERTAS_HEARTBEAT
+    segundos sin eventos se envía un comentario para mantener viva la conexión. Al
+    reconectar, Last-Event-ID (o el parámetro ultimo_evento) reenvía los eventos
+    perdidos. Se reciben las alertas de la unidad del usuario, o todas con all=true
+    para el SuperAdmin.
+    
+    Servida por WSGI (manage.py runserver, gunicorn sin worker ASGI), Django acumularía
+    la respuesta entera antes de enviarla y cada cliente ocuparía un hilo para
+    siempre: en ese caso responde 503 y el cliente sigue consultando alertas-plazos/.
+    """
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse(
+            {'detail': 'Las alertas en tiempo real requieren servir la aplicación por ASGI'},
+            status=status.HTTP_503_SERVICE_UNAVAILABLE
         )
-        
-        for paso in pasos:
-            # Solo incluir pasos con tiempo_estimado definido
-            if not paso.paso.tiempo_estimado:
-                continue
-            
-            # Calcular si el paso ya venció o está próximo a vencer
-            fecha_limite = paso.fecha_limite
-            if not fecha_limite:  # Si no hay fecha límite, continuar con el siguiente paso
-                continue
-            
-            # Convertir a fecha si es datetime
-            if hasattr(fecha_limite, 'date'):
-                fecha_limite = fecha_limite.date()
-            
-            # Calcular días restantes (pueden ser negativos si ya venció)
-            dias_restantes = (fecha_limite - fecha_actual).days
-            
-            # Incluir si está próximo a vencer O YA VENCIÓ (días_restantes <= 0)
-            if dias_restantes <= 3:  # Incluir vencidos y próximos a vencer (3 días)
-                alertas.append({
-                    'trabajo_id': trabajo.id,
-                    'trabajo_titulo': trabajo.titulo,
-                    'paso_id': paso.id,
-                    'paso_numero': paso.paso_numero,
-                    'paso_titulo': paso.paso.titulo or f"Paso {paso.paso_numero}",
-                    'fecha_limite': fecha_limite,
-                    'dias_restantes': dias_restantes,
-                    'vencido': dias_restantes < 0,  # Agregar indicador de vencimiento
-                    'estado': paso.estado,
-                    'tiempo_estimado': paso.paso.tiempo_estimado,
-                    # Añadir información del usuario asignado
-                    'usuario_asignado': trabajo.usuario_iniciado.username if trabajo.usuario_iniciado else trabajo.usuario_creador.username,
-                    # Añadir nombre completo del responsable para facilitar identificación
-                    'responsable_nombre': (trabajo.usuario_iniciado.get_full_name() if trabajo.usuario_iniciado else 
-                                         trabajo.usuario_creador.get_full_name()),
-                    # Añadir información de la unidad
-                    'unidad_nombre': trabajo.unidad.nombre if trabajo.unidad else None,
-                    'unidad_id': trabajo.unidad.id if trabajo.unidad else None,
-                    # Indicar si el trabajo pertenece al usuario actual o a otro miembro de la unidad
-                    'es_propio': trabajo.usuario_iniciado == request.user or trabajo.usuario_creador == request.user
-                })
     
-    # Ordenar las alertas:
-    # - Primero los vencidos (más grave)
-    # - Luego por días restantes (ascendente)
-    if is_super_admin and show_all:
-        alertas = sorted(alertas, key=lambda x: (not x['vencido'], x['dias_restantes']))
+    usuario = await sync_to_async(_usuario_stream)(request)
+    if usuario is None:
+        return JsonResponse({'detail': 'No autenticado'}, status=status.HTTP_401_UNAUTHORIZED)
+    
+    is_super_admin = usuario.is_superuser or usuario.is_superadmin
+    if is_super_admin and request.GET.get('all', '').lower() == 'true':
+        canales = [CANAL_GLOBAL]
+    elif usuario.unidad_destino_id is not None:
+        canales = [canal_unidad(usuario.unidad_destino_id)]
     else:
-        # Para usuarios normales, primero los propios, luego vencidos y finalmente por días restantes
-        alertas = sorted(alertas, key=lambda x: (not x['es_propio'], not x['vencido'], x['dias_restantes']))
+        return JsonResponse({'detail': 'El usuario no tiene una unidad asignada'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    try:
+        ultimo_id = int(request.headers.get('Last-Event-ID') or request.GET.get('ultimo_evento') or 0) or None
+    except ValueError:
+        ultimo_id = None
+    
+    broker = obtener_broker()
+    latido = getattr(settings, 'ALERTAS_HEARTBEAT', 15)
+    
+    async def emitir():
+        # Suscribirse antes de leer el historial para no perder eventos intermedios;
+        # los repetidos se descartan por id
+        suscripcion = broker.suscribir(canales)
+        try:
+            yield f"retry: {ESPERA_RECONEXION_MS}\n\n"
+            ultimo = ultimo_id
+            if ultimo_id is not None:
+                pendientes = await sync_to_async(broker.pendientes)(ultimo_id, canales)
+                if pendientes is None:
+                    yield "event: reinicio\ndata: {}\n\n"
+                else:
+                    for evento in pendientes:
+                        ultimo = evento.id
+                        yield _evento_sse(evento, usuario)
+            
+            while True:
+                evento = await suscripcion.siguiente(latido)
+                if evento is None:
+                    yield ": latido\n\n"
+                elif ultimo is None or evento.id > ultimo:
+                    ultimo = evento.id
+                    yield _evento_sse(evento, usuario)
+        finally:
+            suscripcion.cerrar()
     
-    return Response(alertas)
+    response = StreamingHttpResponse(emitir(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Evitar que nginx acumule la respuesta en su búfer
+    response['X-Accel-Buffering'] = 'no'
+    return response
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
@@ -754,29 +1026,17 @@ def crear_trabajo(request):
         # Obtener el procedimiento
         procedimiento = Procedimiento.objects.get(id=procedimiento_id)
         
-        # Crear el trabajo
-        trabajo = Trabajo.objects.create(
-            titulo=titulo,
-            descripcion=descripcion,
+        if request.user.unidad_destino_id is None:
+            return Response({"error": "El usuario no tiene una unidad asignada"}, status=400)
+        
+        # Crear el trabajo y sus pasos con inserciones masivas en una transacción
+        trabajo = Trabajo.objects.abrir(
             procedimiento=procedimiento,
+            unidades=[request.user.unidad_destino],
             usuario_creador=request.user,
-            unidad=request.user.unidad,
-            estado='INICIADO'
-        )
-        
-        # Obtener los pasos del procedimiento y crear los pasos del trabajo
-        pasos_procedimiento = Paso.objects.filter(
-            procedimiento=procedimiento
-        ).order_by('numero')
-        
-        for paso_procedimiento in pasos_procedimiento:
-            # IMPORTANTE: Asignar explícitamente el número del paso
-            PasoTrabajo.objects.create(
-                trabajo=trabajo,
-                paso=paso_procedimiento,
-                paso_numero=paso_procedimiento.numero,  # Asegurar que este campo no sea nulo
-                estado='PENDIENTE'
-            )
+            titulo=titulo,
+            descripcion=descripcion,
+        )[0]
         
         serializer = TrabajoSerializer(trabajo)
         return Response(serializer.data, status=201)
@@ -2,6 +2,8 @@
 ASGI config for siga_project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Streaming endpoints such as /api/procedimientos/alertas-plazos/stream/ (Server-Sent
+Events) need the application to be served through this entry point (uvicorn, daphne).
 
 For more information on this file, see
 https://docs.djangoproject.com/en/stable/howto/deployment/asgi/
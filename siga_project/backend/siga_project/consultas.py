@@ -0,0 +1,72 @@
+"""
+Precarga de relaciones por acción en los viewsets y modo de depuración que detecta
+las consultas lanzadas al serializar.
+
+Cada viewset declara en métodos precargar_<acción> los select_related y
+prefetch_related que necesita el serializador de esa acción. Con el ajuste
+SIGA_PROHIBIR_CONSULTAS_SERIALIZACION activo (en las pruebas), cualquier consulta
+durante la serialización de una petición de lectura (una relación no precargada, un
+SerializerMethodField que consulta...) lanza ConsultaDuranteSerializacion.
+"""
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import QuerySet
+from rest_framework.permissions import SAFE_METHODS
+
+
+class ConsultaDuranteSerializacion(AssertionError):
+    """Un serializador ha lanzado una consulta que debería haberse precargado"""
+
+
+@contextmanager
+def prohibir_consultas(descripcion):
+    """Dentro del bloque, cualquier consulta a la base de datos lanza ConsultaDuranteSerializacion"""
+    def bloquear(execute, sql, params, many, context):
+        raise ConsultaDuranteSerializacion(f"{descripcion} ha lanzado una consulta: {sql}")
+
+    with ExitStack() as pila:
+        for conexion in connections.all(initialized_only=True):
+            pila.enter_context(conexion.execute_wrapper(bloquear))
+        yield
+
+
+def vigilar_serializador(serializer, descripcion):
+    """
+    Hace que la serialización (to_representation) de serializer no pueda consultar la
+    base de datos. Un queryset recibido se evalúa antes, con sus precargas, ya que
+    esas consultas sí están declaradas.
+    """
+    to_representation = serializer.to_representation
+
+    def to_representation_vigilado(instance):
+        if isinstance(instance, QuerySet):
+            instance = list(instance)
+        with prohibir_consultas(descripcion):
+            return to_representation(instance)
+
+    serializer.to_representation = to_representation_vigilado
+    return serializer
+
+
+class PrecargaPorAccionMixin:
+    """
+    Para viewsets: get_queryset() aplica precargar_<acción>(queryset) si el viewset
+    lo define, y en modo depuración vigila los serializadores de las peticiones de
+    lectura (vigilar_serializador).
+    """
+
+    def get_queryset(self):
+        return self.precargar(super().get_queryset())
+
+    def precargar(self, queryset):
+        precargar = getattr(self, f'precargar_{self.action}', None)
+        return precargar(queryset) if precargar else queryset
+
+    def get_serializer(self, *args, **kwargs):
+        serializer = super().get_serializer(*args, **kwargs)
+        if (getattr(settings, 'SIGA_PROHIBIR_CONSULTAS_SERIALIZACION', False)
+                and self.request.method in SAFE_METHODS):
+            vigilar_serializador(serializer, f"{type(self).__name__}.{self.action}")
+        return serializer
@@ -0,0 +1,49 @@
+"""
+Paginación de los listados con muchos registros (trabajos, historial, procedimientos).
+
+Por defecto se mantiene la paginación por número de página ({count, next, previous,
+results}), que necesita un COUNT(*) y un OFFSET que crece con la página. Si la
+petición incluye el parámetro cursor (vacío para la primera página), se pagina por
+clave: cada página filtra a partir de la última fila de la anterior sobre la
+ordenación declarada en la vista (atributo ordering; el parámetro ordering de
+OrderingFilter no se aplica, ya que el cursor necesita una ordenación estable por
+campos del propio modelo), con el mismo coste sea cual sea su profundidad, y la
+respuesta no incluye count. En ambos casos el cliente puede elegir page_size hasta
+MAX_PAGE_SIZE.
+"""
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+MAX_PAGE_SIZE = 100
+
+
+class PaginacionCursor(CursorPagination):
+    page_size_query_param = 'page_size'
+    max_page_size = MAX_PAGE_SIZE
+    # Las vistas indican su ordenación (atributo ordering), que debe acabar en un
+    # campo único para que el orden sea estable
+    ordering = '-pk'
+    
+    def get_ordering(self, request, queryset, view):
+        # Siempre la de la vista: CursorPagination tomaría la de OrderingFilter, que
+        # puede ser por un campo relacionado (tipo__nombre) o no única
+        return (self.ordering,) if isinstance(self.ordering, str) else tuple(self.ordering)
+
+
+class PaginacionPaginaOCursor(PageNumberPagination):
+    page_size_query_param = 'page_size'
+    max_page_size = MAX_PAGE_SIZE
+
+    cursor = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if PaginacionCursor.cursor_query_param not in request.query_params:
+            return super().paginate_queryset(queryset, request, view)
+
+        self.cursor = PaginacionCursor()
+        self.cursor.ordering = getattr(view, 'ordering', None) or self.cursor.ordering
+        return self.cursor.paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.cursor is not None:
+            return self.cursor.get_paginated_response(data)
+        return super().get_paginated_response(data)
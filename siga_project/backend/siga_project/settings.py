@@ -174,10 +174,58 @@ SIMPLE_JWT = {
     'TOKEN_TYPE_CLAIM': 'token_type',
 }
 
+# Configuración de caché (accesos por unidad, versión de la jerarquía...)
+# Con varios procesos en producción debe usarse un backend compartido
+# (Redis, Memcached) para que las invalidaciones lleguen a todos los workers.
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', 'siga'),
+    }
+}
+
+# Segundos que se mantiene en caché el conjunto de unidades accesibles de cada usuario
+ACCESO_UNIDADES_TIMEOUT = 60 * 60
+
+# Difusión de alertas de plazos en tiempo real (alertas-plazos/stream/). Los cambios
+# se calculan en los workers y en el comando refrescar_alertas_plazos (plazos que
+# vencen), procesos distintos del que sirve el stream: el broker debe ser compartido.
+# BrokerBaseDatos lo hace a través de la tabla EventoAlerta; BrokerEnMemoria solo
+# sirve con un único proceso.
+ALERTAS_BROKER = os.getenv('ALERTAS_BROKER', 'procedimientos.eventos.BrokerBaseDatos')
+# Segundos sin eventos tras los que se envía un latido por la conexión
+ALERTAS_HEARTBEAT = 15
+
+# Modo de depuración: los viewsets con PrecargaPorAccionMixin fallan si un serializador
+# consulta la base de datos en una petición de lectura (relación sin precargar)
+SIGA_PROHIBIR_CONSULTAS_SERIALIZACION = os.getenv('SIGA_PROHIBIR_CONSULTAS_SERIALIZACION', 'false').lower() == 'true'
+
+# Envío de los ficheros en las descargas de documentos (procedimientos/descargas.py).
+# MEDIA_ROOT no debe publicarse en MEDIA_URL: los ficheros solo se sirven a través de
+# download_document, que comprueba los permisos.
+# En producción, detrás de nginx, conviene ServidorXAccel con una location internal:
+#     location /media-protegido/ { internal; alias <MEDIA_ROOT>/; }
+# o ServidorXSendfile con Apache (mod_xsendfile) o lighttpd
+DESCARGAS_SERVIDOR = os.getenv('DESCARGAS_SERVIDOR', 'procedimientos.descargas.ServidorDjango')
+DESCARGAS_X_ACCEL_PREFIJO = os.getenv('DESCARGAS_X_ACCEL_PREFIJO', '/media-protegido/')
+# Segundos de validez de las URL de descarga firmadas (firmar_descarga)
+DESCARGAS_FIRMA_CADUCIDAD = 300
+
+# Tamaño máximo (bytes) de la documentación enviada por subida fragmentada
+SUBIDAS_TAMANO_MAXIMO = int(os.getenv('SUBIDAS_TAMANO_MAXIMO', 2 * 1024 * 1024 * 1024))
+
 # Configuración para archivos media
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Directorio de los ficheros de las subidas fragmentadas en curso. Fuera de MEDIA_ROOT,
+# para que no se publiquen a medias, pero junto a él y en el mismo sistema de ficheros:
+# al completar el paso el fichero se mueve al envío sin copiarlo. No va en el
+# repositorio (.gitignore); en producción, en el mismo volumen de datos que MEDIA_ROOT
+SUBIDAS_DIRECTORIO = os.getenv(
+    'SUBIDAS_DIRECTORIO', os.path.join(os.path.dirname(MEDIA_ROOT), 'subidas')
+)
+
 # Configuración para archivos estáticos
 STATIC_URL = '/static/'
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')  # Carpeta para collectstatic
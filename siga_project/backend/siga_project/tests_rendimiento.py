@@ -0,0 +1,289 @@
+"""
+Pruebas de rendimiento de la API: consultas SQL y tiempo por endpoint.
+
+Se genera un juego de datos sintético parecido al real (árbol de unidades de cinco
+niveles, cientos de procedimientos con pasos y documentos, miles de trabajos con sus
+pasos) y se llama a cada endpoint de lectura de procedimientos, unidades y usuarios.
+La prueba falla si un endpoint ejecuta más consultas que su presupuesto, guardado en
+presupuestos_consultas.json. Así se detectan las regresiones N+1.
+
+- Solo estas pruebas:   python manage.py test --tag=rendimiento
+- Excluirlas:           python manage.py test --exclude-tag=rendimiento
+- Tamaño de los datos:  SIGA_RENDIMIENTO_ESCALA (1 = juego completo). Los
+  presupuestos se calibran con escala 1.
+- Recalibrar:           SIGA_RENDIMIENTO_ACTUALIZAR=1 escribe en el fichero las
+  consultas medidas, tras una mejora o al añadir endpoints.
+"""
+import json
+import os
+import random
+import sys
+import time
+from pathlib import Path
+
+from django.db import connection
+from django.test import TestCase, override_settings, tag
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from procedimientos.contadores import recalcular_contadores
+from procedimientos.models import (
+    AlertaPlazo, Documento, DocumentoPaso, HistorialProcedimiento, InstantaneaProcedimiento,
+    Paso, PasoTrabajo, Procedimiento, TipoProcedimiento, Trabajo,
+)
+from unidades.models import Unidad
+from users.models import Usuario
+
+FICHERO_PRESUPUESTOS = Path(__file__).with_name('presupuestos_consultas.json')
+
+ESCALA = float(os.environ.get('SIGA_RENDIMIENTO_ESCALA', '1'))
+ACTUALIZAR = os.environ.get('SIGA_RENDIMIENTO_ACTUALIZAR') == '1'
+
+# Ramificación de cada nivel del árbol: 1 Dirección, 7 Zonas, 6 Comandancias por
+# Zona, 8 Compañías por Comandancia y 8 Puestos por Compañía (unas 3.000 unidades)
+RAMIFICACION = [
+    (Unidad.TIPO_DIRECCION, 1),
+    (Unidad.TIPO_ZONA, 7),
+    (Unidad.TIPO_COMANDANCIA, 6),
+    (Unidad.TIPO_COMPANIA, 8),
+    (Unidad.TIPO_PUESTO, 8),
+]
+NUM_PROCEDIMIENTOS = 300
+PASOS_POR_PROCEDIMIENTO = 8
+NUM_TRABAJOS = 4000
+NUM_USUARIOS = 200
+
+
+def escalar(cantidad):
+    return max(1, int(cantidad * ESCALA))
+
+
+@tag('rendimiento')
+# Los viewsets con precargas declaradas fallan además si serializar consulta la base de datos
+@override_settings(SIGA_PROHIBIR_CONSULTAS_SERIALIZACION=True)
+class PresupuestoConsultasTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.aleatorio = random.Random(2024)
+        cls.crear_unidades()
+        cls.crear_usuarios()
+        cls.crear_procedimientos()
+        cls.crear_trabajos()
+
+    @classmethod
+    def crear_unidades(cls):
+        """Árbol completo creado nivel a nivel con bulk_create (sin pasar por save)"""
+        padres = [(None, '')]
+        for nivel, (tipo, hijos) in enumerate(RAMIFICACION, 1):
+            hijos = hijos if nivel <= 2 else max(1, round(hijos * ESCALA ** (1 / 3)))
+            nuevas = []
+            for padre_id, codigo_padre in padres:
+                for i in range(1, hijos + 1):
+                    codigo = f"{codigo_padre}.{i}" if codigo_padre else str(i)
+                    nuevas.append(Unidad(
+                        nombre=f"{tipo.title()} {codigo}", id_padre_id=padre_id, cod_unidad=codigo,
+                        nivel=nivel, tipo_unidad=tipo, ultimo_hijo=0,
+                    ))
+            Unidad.objects.bulk_create(nuevas, batch_size=500)
+            # Releer los ids por código: bulk_create no los devuelve en todos los motores
+            padres = list(Unidad.objects.filter(nivel=nivel).values_list('id', 'cod_unidad'))
+
+        cls.puestos = [uid for uid, _ in padres]
+        cls.unidad = Unidad.objects.filter(nivel=len(RAMIFICACION)).order_by('id').first()
+
+    @classmethod
+    def crear_usuarios(cls):
+        Usuario.objects.bulk_create([
+            Usuario(
+                email=f"usuario{i}@example.com", tip=f"R{i:06d}", ref=f"REND{i}",
+                nombre="Usuario", apellido1=f"Prueba {i}", password='!',
+                tipo_usuario=Usuario.USER, unidad_destino_id=cls.aleatorio.choice(cls.puestos),
+            )
+            for i in range(escalar(NUM_USUARIOS))
+        ], batch_size=500)
+        cls.usuario = Usuario.objects.create_superuser(
+            'rendimiento@example.com', 'R999999', 'clave', nombre='Ana', apellido1='Ruiz',
+            ref='REND-ADMIN', unidad_destino=cls.unidad,
+        )
+        cls.usuarios = list(Usuario.objects.values_list('id', flat=True))
+
+    @classmethod
+    def crear_procedimientos(cls):
+        TipoProcedimiento.objects.bulk_create([TipoProcedimiento(nombre=f"Tipo {i}") for i in range(10)])
+        tipos = list(TipoProcedimiento.objects.values_list('id', flat=True))
+        niveles = [nivel for nivel, _ in Procedimiento.NIVEL_CHOICES]
+
+        Procedimiento.objects.bulk_create([
+            Procedimiento(
+                nombre=f"Procedimiento {i}", descripcion="Procedimiento de prueba",
+                tipo_id=tipos[i % len(tipos)], nivel=niveles[i % len(niveles)], estado='VIGENTE',
+                creado_por=cls.usuario, actualizado_por=cls.usuario, tiempo_maximo=30,
+            )
+            for i in range(escalar(NUM_PROCEDIMIENTOS))
+        ], batch_size=500)
+        procedimientos = list(Procedimiento.objects.order_by('id').values_list('id', flat=True))
+
+        # Cadenas de tres procedimientos (Puesto → Compañía → Comandancia)
+        for i in range(0, len(procedimientos) - 2, 3):
+            Procedimiento.objects.filter(pk=procedimientos[i]).update(procedimiento_relacionado=procedimientos[i + 1])
+            Procedimiento.objects.filter(pk=procedimientos[i + 1]).update(procedimiento_relacionado=procedimientos[i + 2])
+
+        HistorialProcedimiento.objects.bulk_create([
+            HistorialProcedimiento(procedimiento_id=pid, version='1.0', usuario=cls.usuario,
+                                   descripcion_cambio="Creación inicial del procedimiento")
+            for pid in procedimientos
+        ], batch_size=500)
+
+        Paso.objects.bulk_create([
+            Paso(procedimiento_id=pid, numero=numero, titulo=f"Paso {numero}",
+                 tiempo_estimado=cls.aleatorio.randint(1, 10),
+                 es_final=numero == PASOS_POR_PROCEDIMIENTO)
+            for pid in procedimientos
+            for numero in range(1, PASOS_POR_PROCEDIMIENTO + 1)
+        ], batch_size=500)
+
+        Documento.objects.bulk_create([
+            Documento(nombre=f"Documento {pid}-{i}", procedimiento_id=pid,
+                      url=f"https://example.com/{pid}/{i}", tipo_documento='GENERAL')
+            for pid in procedimientos
+            for i in range(2)
+        ] + [
+            Documento(nombre=f"Documento paso {paso_id}", procedimiento_id=pid,
+                      url=f"https://example.com/pasos/{paso_id}", tipo_documento='PASO')
+            for paso_id, pid, numero in Paso.objects.values_list('id', 'procedimiento_id', 'numero')
+            if numero % 2
+        ], batch_size=500)
+
+        documentos = dict(Documento.objects.filter(tipo_documento='PASO').values_list('url', 'id'))
+        DocumentoPaso.objects.bulk_create([
+            DocumentoPaso(paso_id=paso_id, documento_id=documentos[f"https://example.com/pasos/{paso_id}"])
+            for paso_id, numero in Paso.objects.values_list('id', 'numero')
+            if numero % 2
+        ], batch_size=500)
+
+        cls.procedimiento = Procedimiento.objects.order_by('id').first()
+        cls.paso = Paso.objects.filter(procedimiento=cls.procedimiento).order_by('numero').first()
+        cls.documento = Documento.objects.order_by('id').first()
+
+    @classmethod
+    def crear_trabajos(cls):
+        pasos = {}
+        tiempos = {}
+        for paso_id, pid, tiempo in Paso.objects.order_by('numero').values_list('id', 'procedimiento_id', 'tiempo_estimado'):
+            pasos.setdefault(pid, []).append(paso_id)
+            tiempos[paso_id] = tiempo
+        procedimientos = list(pasos)
+        # La unidad del usuario de las pruebas recibe también una parte de los trabajos
+        unidades = cls.puestos + [cls.unidad.pk] * max(1, len(cls.puestos) // 50)
+
+        estados = ['INICIADO', 'EN_PROGRESO', 'EN_PROGRESO', 'PAUSADO', 'COMPLETADO', 'CANCELADO']
+        Trabajo.objects.bulk_create([
+            Trabajo(
+                procedimiento_id=cls.aleatorio.choice(procedimientos),
+                usuario_creador_id=cls.aleatorio.choice(cls.usuarios),
+                unidad_id=cls.aleatorio.choice(unidades),
+                titulo=f"Trabajo {i}", estado=cls.aleatorio.choice(estados),
+                paso_actual=cls.aleatorio.randint(1, PASOS_POR_PROCEDIMIENTO),
+            )
+            for i in range(escalar(NUM_TRABAJOS))
+        ], batch_size=500)
+
+        ahora = timezone.now()
+        pasos_trabajo = []
+        for trabajo_id, pid, paso_actual in Trabajo.objects.values_list('id', 'procedimiento_id', 'paso_actual'):
+            for numero, paso_id in enumerate(pasos[pid], 1):
+                if numero < paso_actual:
+                    estado, inicio, fin = 'COMPLETADO', ahora - timezone.timedelta(days=20 - numero), ahora
+                elif numero == paso_actual:
+                    estado, inicio, fin = 'EN_PROGRESO', ahora - timezone.timedelta(days=cls.aleatorio.randint(0, 12)), None
+                else:
+                    estado, inicio, fin = 'PENDIENTE', None, None
+                pasos_trabajo.append(PasoTrabajo(
+                    trabajo_id=trabajo_id, paso_id=paso_id, estado=estado,
+                    fecha_inicio=inicio, fecha_fin=fin,
+                    fecha_limite=inicio + timezone.timedelta(days=float(tiempos[paso_id])) if inicio else None,
+                ))
+        PasoTrabajo.objects.bulk_create(pasos_trabajo, batch_size=1000)
+        # bulk_create no pasa por Trabajo.objects.abrir: rellenar los contadores
+        recalcular_contadores()
+        AlertaPlazo.objects.refrescar()
+
+        cls.trabajo = Trabajo.objects.filter(unidad=cls.unidad).order_by('id').first()
+        cls.paso_trabajo = cls.trabajo.pasos_trabajo.order_by('id').first()
+        # Instantáneas ya compiladas, como tras la primera lectura de cada procedimiento
+        for procedimiento in Procedimiento.objects.para_detalle().filter(pk__in=[cls.procedimiento.pk, cls.trabajo.procedimiento_id]):
+            InstantaneaProcedimiento.objects.generar(procedimiento)
+
+    def endpoints(self):
+        """(nombre, ruta, parámetros) de cada endpoint de lectura que se mide"""
+        p = self.procedimiento.pk
+        return [
+            # Usuarios
+            ('usuarios-list', '/api/users/', {}),
+            ('usuarios-detail', f'/api/users/{self.usuario.pk}/', {}),
+            ('usuarios-profile', '/api/users/profile/', {}),
+            ('usuarios-me', '/api/users/me/', {}),
+            ('usuarios-available-units', '/api/users/available_units/', {}),
+            # Unidades
+            ('unidades-list', '/api/unidades/', {}),
+            ('unidades-list-sin-paginar', '/api/unidades/', {'pagination': 'false'}),
+            ('unidades-detail', f'/api/unidades/{self.unidad.pk}/', {}),
+            ('unidades-tree', '/api/unidades/tree/', {}),
+            # Procedimientos
+            ('tipos-list', '/api/procedimientos/tipos/', {}),
+            ('tipos-detail', f'/api/procedimientos/tipos/{self.procedimiento.tipo_id}/', {}),
+            ('procedimientos-list', '/api/procedimientos/procedimientos/', {}),
+            ('procedimientos-detail', f'/api/procedimientos/procedimientos/{p}/', {}),
+            ('procedimientos-cadena-completa', f'/api/procedimientos/procedimientos/{p}/cadena_completa/', {}),
+            ('procedimientos-documentos-generales', f'/api/procedimientos/procedimientos/{p}/documentos-generales/', {}),
+            ('pasos-list', '/api/procedimientos/pasos/', {}),
+            ('pasos-list-procedimiento', '/api/procedimientos/pasos/', {'procedimiento': p}),
+            ('pasos-detail', f'/api/procedimientos/pasos/{self.paso.pk}/', {}),
+            ('pasos-documentos', f'/api/procedimientos/pasos/{self.paso.pk}/documentos/', {}),
+            ('documentos-list', '/api/procedimientos/documentos/', {}),
+            ('documentos-detail', f'/api/procedimientos/documentos/{self.documento.pk}/', {}),
+            ('historial-list', '/api/procedimientos/historial/', {'procedimiento': p}),
+            ('historial-list-cursor', '/api/procedimientos/historial/', {'cursor': '', 'page_size': 100}),
+            ('trabajos-list', '/api/procedimientos/trabajos/', {}),
+            ('trabajos-list-cursor', '/api/procedimientos/trabajos/', {'cursor': '', 'page_size': 100}),
+            ('trabajos-detail', f'/api/procedimientos/trabajos/{self.trabajo.pk}/', {}),
+            ('pasos-trabajo-detail', f'/api/procedimientos/pasos-trabajo/{self.paso_trabajo.pk}/', {}),
+            ('alertas-plazos', '/api/procedimientos/alertas-plazos/', {}),
+        ]
+
+    def test_presupuesto_consultas(self):
+        presupuestos = json.loads(FICHERO_PRESUPUESTOS.read_text()) if FICHERO_PRESUPUESTOS.exists() else {}
+        cliente = APIClient()
+        cliente.force_authenticate(self.usuario)
+
+        medidas = {}
+        for nombre, ruta, parametros in self.endpoints():
+            with self.subTest(endpoint=nombre):
+                with CaptureQueriesContext(connection) as consultas:
+                    inicio = time.perf_counter()
+                    response = cliente.get(ruta, parametros)
+                    if response.streaming:
+                        b''.join(response.streaming_content)
+                    duracion = time.perf_counter() - inicio
+
+                medidas[nombre] = (len(consultas), duracion)
+                self.assertLess(response.status_code, 400, f"{nombre}: {response.status_code}")
+                if not ACTUALIZAR:
+                    self.assertIn(nombre, presupuestos, f"{nombre} no tiene presupuesto de consultas")
+                    self.assertLessEqual(
+                        len(consultas), presupuestos[nombre],
+                        f"{nombre}: {len(consultas)} consultas, presupuesto {presupuestos[nombre]}"
+                    )
+
+        if ACTUALIZAR:
+            FICHERO_PRESUPUESTOS.write_text(
+                json.dumps({nombre: total for nombre, (total, _) in medidas.items()}, indent=4) + '\n'
+            )
+
+        informe = '\n'.join(
+            f"  {nombre:<40} {total:>6} consultas (presupuesto {presupuestos.get(nombre, '-')}) {duracion * 1000:>9.1f} ms"
+            for nombre, (total, duracion) in medidas.items()
+        )
+        sys.stderr.write(f"\nRendimiento de la API (escala {ESCALA}):\n{informe}\n")
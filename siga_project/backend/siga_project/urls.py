@@ -20,8 +20,8 @@ urlpatterns = [
     path('downloads/<path:path>', download_document, name='download_document'),
 ]
 
-# Añadir configuración para servir archivos multimedia en desarrollo
+# Añadir configuración para servir archivos estáticos en desarrollo. MEDIA_ROOT no se
+# sirve: los documentos se descargan con download_document, que comprueba los permisos
 if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
     urlpatterns += static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
     urlpatterns += static('/documentos/', document_root=os.path.join(settings.BASE_DIR, 'documentos'))
\ No newline at end of file
@@ -0,0 +1,45 @@
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+# Clave de la versión global de la jerarquía de unidades. Cualquier dato cacheado
+# que dependa del árbol (p. ej. las unidades accesibles de cada usuario) incluye
+# esta versión en su clave, de modo que al incrementarla queda invalidado sin
+# tener que localizar y borrar cada entrada.
+CLAVE_VERSION_JERARQUIA = 'unidades:version_jerarquia'
+
+
+def _version_inicial():
+    # Si la clave se pierde (reinicio, expulsión de la caché) no se puede volver a
+    # empezar en 1: se reutilizarían claves de entradas antiguas aún vivas.
+    return int(time.time() * 1000)
+
+
+def get_version_jerarquia():
+    """Devuelve la versión actual de la jerarquía de unidades"""
+    version = cache.get(CLAVE_VERSION_JERARQUIA)
+    if version is None:
+        cache.add(CLAVE_VERSION_JERARQUIA, _version_inicial(), timeout=None)
+        version = cache.get(CLAVE_VERSION_JERARQUIA)
+    return version
+
+
+def _incrementar_version():
+    try:
+        cache.incr(CLAVE_VERSION_JERARQUIA)
+    except ValueError:
+        # La clave no existía todavía
+        cache.set(CLAVE_VERSION_JERARQUIA, _version_inicial(), timeout=None)
+
+
+def invalidar_jerarquia():
+    """
+    Incrementa la versión de la jerarquía tras cualquier cambio en el árbol de unidades.
+    
+    Se incrementa en el acto (para que la propia transacción vea sus cambios) y otra
+    vez al confirmarla: un proceso que leyese la base de datos entre ambos momentos
+    habría cacheado el estado anterior bajo la versión nueva.
+    """
+    _incrementar_version()
+    transaction.on_commit(_incrementar_version)
@@ -0,0 +1,149 @@
+"""
+Operaciones masivas sobre la jerarquía de unidades.
+
+Trabajan sobre la tabla completa en memoria y escriben en bloque, sin pasar por
+Unidad.save, que trata las unidades de una en una.
+"""
+from collections import defaultdict, deque, namedtuple
+
+from django.db import transaction
+from django.db.models import CharField, Value
+from django.db.models.functions import Cast, Concat
+from django.utils import timezone
+
+from .cache import invalidar_jerarquia
+from .models import Unidad, SEPARADOR_CODIGO
+
+# Tamaño de lote por defecto para las escrituras masivas
+TAMANO_LOTE = 500
+
+CambioCodigo = namedtuple(
+    'CambioCodigo',
+    ['id', 'nombre', 'cod_anterior', 'cod_nuevo', 'nivel_anterior', 'nivel_nuevo']
+)
+
+
+def calcular_codigos(filas, usar_id=False):
+    """
+    Calcula el código y el nivel de cada unidad recorriendo el árbol en anchura.
+    
+    filas: iterable de (id, id_padre_id). Los hermanos se numeran de forma correlativa
+    por orden de ID, o con su propio ID si usar_id es True.
+    Devuelve un diccionario {id: (cod_unidad, nivel, ultimo_hijo)}, donde ultimo_hijo
+    es el mayor componente asignado a sus subunidades (contador por padre).
+    """
+    hijos = defaultdict(list)
+    ids = set()
+    for unidad_id, padre_id in filas:
+        ids.add(unidad_id)
+        hijos[padre_id].append(unidad_id)
+    
+    # Las unidades cuyo padre ya no existe se tratan como raíz
+    raices = sorted(uid for padre_id in hijos if padre_id is None or padre_id not in ids
+                    for uid in hijos[padre_id])
+    
+    resultado = {}
+    cola = deque()
+    for i, raiz in enumerate(raices, 1):
+        resultado[raiz] = (str(raiz if usar_id else i), 1, 0)
+        cola.append(raiz)
+    
+    while cola:
+        padre_id = cola.popleft()
+        codigo_padre, nivel_padre, _ = resultado[padre_id]
+        componente = 0
+        for i, hijo in enumerate(sorted(hijos.get(padre_id, ())), 1):
+            componente = hijo if usar_id else i
+            resultado[hijo] = (f"{codigo_padre}{SEPARADOR_CODIGO}{componente}", nivel_padre + 1, 0)
+            cola.append(hijo)
+        resultado[padre_id] = (codigo_padre, nivel_padre, componente)
+    
+    sin_alcanzar = ids - resultado.keys()
+    if sin_alcanzar:
+        raise ValueError(
+            f"La jerarquía contiene ciclos; unidades no alcanzables desde una raíz: {sorted(sin_alcanzar)}"
+        )
+    return resultado
+
+
+def regenerar_codigos(dry_run=False, usar_id=False, tamano_lote=TAMANO_LOTE):
+    """
+    Regenera cod_unidad y nivel de todas las unidades en una sola pasada.
+    
+    Carga la tabla una vez, calcula los códigos en memoria y escribe solo las filas
+    que cambian con bulk_update, por lotes y dentro de una transacción. Los contadores
+    ultimo_hijo se ajustan a la nueva numeración. Con dry_run no escribe nada.
+    Devuelve la lista de CambioCodigo.
+    """
+    with transaction.atomic():
+        unidades = Unidad.objects.order_by('id')
+        if not dry_run:
+            unidades = unidades.select_for_update()
+        filas = list(unidades.values_list('id', 'id_padre_id', 'cod_unidad', 'nivel', 'ultimo_hijo', 'nombre'))
+        
+        nuevos = calcular_codigos(((uid, padre_id) for uid, padre_id, *_ in filas), usar_id=usar_id)
+        
+        cambios = []
+        contadores = []
+        for uid, _, codigo, nivel, ultimo_hijo, nombre in filas:
+            codigo_nuevo, nivel_nuevo, ultimo_hijo_nuevo = nuevos[uid]
+            if codigo_nuevo != codigo or nivel_nuevo != nivel:
+                cambios.append(CambioCodigo(uid, nombre, codigo, codigo_nuevo, nivel, nivel_nuevo))
+            elif ultimo_hijo_nuevo != ultimo_hijo:
+                contadores.append(uid)
+        
+        if dry_run or not (cambios or contadores):
+            return cambios
+        
+        ids = [cambio.id for cambio in cambios]
+        # 1. Liberar los códigos afectados con un valor temporal único, para que la
+        #    escritura de los definitivos no choque con la restricción unique
+        for inicio in range(0, len(ids), tamano_lote):
+            Unidad.objects.filter(id__in=ids[inicio:inicio + tamano_lote]).update(
+                cod_unidad=Concat(Value('temp_'), Cast('id', output_field=CharField()))
+            )
+        
+        # 2. Escribir los códigos, niveles y contadores definitivos
+        ahora = timezone.now()
+        Unidad.objects.bulk_update(
+            [
+                Unidad(id=uid, cod_unidad=nuevos[uid][0], nivel=nuevos[uid][1],
+                       ultimo_hijo=nuevos[uid][2], fecha_actualizacion=ahora)
+                for uid in ids + contadores
+            ],
+            ['cod_unidad', 'nivel', 'ultimo_hijo', 'fecha_actualizacion'],
+            batch_size=tamano_lote,
+        )
+    
+    invalidar_jerarquia()
+    return cambios
+
+
+# Campos de cada nodo del árbol jerárquico
+CAMPOS_ARBOL = ('id', 'cod_unidad', 'nombre', 'id_padre', 'nivel', 'tipo_unidad')
+
+
+def construir_arbol(filas):
+    """
+    Monta en memoria el árbol anidado a partir de filas planas.
+    
+    filas: diccionarios con CAMPOS_ARBOL, ordenados de modo que cada padre aparezca
+    antes que sus subunidades (por ejemplo, por nivel). Las unidades cuyo padre no
+    está entre las filas quedan como raíces del resultado. Devuelve la lista de nodos
+    raíz; cada nodo incluye sus hijos en la clave 'subunidades'.
+    """
+    tipos = dict(Unidad.TIPO_CHOICES)
+    nodos = {}
+    raices = []
+    for fila in filas:
+        nodo = dict(fila)
+        nodo['tipo_unidad_display'] = tipos.get(nodo['tipo_unidad'], nodo['tipo_unidad'])
+        nodo['subunidades'] = []
+        nodos[nodo['id']] = nodo
+        
+        padre = nodos.get(nodo['id_padre'])
+        if padre is not None:
+            padre['subunidades'].append(nodo)
+        else:
+            raices.append(nodo)
+    return raices
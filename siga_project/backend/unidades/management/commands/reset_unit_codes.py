@@ -0,0 +1,57 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from unidades.jerarquia import regenerar_codigos, TAMANO_LOTE
+
+class Command(BaseCommand):
+    help = 'Regenera los códigos de todas las unidades'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Muestra los cambios que se harían sin escribir nada'
+        )
+        parser.add_argument(
+            '--correlativo', action='store_true',
+            help='Numerar los hermanos 1, 2, 3... en lugar de usar el ID de cada unidad'
+        )
+        parser.add_argument(
+            '--lote', type=int, default=TAMANO_LOTE,
+            help='Número de filas por lote de escritura'
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        self.stdout.write('Iniciando regeneración de códigos de unidades...')
+        
+        # Resetear secuencia de autoincremento según el tipo de base de datos
+        if not dry_run:
+            if connection.vendor == 'postgresql':
+                with connection.cursor() as cursor:
+                    cursor.execute("SELECT setval(pg_get_serial_sequence('unidades_unidad', 'id'), (SELECT MAX(id) FROM unidades_unidad) + 1)")
+            elif connection.vendor == 'mysql':
+                with connection.cursor() as cursor:
+                    cursor.execute("ALTER TABLE unidades_unidad AUTO_INCREMENT = 1000;")
+        
+        try:
+            cambios = regenerar_codigos(
+                dry_run=dry_run,
+                usar_id=not options['correlativo'],
+                tamano_lote=options['lote'],
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+        
+        # En modo simulación (o con -v 2) mostrar el detalle de cada cambio
+        if dry_run or options['verbosity'] > 1:
+            for cambio in cambios:
+                self.stdout.write(
+                    f'{cambio.id} - {cambio.nombre}: {cambio.cod_anterior} → {cambio.cod_nuevo}'
+                    f' (nivel {cambio.nivel_anterior} → {cambio.nivel_nuevo})'
+                )
+        
+        if dry_run:
+            self.stdout.write(self.style.WARNING(f'Simulación: {len(cambios)} unidades cambiarían de código'))
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                f'Regeneración de códigos completada con éxito ({len(cambios)} unidades actualizadas)'
+            ))
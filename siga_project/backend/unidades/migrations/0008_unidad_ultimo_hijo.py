@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-17 12:11
+
+from django.db import migrations, models
+
+
+def inicializar_contadores(apps, schema_editor):
+    """Inicializa ultimo_hijo con el mayor componente usado por las subunidades de cada unidad"""
+    Unidad = apps.get_model('unidades', 'Unidad')
+    
+    maximos = {}
+    for padre_id, codigo in Unidad.objects.filter(id_padre__isnull=False).values_list('id_padre_id', 'cod_unidad'):
+        componente = codigo.rsplit('.', 1)[-1]
+        if componente.isdigit():
+            maximos[padre_id] = max(maximos.get(padre_id, 0), int(componente))
+    
+    Unidad.objects.bulk_update(
+        [Unidad(id=padre_id, ultimo_hijo=maximo) for padre_id, maximo in maximos.items()],
+        ['ultimo_hijo'],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('unidades', '0007_unidad_descripcion_unidad_fecha_actualizacion_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='unidad',
+            name='ultimo_hijo',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Último componente de código asignado a una subunidad (contador por padre)'),
+        ),
+        migrations.RunPython(inicializar_contadores, migrations.RunPython.noop),
+    ]
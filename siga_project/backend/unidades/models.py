@@ -1,8 +1,149 @@
-from django.db import models
+from django.db import models, transaction
 from django.dispatch import receiver
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete, pre_delete
+from django.db.models import Case, F, Q, Value, When
+from django.db.models.functions import Concat, Substr
 from django.utils import timezone
-import uuid
+
+from .cache import invalidar_jerarquia
+
+# Separador de los componentes de cod_unidad ("1.3.2"). El código completo actúa
+# como ruta materializada: los descendientes de una unidad son exactamente las
+# unidades cuyo código empieza por "<codigo>.".
+SEPARADOR_CODIGO = '.'
+# Carácter inmediatamente posterior al separador, usado como cota superior del rango
+FIN_RANGO_CODIGO = chr(ord(SEPARADOR_CODIGO) + 1)
+
+
+def _codigo(unidad):
+    """Acepta una instancia de Unidad o directamente su cod_unidad"""
+    return unidad.cod_unidad if isinstance(unidad, Unidad) else unidad
+
+
+class UnidadQuerySet(models.QuerySet):
+    def subarbol(self, *unidades):
+        """
+        Filtra las unidades indicadas junto con todas sus dependientes.
+        
+        Acepta instancias de Unidad o códigos. Cada subárbol se resuelve como un
+        rango sobre el índice único de cod_unidad (codigo. <= cod < codigo/), por lo
+        que el número de consultas no depende de la profundidad de la jerarquía.
+        """
+        condicion = Q()
+        for unidad in unidades:
+            codigo = _codigo(unidad)
+            if not codigo:
+                continue
+            condicion |= Q(cod_unidad=codigo) | Q(
+                cod_unidad__gte=f"{codigo}{SEPARADOR_CODIGO}",
+                cod_unidad__lt=f"{codigo}{FIN_RANGO_CODIGO}",
+            )
+        
+        if not condicion:
+            return self.none()
+        return self.filter(condicion)
+    
+    def descendientes(self, unidad, profundidad=None):
+        """
+        Subunidades de la unidad a cualquier nivel (sin incluirla), en una sola
+        consulta por rango de cod_unidad. Con profundidad se limita a ese número de
+        niveles por debajo (1 = solo las subunidades directas).
+        """
+        codigo = _codigo(unidad)
+        descendientes = self.filter(
+            cod_unidad__gte=f"{codigo}{SEPARADOR_CODIGO}",
+            cod_unidad__lt=f"{codigo}{FIN_RANGO_CODIGO}",
+        )
+        if profundidad is not None:
+            nivel = codigo.count(SEPARADOR_CODIGO) + 1
+            descendientes = descendientes.filter(nivel__lte=nivel + profundidad)
+        return descendientes
+    
+    def ancestros(self, unidad, incluir_propia=False):
+        """
+        Unidades de las que depende la unidad, de la raíz hacia abajo.
+        
+        Los códigos de los ancestros son los prefijos de cod_unidad ("1", "1.3" para
+        "1.3.2"), así que se obtienen con un único cod_unidad IN (...) sobre el índice
+        único. Para localizar, por ejemplo, la Zona de un Puesto basta con
+        ancestros(puesto).filter(tipo_unidad__in=[...]).last().
+        """
+        partes = _codigo(unidad).split(SEPARADOR_CODIGO)
+        ultimo = len(partes) if incluir_propia else len(partes) - 1
+        prefijos = [SEPARADOR_CODIGO.join(partes[:i]) for i in range(1, ultimo + 1)]
+        return self.filter(cod_unidad__in=prefijos).order_by('nivel')
+    
+    def ancestro_comun(self, *unidades):
+        """
+        Unidad más profunda de la que dependen (o que es) todas las indicadas, o None
+        si pertenecen a ramas de raíces distintas. Como mucho una consulta.
+        """
+        rutas = [_codigo(unidad).split(SEPARADOR_CODIGO) for unidad in unidades]
+        comun = []
+        for componentes in zip(*rutas):
+            if any(c != componentes[0] for c in componentes):
+                break
+            comun.append(componentes[0])
+        
+        if not comun:
+            return None
+        return self.filter(cod_unidad=SEPARADOR_CODIGO.join(comun)).first()
+    
+    def reservar_codigo(self, padre_id):
+        """
+        Reserva el siguiente código libre bajo padre_id y devuelve (cod_unidad, nivel).
+        
+        Para unidades con padre se incrementa su contador ultimo_hijo con la fila del
+        padre bloqueada (select_for_update), de modo que dos altas simultáneas bajo el
+        mismo padre nunca obtienen el mismo código y no hace falta recorrer los
+        hermanos. Las unidades raíz son muy pocas: se bloquean y se toma el mayor
+        código numérico. Debe llamarse dentro de una transacción.
+        """
+        if padre_id is None:
+            codigos = self.select_for_update().filter(id_padre__isnull=True).values_list('cod_unidad', flat=True)
+            siguiente = max((int(c) for c in codigos if c.isdigit()), default=0) + 1
+            return str(siguiente), 1
+        
+        padre = self.select_for_update().only('cod_unidad', 'nivel', 'ultimo_hijo').get(pk=padre_id)
+        siguiente = padre.ultimo_hijo + 1
+        self.filter(pk=padre_id).update(ultimo_hijo=siguiente)
+        return f"{padre.cod_unidad}{SEPARADOR_CODIGO}{siguiente}", padre.nivel + 1
+    
+    def mover(self, unidad, padre_id):
+        """
+        Reubica la unidad bajo padre_id junto con todo su subárbol y devuelve el
+        número de filas afectadas.
+        
+        Se reserva un código nuevo bajo el padre destino y, con un único UPDATE sobre
+        el rango del subárbol, se sustituye el prefijo antiguo de cod_unidad por el
+        nuevo, se desplaza el nivel y se cambia el padre de la unidad movida. Como el
+        prefijo reservado no está en uso, ningún código intermedio colisiona con el
+        índice único. Lanza ValueError si el destino es la propia unidad o una de sus
+        dependientes. Actualiza cod_unidad, nivel e id_padre de la instancia recibida.
+        """
+        with transaction.atomic():
+            actual = self.select_for_update().values('cod_unidad', 'nivel').get(pk=unidad.pk)
+            origen = actual['cod_unidad']
+            
+            if padre_id is not None and self.subarbol(origen).filter(pk=padre_id).exists():
+                raise ValueError("Una unidad no puede depender de sí misma ni de sus subunidades")
+            
+            codigo, nivel = self.reservar_codigo(padre_id)
+            filas = self.subarbol(origen).update(
+                id_padre=Case(
+                    When(pk=unidad.pk, then=Value(padre_id)),
+                    default=F('id_padre'),
+                    output_field=models.BigIntegerField(),
+                ),
+                cod_unidad=Concat(Value(codigo), Substr('cod_unidad', len(origen) + 1)),
+                nivel=F('nivel') + (nivel - actual['nivel']),
+                fecha_actualizacion=timezone.now(),
+            )
+            invalidar_jerarquia()
+        
+        unidad.id_padre_id, unidad.cod_unidad, unidad.nivel = padre_id, codigo, nivel
+        return filas
+
 
 class Unidad(models.Model):
     # Definir las constantes para tipos de unidad
@@ -26,6 +167,10 @@ class Unidad(models.Model):
     id_padre = models.ForeignKey('self', on_delete=models.SET_NULL, null=True, blank=True, related_name='subunidades')
     cod_unidad = models.CharField(max_length=50, unique=True, help_text="Código jerárquico correlativo")
     nivel = models.IntegerField(default=1, help_text="Nivel jerárquico (calculado automáticamente)")
+    ultimo_hijo = models.PositiveIntegerField(
+        default=0, editable=False,
+        help_text="Último componente de código asignado a una subunidad (contador por padre)"
+    )
     
     # Nuevo campo para el tipo de unidad
     tipo_unidad = models.CharField(
@@ -40,107 +185,30 @@ class Unidad(models.Model):
     fecha_creacion = models.DateTimeField(auto_now_add=True, verbose_name='Fecha de Creación')
     fecha_actualizacion = models.DateTimeField(auto_now=True, verbose_name='Fecha de Actualización')
     
+    objects = UnidadQuerySet.as_manager()
+    
     def save(self, *args, **kwargs):
-        is_new = self.pk is None  # Verificar si es un objeto nuevo
-        
-        # Verificar si es una actualización sin código de unidad
-        if not is_new and not self.cod_unidad:
-            # Si es una actualización sin código, recuperar el valor anterior
-            try:
-                old_unidad = Unidad.objects.get(pk=self.pk)
-                self.cod_unidad = old_unidad.cod_unidad
-            except Unidad.DoesNotExist:
-                # Si no existe, generar un código temporal
-                self.cod_unidad = f"temp_{uuid.uuid4()}"
-        
-        old_parent = None
-        
-        # Si ya existe, guardar el padre anterior
-        if not is_new:
-            try:
-                old_unidad = Unidad.objects.get(pk=self.pk)
-                old_parent = old_unidad.id_padre
-            except Unidad.DoesNotExist:
-                pass
-        
-        # Si es nueva o ha cambiado de padre, regenerar código
-        needs_code = is_new or not self.cod_unidad or self.cod_unidad.startswith('temp_') or old_parent != self.id_padre
-        
-        # Si es nueva o necesita un código, asignar un código temporal primero
-        if needs_code:
-            self.cod_unidad = f"temp_{uuid.uuid4()}"
+        with transaction.atomic():
+            anterior = None
+            if self.pk is not None:
+                anterior = Unidad.objects.filter(pk=self.pk).values('cod_unidad', 'id_padre_id').first()
             
-        # Guardar primero para obtener un ID (importante para objetos nuevos)
-        super().save(*args, **kwargs)
-        
-        # Si necesita un código definitivo
-        if needs_code:
-            # Si es raíz (primer nivel)
-            if not self.id_padre:
-                # Encontrar el mayor número usado en unidades de primer nivel
-                max_codigo = Unidad.objects.filter(
-                    id_padre__isnull=True
-                ).exclude(id=self.id).exclude(
-                    cod_unidad__startswith='temp_'
-                ).values_list('cod_unidad', flat=True)
-                
-                # Si hay códigos, tomar el máximo y sumar 1
-                if max_codigo:
-                    try:
-                        # Filtrar solo los códigos numéricos válidos
-                        valid_codes = [int(c) for c in max_codigo if c.isdigit()]
-                        if valid_codes:
-                            next_num = max(valid_codes) + 1
-                        else:
-                            next_num = 1
-                    except (ValueError, TypeError):
-                        next_num = 1
-                else:
-                    next_num = 1
-                
-                # Asignar código y nivel
-                self.cod_unidad = str(next_num)
-                self.nivel = 1
+            if anterior is None:
+                # Alta: reservar un código definitivo en el contador del padre
+                self.cod_unidad, self.nivel = Unidad.objects.reservar_codigo(self.id_padre_id)
+            elif (anterior['id_padre_id'] != self.id_padre_id
+                    or (self.cod_unidad or '').startswith('temp_')):
+                # Cambio de padre (o código temporal heredado): mover el subárbol completo
+                Unidad.objects.mover(self, self.id_padre_id)
+            elif not self.cod_unidad:
+                # Actualización sin código: conservar el valor anterior
+                self.cod_unidad = anterior['cod_unidad']
             
-            # Si tiene padre (niveles 2+)
-            else:
-                # Calcular nivel basado en el padre
-                self.nivel = self.id_padre.nivel + 1
-                
-                # Obtener el código del padre como base
-                codigo_base = self.id_padre.cod_unidad
-                
-                # Buscar el mayor número usado entre hermanos (unidades con mismo padre)
-                hermanos_codigos = Unidad.objects.filter(
-                    id_padre=self.id_padre
-                ).exclude(id=self.id).exclude(
-                    cod_unidad__startswith='temp_'
-                ).values_list('cod_unidad', flat=True)
-                
-                if hermanos_codigos:
-                    # Extraer solo el último componente de cada código hermano
-                    ultimo_componentes = []
-                    for codigo in hermanos_codigos:
-                        partes = codigo.split('.')
-                        if len(partes) > 0:
-                            try:
-                                ultimo_componentes.append(int(partes[-1]))
-                            except (ValueError, TypeError):
-                                pass
-                    
-                    # Encontrar el siguiente número disponible
-                    if ultimo_componentes:
-                        siguiente_componente = max(ultimo_componentes) + 1
-                    else:
-                        siguiente_componente = 1
-                else:
-                    siguiente_componente = 1
-                
-                # Formar el nuevo código basado en el código del padre
-                self.cod_unidad = f"{codigo_base}.{siguiente_componente}"
+            # Si se guardan solo algunos campos, incluir también el código y el nivel
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = set(kwargs['update_fields']) | {'cod_unidad', 'nivel'}
             
-            # Guardar con el código definitivo
-            super().save(update_fields=['cod_unidad', 'nivel'])
+            super().save(*args, **kwargs)
     
     def __str__(self):
         return f"{self.nombre} ({self.cod_unidad})"
@@ -156,49 +224,19 @@ class Unidad(models.Model):
         ordering = ['nivel', 'cod_unidad']  # Ordenar por nivel y luego por código
 
 
-@receiver(post_save, sender=Unidad)
-def actualizar_codigos_hijos(sender, instance, created, **kwargs):
+@receiver(pre_delete, sender=Unidad)
+def reubicar_subunidades(sender, instance, **kwargs):
     """
-    Cuando una unidad cambia su código, actualizar los códigos de todas sus unidades hijas
+    Al eliminar una unidad sus subunidades quedan sin padre (SET_NULL). Se convierten
+    en raíz con un código nuevo para que sus códigos dejen de colgar de la ruta de la
+    unidad eliminada y no sigan apareciendo en los subárboles de sus antiguos ancestros.
     """
-    # No actualizar si el código es temporal
-    if instance.cod_unidad.startswith('temp_'):
-        return
-        
-    # Solo continuar si ha habido un cambio en el código (no en cada guardado)
-    # Obtener las subunidades directas
-    subunidades = Unidad.objects.filter(id_padre=instance)
-    
-    # Si no hay subunidades, no hay nada que hacer
-    if not subunidades.exists():
-        return
-    
-    # Para cada subunidad, regenerar su código basado en el nuevo código del padre
-    for i, subunidad in enumerate(subunidades, 1):
-        # Obtener solo el último componente del código actual
-        partes_codigo = subunidad.cod_unidad.split('.')
-        if len(partes_codigo) > 0:
-            try:
-                ultimo_componente = int(partes_codigo[-1])
-            except (ValueError, TypeError):
-                # Si no es un número, usar el índice
-                ultimo_componente = i
-        else:
-            ultimo_componente = i
-        
-        # Formar el nuevo código
-        nuevo_codigo = f"{instance.cod_unidad}.{ultimo_componente}"
-        
-        # Si el código ha cambiado, actualizar
-        if nuevo_codigo != subunidad.cod_unidad:
-            # Actualizar el código y nivel
-            Unidad.objects.filter(id=subunidad.id).update(
-                cod_unidad=nuevo_codigo,
-                nivel=instance.nivel + 1
-            )
-            
-            # Actualizar la instancia para que los cambios estén disponibles
-            subunidad.refresh_from_db()
-            
-            # Procesar recursivamente
-            actualizar_codigos_hijos(sender, subunidad, False, **kwargs)
\ No newline at end of file
+    for subunidad in Unidad.objects.filter(id_padre=instance).only('pk'):
+        Unidad.objects.mover(subunidad, None)
+
+
+@receiver(post_save, sender=Unidad)
+@receiver(post_delete, sender=Unidad)
+def invalidar_cache_jerarquia(sender, instance, **kwargs):
+    """Cualquier alta, cambio, movimiento o baja de una unidad invalida los accesos cacheados"""
+    invalidar_jerarquia()
@@ -1,5 +1,11 @@
+import json
+from io import StringIO
+from django.core.management import call_command
 from django.test import TestCase
+from rest_framework.test import APIClient
+from users.models import Usuario
 from .models import Unidad
+from .jerarquia import regenerar_codigos
 
 class UnidadModelTest(TestCase):
 
@@ -17,4 +23,232 @@ class UnidadModelTest(TestCase):
 
     def test_unidad_str(self):
         unidad = Unidad.objects.get(nombre="Unidad 1")
-        self.assertEqual(str(unidad), "Unidad 1")
\ No newline at end of file
+        self.assertEqual(str(unidad), "Unidad 1")
+
+class UnidadSubarbolTest(TestCase):
+
+    def setUp(self):
+        self.zona = Unidad.objects.create(nombre="Zona", tipo_unidad=Unidad.TIPO_ZONA)
+        self.comandancia = Unidad.objects.create(nombre="Comandancia", id_padre=self.zona)
+        self.puesto = Unidad.objects.create(nombre="Puesto", id_padre=self.comandancia)
+        self.otra_zona = Unidad.objects.create(nombre="Otra zona", tipo_unidad=Unidad.TIPO_ZONA)
+
+    def test_subarbol_incluye_descendientes(self):
+        ids = set(Unidad.objects.subarbol(self.zona).values_list('id', flat=True))
+        self.assertEqual(ids, {self.zona.id, self.comandancia.id, self.puesto.id})
+
+    def test_subarbol_no_confunde_prefijos_numericos(self):
+        # Forzar hermanos "1.1" y "1.10": el subárbol de "1.1" no debe incluir "1.10"
+        for _ in range(9):
+            Unidad.objects.create(nombre="Hermana", id_padre=self.zona)
+        decima = Unidad.objects.get(cod_unidad=f"{self.zona.cod_unidad}.10")
+        ids = set(Unidad.objects.subarbol(self.comandancia.cod_unidad).values_list('id', flat=True))
+        self.assertNotIn(decima.id, ids)
+        self.assertEqual(ids, {self.comandancia.id, self.puesto.id})
+
+    def test_eliminar_unidad_reubica_subunidades_como_raiz(self):
+        self.comandancia.delete()
+        self.puesto.refresh_from_db()
+        self.assertIsNone(self.puesto.id_padre)
+        self.assertEqual(self.puesto.nivel, 1)
+        self.assertNotIn(self.puesto, Unidad.objects.subarbol(self.zona))
+
+
+class RegenerarCodigosTest(TestCase):
+
+    def setUp(self):
+        self.raiz = Unidad.objects.create(nombre="Raíz")
+        self.hijos = [Unidad.objects.create(nombre=f"Hijo {i}", id_padre=self.raiz) for i in range(3)]
+        self.nieto = Unidad.objects.create(nombre="Nieto", id_padre=self.hijos[2])
+        # Desordenar códigos y niveles sin pasar por save()
+        for i, unidad in enumerate(Unidad.objects.all()):
+            Unidad.objects.filter(pk=unidad.pk).update(cod_unidad=f"x{i}", nivel=9)
+
+    def test_regenera_codigos_y_niveles(self):
+        cambios = regenerar_codigos()
+        self.assertEqual(len(cambios), 5)
+        self.nieto.refresh_from_db()
+        self.assertEqual(self.nieto.cod_unidad, "1.3.1")
+        self.assertEqual(self.nieto.nivel, 3)
+        self.assertEqual(
+            list(Unidad.objects.filter(id_padre=self.raiz).order_by('id').values_list('cod_unidad', flat=True)),
+            ["1.1", "1.2", "1.3"]
+        )
+
+    def test_dry_run_no_escribe(self):
+        cambios = regenerar_codigos(dry_run=True)
+        self.assertEqual(len(cambios), 5)
+        self.assertFalse(Unidad.objects.filter(cod_unidad="1").exists())
+
+    def test_consultas_independientes_del_tamano(self):
+        # Savepoint + lectura + liberación de códigos + escritura definitiva + release
+        with self.assertNumQueries(5):
+            regenerar_codigos(tamano_lote=1000)
+
+    def test_comando_usa_ids(self):
+        salida = StringIO()
+        call_command('reset_unit_codes', stdout=salida)
+        self.nieto.refresh_from_db()
+        self.assertEqual(self.nieto.cod_unidad, f"{self.raiz.id}.{self.hijos[2].id}.{self.nieto.id}")
+
+
+class ReservaCodigoTest(TestCase):
+
+    def setUp(self):
+        self.raiz = Unidad.objects.create(nombre="Raíz")
+
+    def test_codigos_correlativos_sin_reutilizar_borrados(self):
+        primera = Unidad.objects.create(nombre="Primera", id_padre=self.raiz)
+        segunda = Unidad.objects.create(nombre="Segunda", id_padre=self.raiz)
+        self.assertEqual(primera.cod_unidad, f"{self.raiz.cod_unidad}.1")
+        self.assertEqual(segunda.cod_unidad, f"{self.raiz.cod_unidad}.2")
+        segunda.delete()
+        tercera = Unidad.objects.create(nombre="Tercera", id_padre=self.raiz)
+        self.assertEqual(tercera.cod_unidad, f"{self.raiz.cod_unidad}.3")
+        self.assertEqual(tercera.nivel, 2)
+
+    def test_alta_sin_recorrer_hermanos(self):
+        for i in range(5):
+            Unidad.objects.create(nombre=f"Hermana {i}", id_padre=self.raiz)
+        # Savepoint + bloqueo del padre + contador + INSERT + release
+        with self.assertNumQueries(5):
+            Unidad.objects.create(nombre="Nueva", id_padre=self.raiz)
+
+    def test_regenerar_ajusta_contadores(self):
+        for i in range(3):
+            Unidad.objects.create(nombre=f"Hija {i}", id_padre=self.raiz)
+        Unidad.objects.filter(pk=self.raiz.pk).update(ultimo_hijo=0)
+        regenerar_codigos()
+        self.raiz.refresh_from_db()
+        self.assertEqual(self.raiz.ultimo_hijo, 3)
+
+
+class MoverSubarbolTest(TestCase):
+
+    def setUp(self):
+        self.origen = Unidad.objects.create(nombre="Origen")
+        self.destino = Unidad.objects.create(nombre="Destino")
+        self.rama = Unidad.objects.create(nombre="Rama", id_padre=self.origen)
+        self.hoja = Unidad.objects.create(nombre="Hoja", id_padre=self.rama)
+        self.nieta = Unidad.objects.create(nombre="Nieta", id_padre=self.hoja)
+
+    def test_mover_reescribe_prefijo_y_nivel(self):
+        filas = Unidad.objects.mover(self.rama, self.destino.pk)
+        self.assertEqual(filas, 3)
+        self.hoja.refresh_from_db()
+        self.nieta.refresh_from_db()
+        self.assertEqual(self.rama.cod_unidad, f"{self.destino.cod_unidad}.1")
+        self.assertEqual(self.hoja.cod_unidad, f"{self.rama.cod_unidad}.1")
+        self.assertEqual(self.nieta.cod_unidad, f"{self.hoja.cod_unidad}.1")
+        self.assertEqual(self.nieta.nivel, 4)
+        self.assertFalse(Unidad.objects.subarbol(self.origen).filter(pk=self.hoja.pk).exists())
+
+    def test_mover_a_raiz_desde_save(self):
+        self.rama.id_padre = None
+        self.rama.save()
+        self.nieta.refresh_from_db()
+        self.assertEqual(self.rama.nivel, 1)
+        self.assertEqual(self.nieta.nivel, 3)
+        self.assertTrue(self.nieta.cod_unidad.startswith(f"{self.rama.cod_unidad}."))
+
+    def test_consultas_independientes_del_tamano(self):
+        for i in range(10):
+            Unidad.objects.create(nombre=f"Extra {i}", id_padre=self.hoja)
+        # Savepoint + bloqueo + comprobación de ciclo + reserva (bloqueo y contador)
+        # + UPDATE del subárbol + release
+        with self.assertNumQueries(7):
+            Unidad.objects.mover(self.rama, self.destino.pk)
+
+    def test_no_permite_mover_bajo_un_descendiente(self):
+        with self.assertRaises(ValueError):
+            Unidad.objects.mover(self.rama, self.nieta.pk)
+        self.rama.refresh_from_db()
+        self.assertEqual(self.rama.id_padre_id, self.origen.pk)
+
+    def test_id_padre_no_numerico(self):
+        usuario = Usuario.objects.create_user(
+            'mover@example.com', 'T000005', 'clave', nombre='Ana', apellido1='Ruiz',
+            ref='MOV1', tipo_usuario=Usuario.SUPERADMIN
+        )
+        client = APIClient()
+        client.force_authenticate(usuario)
+        response = client.post(f'/api/unidades/{self.rama.pk}/mover/', {'id_padre': 'abc'})
+        self.assertEqual(response.status_code, 400)
+
+
+class ArbolUnidadesTest(TestCase):
+
+    def setUp(self):
+        self.raiz = Unidad.objects.create(nombre="Raíz")
+        self.hija = Unidad.objects.create(nombre="Hija", id_padre=self.raiz)
+        self.nieta = Unidad.objects.create(nombre="Nieta", id_padre=self.hija)
+        usuario = Usuario.objects.create_user(
+            'arbol@example.com', 'T000001', 'clave', nombre='Ana', apellido1='Ruiz',
+            ref='ARB1', tipo_usuario=Usuario.SUPERADMIN
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(usuario)
+
+    def obtener_arbol(self, **params):
+        response = self.client.get('/api/unidades/tree/', params)
+        return response, json.loads(b''.join(response.streaming_content))
+
+    def test_arbol_anidado_en_una_consulta(self):
+        # Firma para el ETag + lectura de todas las unidades
+        with self.assertNumQueries(2):
+            response, arbol = self.obtener_arbol()
+        self.assertEqual(len(arbol), 1)
+        self.assertEqual(arbol[0]['subunidades'][0]['subunidades'][0]['id'], self.nieta.pk)
+
+    def test_root_y_depth(self):
+        _, arbol = self.obtener_arbol(root=self.hija.pk, depth=1)
+        self.assertEqual([nodo['id'] for nodo in arbol], [self.hija.pk])
+        self.assertEqual(arbol[0]['subunidades'], [])
+
+    def test_etag_devuelve_304_si_no_hay_cambios(self):
+        response, _ = self.obtener_arbol()
+        etag = response['ETag']
+        self.assertEqual(
+            self.client.get('/api/unidades/tree/', HTTP_IF_NONE_MATCH=etag).status_code, 304
+        )
+        self.nieta.nombre = "Nieta renombrada"
+        self.nieta.save()
+        self.assertEqual(
+            self.client.get('/api/unidades/tree/', HTTP_IF_NONE_MATCH=etag).status_code, 200
+        )
+
+
+class AncestrosUnidadTest(TestCase):
+
+    def setUp(self):
+        self.zona = Unidad.objects.create(nombre="Zona", tipo_unidad=Unidad.TIPO_ZONA)
+        self.comandancia = Unidad.objects.create(nombre="Comandancia", id_padre=self.zona)
+        self.compania = Unidad.objects.create(nombre="Compañía", id_padre=self.comandancia)
+        self.puesto_a = Unidad.objects.create(nombre="Puesto A", id_padre=self.compania)
+        self.puesto_b = Unidad.objects.create(nombre="Puesto B", id_padre=self.comandancia)
+        self.otra_zona = Unidad.objects.create(nombre="Otra zona")
+
+    def test_ancestros_en_una_consulta(self):
+        with self.assertNumQueries(1):
+            ancestros = list(Unidad.objects.ancestros(self.puesto_a))
+        self.assertEqual(ancestros, [self.zona, self.comandancia, self.compania])
+        self.assertEqual(
+            Unidad.objects.ancestros(self.puesto_a).filter(tipo_unidad=Unidad.TIPO_ZONA).last(),
+            self.zona
+        )
+
+    def test_descendientes(self):
+        self.assertEqual(
+            set(Unidad.objects.descendientes(self.comandancia)),
+            {self.compania, self.puesto_a, self.puesto_b}
+        )
+        self.assertEqual(
+            set(Unidad.objects.descendientes(self.comandancia, profundidad=1)),
+            {self.compania, self.puesto_b}
+        )
+
+    def test_ancestro_comun(self):
+        self.assertEqual(Unidad.objects.ancestro_comun(self.puesto_a, self.puesto_b), self.comandancia)
+        self.assertEqual(Unidad.objects.ancestro_comun(self.puesto_a, self.compania), self.compania)
+        with self.assertNumQueries(0):
+            self.assertIsNone(Unidad.objects.ancestro_comun(self.puesto_a, self.otra_zona))
@@ -1,13 +1,20 @@
+import hashlib
+import json
+
 from rest_framework import viewsets, status
 from rest_framework.response import Response
 from rest_framework.decorators import action
 from django.db import transaction, IntegrityError
+from django.db.models import Count, Max
+from django.http import StreamingHttpResponse
+from django.utils.http import parse_etags, quote_etag
 from .models import Unidad
 from .serializers import UnidadSerializer
-import uuid
+from .jerarquia import CAMPOS_ARBOL, construir_arbol, regenerar_codigos
 
 class UnidadViewSet(viewsets.ModelViewSet):
-    queryset = Unidad.objects.all()
+    # select_related evita una consulta por fila al resolver padre_nombre
+    queryset = Unidad.objects.select_related('id_padre')
     serializer_class = UnidadSerializer
 
     def get_queryset(self):
@@ -82,24 +89,15 @@ class UnidadViewSet(viewsets.ModelViewSet):
             serializer = self.get_serializer(instance, data=mutable_data, partial=partial)
             serializer.is_valid(raise_exception=True)
             
-            # Comprobar si ha cambiado el padre
-            old_padre = instance.id_padre
-            new_padre = serializer.validated_data.get('id_padre', old_padre)
-            
-            # Si cambia el padre, necesitamos recalcular código
-            needs_recalc = (old_padre != new_padre)
-            
-            # Actualizar en transacción
+            # Actualizar en transacción (si cambia el padre, Unidad.save mueve
+            # el subárbol completo bajo el nuevo padre con un único UPDATE)
             with transaction.atomic():
-                # Si cambia el padre, resetear el código para forzar recálculo
-                if needs_recalc:
-                    instance.cod_unidad = f"temp_{uuid.uuid4()}"
-                    instance.save(update_fields=['cod_unidad'])
-                
-                # Realizar la actualización
                 self.perform_update(serializer)
             
             return Response(serializer.data)
+        except ValueError as e:
+            # Movimiento no permitido (la unidad colgaría de sí misma o de una subunidad)
+            return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
             import logging
             logger = logging.getLogger(__name__)
@@ -119,27 +117,103 @@ class UnidadViewSet(viewsets.ModelViewSet):
     def perform_destroy(self, instance):
         instance.delete()
 
+    @action(detail=False, methods=['get'])
+    def tree(self, request):
+        """
+        Devuelve la jerarquía completa como árbol anidado (clave 'subunidades').
+        
+        Parámetros opcionales: root (id de la unidad raíz del subárbol) y depth
+        (número máximo de niveles a devolver, 1 = solo la raíz). Las unidades se leen
+        con una sola consulta y el JSON se emite en streaming raíz a raíz. La respuesta
+        lleva un ETag derivado de la última fecha_actualizacion y del número de
+        unidades; si coincide con If-None-Match se responde 304 sin cuerpo.
+        """
+        root = request.query_params.get('root')
+        depth = request.query_params.get('depth')
+        try:
+            depth = int(depth) if depth else None
+            if depth is not None and depth < 1:
+                raise ValueError
+        except ValueError:
+            return Response({'detail': 'depth debe ser un entero positivo'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        estado = Unidad.objects.aggregate(ultima=Max('fecha_actualizacion'), total=Count('id'))
+        firma = f"{estado['ultima'].isoformat() if estado['ultima'] else ''}:{estado['total']}:{root or ''}:{depth or ''}"
+        etag = quote_etag(hashlib.md5(firma.encode()).hexdigest())
+        
+        if_none_match = request.headers.get('If-None-Match')
+        if if_none_match and etag in parse_etags(if_none_match):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+        
+        unidades = Unidad.objects.order_by('nivel', 'cod_unidad')
+        if root:
+            raiz = Unidad.objects.filter(pk=root).values('cod_unidad', 'nivel').first()
+            if raiz is None:
+                return Response({'detail': 'La unidad raíz no existe'}, status=status.HTTP_404_NOT_FOUND)
+            unidades = unidades.subarbol(raiz['cod_unidad'])
+            if depth:
+                unidades = unidades.filter(nivel__lt=raiz['nivel'] + depth)
+        elif depth:
+            unidades = unidades.filter(nivel__lte=depth)
+        
+        arbol = construir_arbol(unidades.values(*CAMPOS_ARBOL))
+        
+        def emitir():
+            yield '['
+            for i, nodo in enumerate(arbol):
+                yield (',' if i else '') + json.dumps(nodo)
+            yield ']'
+        
+        response = StreamingHttpResponse(emitir(), content_type='application/json')
+        response['ETag'] = etag
+        return response
+
+    @action(detail=True, methods=['post'])
+    def mover(self, request, pk=None):
+        """
+        Mueve la unidad (con todas sus subunidades) bajo id_padre, o a la raíz si
+        id_padre es nulo. Devuelve la unidad actualizada y las filas afectadas.
+        """
+        unidad = self.get_object()
+        padre_id = request.data.get('id_padre') or None
+        if padre_id is not None:
+            try:
+                padre_id = int(padre_id)
+            except (TypeError, ValueError):
+                return Response({'detail': 'id_padre no es válido'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        if padre_id is not None and not Unidad.objects.filter(pk=padre_id).exists():
+            return Response({'detail': 'La unidad padre no existe'}, status=status.HTTP_404_NOT_FOUND)
+        
+        try:
+            filas = Unidad.objects.mover(unidad, padre_id)
+        except ValueError as e:
+            return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        return Response({
+            'unidad': self.get_serializer(unidad).data,
+            'filas_afectadas': filas,
+        })
+
     @action(detail=False, methods=['post'])
     def regenerate_codes(self, request):
-        """Endpoint para regenerar todos los códigos jerárquicos"""
+        """
+        Endpoint para regenerar todos los códigos jerárquicos.
+        Con dry_run=true devuelve los cambios sin aplicarlos.
+        """
+        dry_run = str(request.data.get('dry_run', request.query_params.get('dry_run', 'false'))).lower() == 'true'
         try:
-            with transaction.atomic():
-                # 1. Resetear todos los códigos a valores temporales
-                Unidad.objects.update(cod_unidad='temp_reset')
-                
-                # 2. Regenerar códigos empezando por las unidades raíz
-                raices = Unidad.objects.filter(id_padre__isnull=True).order_by('id')
-                
-                for i, raiz in enumerate(raices, 1):
-                    raiz.cod_unidad = str(i)
-                    raiz.nivel = 1
-                    raiz.save(update_fields=['cod_unidad', 'nivel'])
-                    
-                    # Los hijos se actualizarán mediante el signal
+            cambios = regenerar_codigos(dry_run=dry_run)
             
-            return Response({'detail': 'Códigos regenerados con éxito'}, status=status.HTTP_200_OK)
+            data = {
+                'detail': 'Simulación de regeneración de códigos' if dry_run else 'Códigos regenerados con éxito',
+                'total_cambios': len(cambios),
+            }
+            if dry_run:
+                data['cambios'] = [cambio._asdict() for cambio in cambios]
+            return Response(data, status=status.HTTP_200_OK)
         except Exception as e:
             return Response(
                 {'detail': f'Error al regenerar códigos: {str(e)}'},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
-            )
\ No newline at end of file
+            )
@@ -1,9 +1,19 @@
+from collections import namedtuple
 from django.db import models
+from django.conf import settings
+from django.core.cache import cache
 from django.contrib.auth.models import AbstractUser, BaseUserManager
 from unidades.models import Unidad
+from unidades.cache import get_version_jerarquia
 from empleos.models import Empleo
 from django.db.models import Q
 
+# Conjuntos inmutables con los IDs y los tipos de las unidades accesibles de un usuario
+AccesoUnidades = namedtuple('AccesoUnidades', ['ids', 'tipos'])
+
+# Segundos que se conserva en caché el acceso calculado de cada usuario
+ACCESO_UNIDADES_TIMEOUT = getattr(settings, 'ACCESO_UNIDADES_TIMEOUT', 60 * 60)
+
 class UserManager(BaseUserManager):
     def create_user(self, email, tip, password=None, **extra_fields):
         if not email:
@@ -105,61 +115,74 @@ class Usuario(AbstractUser):
         2. Unidad de acceso
         3. Tipo de usuario (si es Admin o SuperAdmin puede ver unidades dependientes)
         
-        Retorna un QuerySet de unidades.
+        Retorna un QuerySet de unidades. Las unidades dependientes se resuelven con la
+        ruta materializada de cod_unidad, así que el coste es constante sea cual sea
+        la profundidad de la jerarquía.
         """
         if self.is_superadmin:
             # SuperAdmin tiene acceso a todas las unidades
             return Unidad.objects.all()
         
-        unidades_ids = set()
-        unidades_base = []
-        
-        # Añadir las unidades directamente asignadas
-        if self.unidad_destino:
-            unidades_base.append(self.unidad_destino)
-        if self.unidad_acceso:
-            unidades_base.append(self.unidad_acceso)
-        
-        # Para cada unidad base, determinar qué unidades adicionales son accesibles
-        for unidad_base in unidades_base:
-            unidades_ids.add(unidad_base.id)
-            
-            # Si es Admin o Gestor, incluir unidades dependientes según jerarquía
-            if self.is_admin or self.is_gestor:
-                # Buscar recursivamente todas las unidades dependientes
-                dependientes = self._obtener_unidades_dependientes_recursivamente(unidad_base)
-                unidades_ids.update(dependientes)
+        # Unidades directamente asignadas (sin cargar las relaciones)
+        unidades_ids = {uid for uid in (self.unidad_destino_id, self.unidad_acceso_id) if uid}
         
         # Si no hay unidades, devolver un QuerySet vacío
         if not unidades_ids:
             return Unidad.objects.none()
         
-        # Devolver QuerySet con todas las unidades accesibles
+        # Si es Admin o Gestor, incluir unidades dependientes según jerarquía
+        if self.is_admin or self.is_gestor:
+            codigos = Unidad.objects.filter(id__in=unidades_ids).values_list('cod_unidad', flat=True)
+            return Unidad.objects.subarbol(*codigos)
+        
         return Unidad.objects.filter(id__in=unidades_ids)
     
-    def _obtener_unidades_dependientes_recursivamente(self, unidad):
-        """Función auxiliar para obtener todos los IDs de unidades dependientes recursivamente"""
-        result = set()
-        # Buscar unidades que tienen a esta unidad como padre
-        subunidades = Unidad.objects.filter(id_padre=unidad.id)
-        
-        for subunidad in subunidades:
-            result.add(subunidad.id)
-            # Recursión para obtener unidades dependientes de esta subunidad
-            child_ids = self._obtener_unidades_dependientes_recursivamente(subunidad)
-            result.update(child_ids)
-            
-        return result
+    def get_acceso_unidades(self):
+        """
+        Devuelve un AccesoUnidades con los IDs y tipos de las unidades accesibles.
+        
+        El resultado se guarda en caché con una clave que incluye la versión global de
+        la jerarquía y los campos del usuario que determinan su acceso (rol, unidad de
+        destino y de acceso). Cualquier cambio en el árbol incrementa la versión, y
+        cualquier cambio de rol o de unidades (assign_units, change_role, edición del
+        usuario) produce una clave distinta, así que nunca se sirve un acceso obsoleto.
+        Dentro de una misma petición se reutiliza además la copia de la instancia.
+        """
+        clave = 'usuario:{}:acceso:{}:{}:{}:v{}'.format(
+            self.pk, self.tipo_usuario, self.unidad_destino_id, self.unidad_acceso_id,
+            get_version_jerarquia()
+        )
+        memo = getattr(self, '_acceso_unidades', None)
+        if memo is not None and memo[0] == clave:
+            return memo[1]
+        
+        acceso = cache.get(clave)
+        if acceso is None:
+            filas = list(self.get_unidades_accesibles().values_list('id', 'tipo_unidad'))
+            acceso = AccesoUnidades(
+                ids=frozenset(uid for uid, _ in filas),
+                tipos=frozenset(tipo for _, tipo in filas),
+            )
+            cache.set(clave, acceso, ACCESO_UNIDADES_TIMEOUT)
+        
+        self._acceso_unidades = (clave, acceso)
+        return acceso
     
     def puede_acceder_unidad(self, unidad_id):
         """Verifica si el usuario puede acceder a una unidad específica"""
         # SuperAdmin siempre tiene acceso
         if self.is_superadmin:
             return True
+        
+        # Admitir tanto el ID como la propia unidad
+        unidad_id = getattr(unidad_id, 'pk', unidad_id)
+        try:
+            unidad_id = int(unidad_id)
+        except (TypeError, ValueError):
+            return False
             
-        # Obtener todas las unidades accesibles y comprobar si la unidad solicitada está entre ellas
-        unidades_accesibles = self.get_unidades_accesibles()
-        return unidades_accesibles.filter(id=unidad_id).exists()
+        # Comprobar contra el conjunto cacheado de unidades accesibles
+        return unidad_id in self.get_acceso_unidades().ids
     
     def puede_ver_procedimiento(self, procedimiento):
         """
@@ -176,8 +199,7 @@ class Usuario(AbstractUser):
             return True
             
         # Obtener tipos de unidades a las que tiene acceso
-        unidades_accesibles = self.get_unidades_accesibles()
-        tipos_unidades_accesibles = set(unidades_accesibles.values_list('tipo_unidad', flat=True))
+        tipos_unidades_accesibles = self.get_acceso_unidades().tipos
         
         # Caso especial para unidades híbridas Zona-Comandancia
         if 'ZONA_COMANDANCIA' in tipos_unidades_accesibles:
@@ -1,3 +1,4 @@
+from django.core.cache import cache
 from django.test import TestCase
 from .models import Usuario, Unidad, Empleo  # Cambiado de User a Usuario
 
@@ -65,4 +66,60 @@ class EmpleoModelTest(TestCase):
     def test_empleo_creation(self):
         empleo = Empleo.objects.get(id=1)
         self.assertEqual(empleo.nombre, 'Empleo Test')
-        self.assertEqual(empleo.abreviatura, 'ET')
\ No newline at end of file
+        self.assertEqual(empleo.abreviatura, 'ET')
+
+class UnidadesAccesiblesTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.zona = Unidad.objects.create(nombre='Zona', tipo_unidad=Unidad.TIPO_ZONA)
+        padre = cls.zona
+        # Cadena profunda para comprobar que el coste no depende de la profundidad
+        for nivel in range(6):
+            padre = Unidad.objects.create(nombre=f'Nivel {nivel}', id_padre=padre)
+        cls.hoja = padre
+        cls.ajena = Unidad.objects.create(nombre='Ajena')
+        cls.admin = Usuario.objects.create_user(
+            'admin@example.com', 'T001', 'password123', nombre='Ana', apellido1='Ruiz',
+            ref='ADM', tipo_usuario=Usuario.ADMIN, unidad_destino=cls.zona
+        )
+        cls.usuario = Usuario.objects.create_user(
+            'user@example.com', 'T002', 'password123', nombre='Luis', apellido1='Sanz',
+            ref='USR', unidad_destino=cls.zona
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_admin_accede_a_unidades_dependientes(self):
+        self.assertTrue(self.admin.puede_acceder_unidad(self.hoja.id))
+        self.assertFalse(self.admin.puede_acceder_unidad(self.ajena.id))
+        self.assertEqual(self.admin.get_unidades_accesibles().count(), 7)
+
+    def test_usuario_solo_accede_a_su_unidad(self):
+        self.assertEqual(list(self.usuario.get_unidades_accesibles()), [self.zona])
+        self.assertFalse(self.usuario.puede_acceder_unidad(self.hoja.id))
+
+    def test_consultas_constantes(self):
+        with self.assertNumQueries(2):
+            self.admin.puede_acceder_unidad(self.hoja.id)
+
+    def test_acceso_cacheado_entre_peticiones(self):
+        self.admin.puede_acceder_unidad(self.hoja.id)
+        # Otra instancia del mismo usuario (otra petición) reutiliza la caché
+        admin = Usuario.objects.get(pk=self.admin.pk)
+        with self.assertNumQueries(0):
+            self.assertTrue(admin.puede_acceder_unidad(self.hoja.id))
+            self.assertFalse(admin.puede_acceder_unidad(self.ajena.id))
+
+    def test_cambios_en_jerarquia_invalidan_cache(self):
+        self.assertFalse(self.admin.puede_acceder_unidad(self.ajena.id))
+        self.ajena.id_padre = self.hoja
+        self.ajena.save()
+        self.assertTrue(self.admin.puede_acceder_unidad(self.ajena.id))
+
+    def test_cambio_de_unidades_invalida_cache(self):
+        self.assertFalse(self.usuario.puede_acceder_unidad(self.ajena.id))
+        self.usuario.unidad_acceso = self.ajena
+        self.usuario.save()
+        self.assertTrue(self.usuario.puede_acceder_unidad(self.ajena.id))
@@ -243,6 +243,46 @@ const getDocumentosGenerales = async (procedimientoId) => {
   }
 };
 
+// Descarga de archivos
+// Los archivos se descargan por /downloads/, que exige usuario autenticado. Un enlace o
+// window.open no envían la cabecera Authorization: antes de abrirlos se pide una URL
+// firmada, válida unos minutos y solo para ese archivo. Las URL externas no cambian.
+const firmarDescarga = async (url) => {
+  if (!url || !url.includes('/downloads/')) return url;
+  const response = await api.get(`${BASE_URL}/descargas/firmar/`, { params: { url } });
+  return response.data.url;
+};
+
+// Nombre con el que guardar el archivo: el del documento con la extensión del archivo
+// (en el servidor el archivo se llama como su contenido, un hash)
+const nombreDescarga = (url, nombre) => {
+  const archivo = decodeURIComponent(url.split('?')[0].split('/').pop());
+  if (!nombre) return archivo;
+  const extension = archivo.includes('.') ? archivo.split('.').pop() : '';
+  return extension && !nombre.toLowerCase().endsWith(`.${extension.toLowerCase()}`)
+    ? `${nombre}.${extension}`
+    : nombre;
+};
+
+const descargarArchivo = async (url, nombre) => {
+  const link = document.createElement('a');
+  link.href = await firmarDescarga(url);
+  link.setAttribute('download', nombreDescarga(url, nombre));
+  link.style.display = 'none';
+  document.body.appendChild(link);
+  link.click();
+  setTimeout(() => {
+    document.body.removeChild(link);
+  }, 100);
+};
+
+const abrirArchivo = async (url) => {
+  // La pestaña se abre antes de pedir la firma para que el navegador no la bloquee
+  const ventana = window.open('', '_blank');
+  const firmada = await firmarDescarga(url);
+  if (ventana) ventana.location.href = firmada;
+};
+
 // Historial
 const getHistorial = (procedimientoId) => {
   return api.get(`${BASE_URL}/historial/`, {
@@ -361,6 +401,11 @@ const procedimientosService = {
   removeDocumentoPaso,
   addDocumentToPaso,
   
+  firmarDescarga,
+  nombreDescarga,
+  descargarArchivo,
+  abrirArchivo,
+  
   getHistorial,
   getNextAvailableNumber,
   getProcedimientoCadena
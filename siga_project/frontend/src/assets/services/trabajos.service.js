@@ -136,6 +136,62 @@ const getAlertasPlazos = async (isSuperAdmin = false) => {
   }
 };
 
+// Suscribirse a los cambios de alertas de plazos (Server-Sent Events) en lugar de
+// consultar periódicamente getAlertasPlazos. Los manejadores reciben los eventos:
+// onAlerta(alerta) para altas y cambios, onBaja({ paso_id }) y onReinicio() cuando
+// se han perdido eventos y hay que volver a pedir la lista completa. onConectado()
+// y onDesconectado() indican si el stream está abierto: mientras no lo está (o si el
+// backend no se sirve por ASGI y responde 503) el cliente debe seguir consultando.
+// Devuelve una función para cerrar la conexión.
+const suscribirAlertasPlazos = (isSuperAdmin, { onAlerta, onBaja, onReinicio, onConectado, onDesconectado }) => {
+  let source = null;
+  let ultimoEvento = null;
+  let cerrado = false;
+  let reintento = null;
+  let abiertoAlgunaVez = false;
+
+  const conectar = () => {
+    // EventSource no permite cabeceras: el token va como parámetro
+    const params = new URLSearchParams({ token: localStorage.getItem('token') || '' });
+    if (isSuperAdmin) params.append('all', 'true');
+    if (ultimoEvento) params.append('ultimo_evento', ultimoEvento);
+
+    source = new EventSource(`${api.defaults.baseURL}${BASE_URL}/alertas-plazos/stream/?${params.toString()}`);
+
+    const manejar = (callback) => (event) => {
+      ultimoEvento = event.lastEventId || ultimoEvento;
+      if (callback) callback(JSON.parse(event.data));
+    };
+    source.addEventListener('alerta', manejar(onAlerta));
+    source.addEventListener('baja', manejar(onBaja));
+    source.addEventListener('reinicio', () => onReinicio && onReinicio());
+
+    source.onopen = () => {
+      abiertoAlgunaVez = true;
+      if (onConectado) onConectado();
+    };
+
+    source.onerror = () => {
+      if (onDesconectado) onDesconectado();
+      // Si nunca llegó a abrirse (backend por WSGI, 503) no se insiste: basta la
+      // consulta periódica. El navegador reconecta solo; si la conexión se cerró
+      // (p. ej. token caducado) se vuelve a abrir con el token actual y el último
+      // evento recibido
+      if (source.readyState === EventSource.CLOSED && !cerrado && abiertoAlgunaVez) {
+        reintento = setTimeout(conectar, 5000);
+      }
+    };
+  };
+
+  conectar();
+
+  return () => {
+    cerrado = true;
+    clearTimeout(reintento);
+    if (source) source.close();
+  };
+};
+
 // Añadir esta función al objeto trabajosService
 const getPasoTrabajoById = async (pasoId) => {
   try {
@@ -158,6 +214,7 @@ const trabajosService = {
   iniciarPasoTrabajo,
   completarPasoTrabajo,
   getAlertasPlazos,
+  suscribirAlertasPlazos,
   getPasoTrabajoById // Añadir este método
 };
 
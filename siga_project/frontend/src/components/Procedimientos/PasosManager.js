@@ -151,23 +151,10 @@ const PasoItem = ({
     setPreviewOpen(true);
   };
   // Función para descargar documentos directamente
-  const handleDirectDownload = (e, url) => {
+  const handleDirectDownload = (e, documento) => {
     e.stopPropagation();
-    // Crear un elemento <a> temporal
-    const link = document.createElement('a');
-    link.href = url;
-    // Extraer el nombre del archivo de la URL
-    const fileName = url.split('/').pop().split('?')[0];
-    // Establecer el atributo download
-    link.setAttribute('download', fileName);
-    // Hacer la descarga de manera programática
-    link.style.display = 'none';
-    document.body.appendChild(link);
-    link.click();
-    // Limpieza: eliminar el elemento después de un breve retraso
-    setTimeout(() => {
-      document.body.removeChild(link);
-    }, 100);
+    // Con el nombre del documento (el archivo se llama como su hash)
+    procedimientosService.descargarArchivo(documento.archivo_url, documento.nombre);
   };
   return (
     <Paper 
@@ -426,7 +413,7 @@ const PasoItem = ({
                               <Tooltip title="Descargar">
                                 <IconButton
                                   size="small"
-                                  onClick={(e) => handleDirectDownload(e, docPaso.documento_detalle.archivo_url)}
+                                  onClick={(e) => handleDirectDownload(e, docPaso.documento_detalle)}
                                   sx={{ mr: 0.5 }}
                                 >
                                   <DownloadIcon fontSize="small" />
@@ -684,12 +671,9 @@ const fetchDocumentosGenerales = async () => {
     // Usar la función específica para documentos generales
     const response = await procedimientosService.getDocumentosGenerales(procedimientoId);
     
-    // Filtrar documentos que explícitamente tengan tipo_documento = 'GENERAL'
-    // o no tengan tipo_documento definido pero estén en la carpeta 'general'
-    const documentosGeneralesFiltrados = response.data.filter(doc => 
-      doc.tipo_documento === 'GENERAL' || 
-      (!doc.tipo_documento && doc.archivo_url && doc.archivo_url.includes('/general/') && !doc.archivo_url.includes('/pasos/'))
-    );
+    // Filtrar por tipo_documento: los archivos se guardan por contenido y su ruta
+    // ya no indica si el documento es general o de un paso
+    const documentosGeneralesFiltrados = response.data.filter(doc => doc.tipo_documento === 'GENERAL');
     
     console.log('Documentos generales filtrados:', documentosGeneralesFiltrados.length);
     setDocumentosGenerales(documentosGeneralesFiltrados);
@@ -1228,23 +1212,10 @@ const handleDeletePaso = (pasoId) => {
   };
   // Modificar la función handleViewDocuments
 // Función para manejar la descarga directa de documentos
-const handleDirectDownload = (e, url) => {
+const handleDirectDownload = (e, documento) => {
   e.stopPropagation();
-  // Crear un elemento <a> temporal
-  const link = document.createElement('a');
-  link.href = url;
-  // Extraer el nombre del archivo de la URL
-  const fileName = url.split('/').pop().split('?')[0];
-  // Establecer el atributo download
-  link.setAttribute('download', fileName);
-  // Hacer la descarga de manera programática
-  link.style.display = 'none';
-  document.body.appendChild(link);
-  link.click();
-  // Limpieza: eliminar el elemento después de un breve retraso
-  setTimeout(() => {
-    document.body.removeChild(link);
-  }, 100);
+  // Con el nombre del documento (el archivo se llama como su hash)
+  procedimientosService.descargarArchivo(documento.archivo_url, documento.nombre);
 };
 // Función para manejar la visualización de documentos
 const handleViewDocuments = (paso) => {
@@ -1672,7 +1643,7 @@ const handleDeleteGeneralDoc = (doc) => {
                                 </IconButton>
                               </Tooltip>
                               <Tooltip title="Descargar">
-                                <IconButton size="small" onClick={(e) => handleDirectDownload(e, doc.archivo_url)} sx={{ mr: 0.5 }}>
+                                <IconButton size="small" onClick={(e) => handleDirectDownload(e, doc)} sx={{ mr: 0.5 }}>
                                   <DownloadIcon fontSize="small" />
                                 </IconButton>
                               </Tooltip>
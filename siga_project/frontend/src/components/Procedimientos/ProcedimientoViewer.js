@@ -117,21 +117,9 @@ const ProcedimientoViewer = () => {
           // Si puedes modificar la API, usa el enfoque 1
           const docsGeneralesResponse = await procedimientosService.getDocumentosGenerales(procedimientoId);
           
-          // Filtrar solo los documentos en la carpeta general
+          // Filtrar solo los documentos generales (la ruta del archivo ya no lo indica)
           const documentosGeneralesFiltrados = (docsGeneralesResponse.data.results || docsGeneralesResponse.data || [])
-            .filter(doc => {
-              // Verificar que el documento no tenga paso asociado
-              const noPaso = !doc.paso;
-              
-              // Verificar que esté en la carpeta general mediante la URL
-              const esCarpetaGeneral = doc.archivo_url && 
-                                      doc.archivo_url.includes(`/media/procedimientos/${procedimientoId}/general/`);
-              
-              // También considera los documentos marcados explícitamente como generales
-              const marcadoGeneral = doc.es_general === true;
-              
-              return noPaso && (esCarpetaGeneral || marcadoGeneral);
-            });
+            .filter(doc => !doc.paso && doc.tipo_documento === 'GENERAL');
           
           console.log("Documentos generales filtrados:", documentosGeneralesFiltrados.length);
           setDocumentosGenerales(documentosGeneralesFiltrados);
@@ -60,6 +60,7 @@ import { format, differenceInDays } from 'date-fns';
 import { es } from 'date-fns/locale';
 
 import trabajosService from '../../assets/services/trabajos.service';
+import procedimientosService from '../../assets/services/procedimientos.service';
 import { AuthContext } from '../../contexts/AuthContext';
 
 const TrabajoDetail = () => {
@@ -89,12 +90,8 @@ const TrabajoDetail = () => {
             .filter(doc => {
               if (!doc) return false;
               
-              // Verificar si es documento general (carpeta general o sin paso asociado)
-              const esCarpetaGeneral = doc.archivo_url && 
-                                    (doc.archivo_url.includes('/general/') || 
-                                      !doc.archivo_url.includes('/pasos/'));
-              
-              return esCarpetaGeneral;
+              // Documento general con archivo (la ruta del archivo ya no indica si es de un paso)
+              return doc.archivo_url && doc.tipo_documento === 'GENERAL';
             });
           
           console.log("Documentos generales filtrados:", documentosGeneralesFiltrados.length, documentosGeneralesFiltrados);
@@ -416,9 +413,7 @@ const TrabajoDetail = () => {
                     <Tooltip title="Visualizar">
                       <IconButton
                         size="small"
-                        component="a"
-                        href={doc.archivo_url}
-                        target="_blank"
+                        onClick={() => procedimientosService.abrirArchivo(doc.archivo_url)}
                         sx={{ mr: 0.5 }}
                       >
                         <VisibilityIcon fontSize="small" />
@@ -427,9 +422,7 @@ const TrabajoDetail = () => {
                     <Tooltip title="Descargar">
                       <IconButton
                         size="small"
-                        component="a"
-                        href={doc.archivo_url}
-                        download
+                        onClick={() => procedimientosService.descargarArchivo(doc.archivo_url, doc.nombre)}
                         sx={{ mr: 0.5 }}
                       >
                         <DownloadIcon fontSize="small" />
@@ -53,6 +53,7 @@ import { format } from 'date-fns';
 import { es } from 'date-fns/locale';
 
 import trabajosService from '../../assets/services/trabajos.service';
+import procedimientosService from '../../assets/services/procedimientos.service';
 import DocumentPreview from '../common/DocumentPreview';
 
 import FolderIcon from '@mui/icons-material/Folder';
@@ -94,12 +95,8 @@ const TrabajoEjecutor = () => {
             .filter(doc => {
               if (!doc) return false;
               
-              // Verificar si es documento general (carpeta general o sin paso asociado)
-              const esCarpetaGeneral = doc.archivo_url && 
-                                     (doc.archivo_url.includes('/general/') || 
-                                      !doc.archivo_url.includes('/pasos/'));
-              
-              return esCarpetaGeneral;
+              // Documento general con archivo (la ruta del archivo ya no indica si es de un paso)
+              return doc.archivo_url && doc.tipo_documento === 'GENERAL';
             });
           
           console.log("Documentos generales filtrados:", documentosGeneralesFiltrados.length, documentosGeneralesFiltrados);
@@ -306,28 +303,12 @@ useEffect(() => {
     setPreviewOpen(true);
   };
 
-  const handleDirectDownload = (e, url) => {
+  const handleDirectDownload = (e, documento) => {
     e.preventDefault();
     e.stopPropagation();
     
-    // Crear un elemento <a> temporal
-    const link = document.createElement('a');
-    link.href = url;
-    
-    // Extraer el nombre del archivo de la URL
-    const fileName = url.split('/').pop().split('?')[0];
-    
-    // Establecer el atributo download
-    link.setAttribute('download', fileName);
-    
-    // Hacer la descarga de manera programática
-    document.body.appendChild(link);
-    link.click();
-    
-    // Limpieza: eliminar el elemento
-    setTimeout(() => {
-      document.body.removeChild(link);
-    }, 100);
+    // Con el nombre del documento (el archivo se llama como su hash)
+    procedimientosService.descargarArchivo(documento.archivo_url, documento.nombre);
   };
 
   const handleFileChange = (event) => {
@@ -926,7 +907,7 @@ const renderPlazoPaso = (paso) => {
                                             <Tooltip title="Descargar">
                                               <IconButton
                                                 size="small"
-                                                onClick={(e) => handleDirectDownload(e, docPaso.documento_detalle.archivo_url)}
+                                                onClick={(e) => handleDirectDownload(e, docPaso.documento_detalle)}
                                                 sx={{ mr: 0.5 }}
                                               >
                                                 <DownloadIcon fontSize="small" />
@@ -1354,7 +1335,7 @@ const renderPlazoPaso = (paso) => {
                           <Tooltip title="Descargar">
                             <IconButton
                               size="small"
-                              onClick={(e) => handleDirectDownload(e, doc.archivo_url)}
+                              onClick={(e) => handleDirectDownload(e, doc)}
                               sx={{ mr: 0.5 }}
                             >
                               <DownloadIcon fontSize="small" />
@@ -39,10 +39,35 @@ const AlertasPlazos = () => {
   useEffect(() => {
     obtenerAlertas();
     
-    // Programar actualización cada 30 minutos
-    const intervalId = setInterval(obtenerAlertas, 30 * 60 * 1000);
+    // Actualización cada 30 minutos mientras no haya stream en tiempo real (el
+    // backend solo lo ofrece servido por ASGI)
+    let intervalId = null;
+    const consultarPeriodicamente = () => {
+      if (!intervalId) intervalId = setInterval(obtenerAlertas, 30 * 60 * 1000);
+    };
+    const dejarDeConsultar = () => {
+      clearInterval(intervalId);
+      intervalId = null;
+    };
+    consultarPeriodicamente();
     
-    return () => clearInterval(intervalId);
+    // Recibir los cambios en tiempo real si el backend lo permite
+    const isSuperAdmin = user && user.roles && user.roles.includes('SUPERADMIN');
+    const cerrar = trabajosService.suscribirAlertasPlazos(isSuperAdmin, {
+      onAlerta: (alerta) => setAlertas((actuales) => [
+        alerta,
+        ...actuales.filter((a) => a.paso_id !== alerta.paso_id)
+      ]),
+      onBaja: ({ paso_id }) => setAlertas((actuales) => actuales.filter((a) => a.paso_id !== paso_id)),
+      onReinicio: obtenerAlertas,
+      onConectado: dejarDeConsultar,
+      onDesconectado: consultarPeriodicamente,
+    });
+    
+    return () => {
+      cerrar();
+      dejarDeConsultar();
+    };
   }, [user]); // Añadir user como dependencia para recargar si cambia el usuario
 
   const handleClick = (event) => {